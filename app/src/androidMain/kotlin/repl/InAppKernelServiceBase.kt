@@ -36,10 +36,12 @@ open class InAppKernelServiceBase : Service() {
         get() = "$field $index"
     protected open val replModule = "repl.kernel"
     protected open val replPrepareFunction = "prepare_kernel"
+    protected open val replPrewarmFunction = "prewarm_kernel"
     protected open val replFunction = "start_kernel"
     protected open val replInterruptFunction = "interrupt_kernel"
     protected open val usingMultiProcess = true
     private var isRunning = false
+    private var isPrepared = false
 
     override fun onBind(intent: Intent?): IBinder? {
         return null
@@ -65,12 +67,16 @@ open class InAppKernelServiceBase : Service() {
         val workdir = intent.getStringExtra("workdir")
         val filename = intent.getStringExtra("filename")
         val signum = intent.getLongExtra("signum", -1L)
+        val prewarm = intent.getBooleanExtra("prewarm", false)
+        val cooperative = intent.getBooleanExtra("cooperative", false)
 
         if (!isRunning && workdir != null && filename != null) {
-            try {
-                repl.callAttr(replPrepareFunction)
-            } catch (e: Exception) {
-                Log.e(tag, e.toString())
+            if (!isPrepared) {
+                try {
+                    repl.callAttr(replPrepareFunction, index)
+                } catch (e: Exception) {
+                    Log.e(tag, e.toString())
+                }
             }
             object : Thread() {
                 override fun run() {
@@ -78,7 +84,8 @@ open class InAppKernelServiceBase : Service() {
                         repl.callAttr(
                             replFunction,
                             workdir,
-                            filename
+                            filename,
+                            cooperative
                         )
                         Log.i(tag, "$processName exited normally")
                     } catch (e: Exception) {
@@ -107,13 +114,19 @@ open class InAppKernelServiceBase : Service() {
                         Log.i(tag, "Interrupt to $processName exited normally")
                     } catch (e: Exception) {
                         Log.e(tag, "Interrupt to $processName exited abnormally", e)
-                    } finally {
-                        stopSelf()
                     }
                 }
             }.start()
 
             Log.i(tag, "$serviceName Interrupted")
+        } else if (!isRunning && prewarm && !isPrepared) {
+            try {
+                repl.callAttr(replPrewarmFunction, index)
+                isPrepared = true
+                Log.i(tag, "$serviceName pre-warmed")
+            } catch (e: Exception) {
+                Log.e(tag, e.toString())
+            }
         } else {
             Log.i(tag, "$serviceName Already Running")
         }
@@ -140,6 +153,7 @@ open class InAppKernelServiceBase : Service() {
         Log.i(tag, "$serviceName Destroyed")
         stopForeground(STOP_FOREGROUND_DETACH)
         isRunning = false
+        isPrepared = false
         if (usingMultiProcess) {
             exitProcess(0)
         }
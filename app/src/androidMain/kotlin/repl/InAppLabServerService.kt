@@ -56,6 +56,16 @@ open class InAppLabServerService : Service() {
         val port = intent.getLongExtra("port", 55555L)
         val password = intent.getStringExtra("password")
         val manager = intent.getStringExtra("manager")
+        val kernelPoolSize = intent.getLongExtra("kernel_pool_size", 0L)
+        val cullIdleTimeout = intent.getDoubleExtra("cull_idle_timeout", 0.0)
+        val cullRssBudget = intent.getLongExtra("cull_rss_budget", 0L)
+        val cullSnapshot = intent.getBooleanExtra("cull_snapshot", false)
+        val transport = intent.getStringExtra("transport") ?: "tcp"
+        val coalesceWindow = intent.getDoubleExtra("coalesce_window", 0.05)
+        val cellOutputLimit = intent.getLongExtra("cell_output_limit", 0L)
+        val notebookJournal = intent.getBooleanExtra("notebook_journal", true)
+        val websocketCompression = intent.getBooleanExtra("websocket_compression", true)
+        val batchWindow = intent.getDoubleExtra("batch_window", 0.0)
 
         object : Thread() {
             override fun run() {
@@ -66,7 +76,17 @@ open class InAppLabServerService : Service() {
                         ip,
                         port,
                         password,
-                        manager
+                        manager,
+                        kernelPoolSize,
+                        cullIdleTimeout,
+                        cullRssBudget,
+                        cullSnapshot,
+                        transport,
+                        coalesceWindow,
+                        cellOutputLimit,
+                        notebookJournal,
+                        websocketCompression,
+                        batchWindow
                     )
                     Log.i(tag, "$processName exited normally")
                 } catch (e: Exception) {
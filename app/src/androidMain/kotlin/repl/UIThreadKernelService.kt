@@ -8,6 +8,7 @@ import kotlin.system.exitProcess
 class UIThreadKernelService: InAppKernelServiceBase() {
     override val index = NOTIFICATION_ID_PREFIX + MAX_WORKERS + 1
     override val usingMultiProcess = false
+    override val replFunction = "start_ui_thread_kernel"
 
     override fun onDestroy() {
         super.onDestroy()
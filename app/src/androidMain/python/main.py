@@ -1,3 +1,5 @@
+import threading
+
 from pythonx.compose.runtime import Composable, remember_saveable
 from pythonx.compose.runtime import DefaultCoroutineScope, MainCoroutineScope
 from pythonx.compose.material3 import Icon, DefaultIcons, Text, TextField
@@ -9,12 +11,11 @@ from android.content import Intent
 from android.net import Uri
 from pythonx.compose.ui.platform import LocalContext
 
-import time
-from model.config import ChatHistory
-from repl import REPLConfig, send_server_launch_intent, kernel
+from model.config import ChatHistory, extractive_summary
+from repl import REPLConfig, send_server_launch_intent
 
 
-config = REPLConfig(manager_class=kernel.UIThreadKernelManager)
+config = REPLConfig(manager_class="repl.kernel.UIThreadKernelManager")
 
 
 
@@ -54,8 +55,10 @@ class App(Composable):
 
             def runner():
                 send_server_launch_intent(context, config)
-                time.sleep(1)
-                context.startActivity(browser_intent)
+                if config.wait_until_ready(timeout=60):
+                    context.startActivity(browser_intent)
+                else:
+                    status.setValue(status.getValue() + "  Jupyter Lab did not start in time")
 
             cls.scope.launch(runner)
 
@@ -104,19 +107,35 @@ class App(Composable):
 
 def init_llama3():
     def runner():
-        global llama3, token_streamer
+        global llama3
         print_state("Getting started...")
         from model import llama3 as _llama3
-        token_streamer = _llama3.token_streamer
-        llama3 = _llama3.chat
+        from model.manager import LoadCancelled
+        try:
+            session = _llama3.load(
+                progress=lambda phase, fraction: print_state(f"{phase} {fraction:.0%}"), cancel=load_cancel
+            )
+        except LoadCancelled:
+            print_state("Llama3 loading cancelled")
+            return
+        finally:
+            load_cancel.clear()
+        llama3 = _llama3.submit_chat
+        if session.restore(chat_history):
+            print_state(f"Conversation restored ({len(chat_history)} messages)")
         print_state("Llama3 initialized")
 
     App.scope.launch(runner)
 
 
-llama3 = lambda chat_history, user_prompt, *args: []
-token_streamer = lambda tokens, *args: []
-chat_history = ChatHistory()
+def cancel_llama3():
+    load_cancel.set()
+
+
+load_cancel = threading.Event()
+llama3 = None  # Queues a chat turn on the inference scheduler, once initialized
+inference = None  # Handle of the last turn
+chat_history = ChatHistory(summarizer=extractive_summary)
 
 
 def change_prompt(prompt: str):
@@ -131,23 +150,46 @@ def print_messages(text: str):
     App.messages.setValue(App.messages.getValue() + text)
 
 
+def stream_messages():
+    """ Printer that appends streamed text to the messages at most once per frame, instead of once per token """
+    from model.streaming import TextStreamSink
+    return TextStreamSink(App.messages.getValue, App.messages.setValue)
+
+
 def run_llama3(printer: callable = lambda x: print(x, end="", flush=True)):
+    global inference
     _user_prompt = App.user_prompt.getValue()
 
     if llama3 is None:
         print_state("Llama3 not initialized!!")
     else:
+        from model.scheduler import QueueFull
+        try:
+            handle = inference = llama3(chat_history, _user_prompt, block=False)
+        except QueueFull:
+            print_state("Busy, try again later")
+            return
         print_state("Inference...")
 
         def runner():
-            for chunk in token_streamer(*llama3(chat_history, _user_prompt)):
-                printer(chunk)
+            try:
+                for chunk in handle:  # Generated on the scheduler thread, one turn at a time
+                    printer(chunk)
+            except Exception as e:
+                print_state(f"Inference failed: {e}")
             printer("\n")
-            print_state("Done!")
+            if hasattr(printer, "close"):  # A sink that batches the chunks
+                printer.close()
+            print_state("Done!" if handle.state == "done" else "Stopped")
 
         App.scope.launch(runner)
 
 
+def stop_llama3():
+    if inference is not None:
+        inference.cancel()
+
+
 @Composable
 def LlamaView():
     Text(f"Current User Prompt:  {App.user_prompt.getValue()}")
@@ -161,11 +203,23 @@ def LlamaView():
         }
     )
     Button(
-        onclick=lambda: run_llama3(printer=print_messages),
+        onclick=cancel_llama3,
+        content=lambda: {
+            Text("Cancel Loading", color=0xFFFFFFFF)
+        }
+    )
+    Button(
+        onclick=lambda: run_llama3(printer=stream_messages()),
         content=lambda: {
             Text(f"Send User Prompt", color=0xFFFFFFFF)
         }
     )
+    Button(
+        onclick=stop_llama3,
+        content=lambda: {
+            Text(f"Stop", color=0xFFFFFFFF)
+        }
+    )
     Button(
         onclick=lambda: {
             change_prompt("오늘 날씨는 어때요?")
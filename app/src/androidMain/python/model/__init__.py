@@ -6,8 +6,9 @@ llama_cpp_lib_path = os.path.join(assets_path, "requirements", "llama_cpp", "lib
 
 
 import numpy  # Or any requirement other than llama_cpp
-numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libllama.so"))
-numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libggml.so"))
-numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libllava.so"))
+if hasattr(numpy.__loader__, "finder"):  # Chaquopy's importer; elsewhere llama_cpp loads its libraries itself
+    numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libllama.so"))
+    numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libggml.so"))
+    numpy.__loader__.finder.extract_if_changed(os.path.join("llama_cpp", "lib", "libllava.so"))
 
-ctypes.CDLL(os.path.join(llama_cpp_lib_path, "libggml.so"))
+    ctypes.CDLL(os.path.join(llama_cpp_lib_path, "libggml.so"))
@@ -1,28 +1,198 @@
-from typing import Iterable
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, List
+
+
+def estimate_tokens(text: str) -> int:
+    """ Token count estimate without a tokenizer, on the safe side for Latin and Hangul text """
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def extractive_summary(summary: str, evicted: List[Dict[str, str]], max_chars: int = 600) -> str:
+    """ Rolling summary of evicted turns: the first sentence of every evicted user message, newest kept """
+    points = [summary] if summary else []
+    for message in evicted:
+        if message['role'] == "user":
+            points.append(message['content'].strip().split("\n")[0].split(". ")[0][:120])
+    text = " / ".join(point for point in points if point)
+    return text[-max_chars:]
 
 
 class ChatHistory(list):
-    """ Chat history class """
+    """ Chat history class
+    Token counts are computed once per message, when it is appended (or after the list is changed in bulk). With a
+    token budget, create_prompt only includes the newest messages that fit, after the pinned system prompt and a
+    rolling summary of the evicted turns.
+    """
+
+    def __init__(
+            self,
+            messages: Iterable[Dict[str, str]] = (),
+            budget: int = 0,
+            token_counter: Callable[[str], int] | None = None,
+            summarizer: Callable[[str, List[Dict[str, str]]], str] | None = None,
+            message_overhead: int = 5,
+            low_water: float = 0.75
+    ):
+        """
+        :param budget: Tokens of a prompt at most, 0 for no limit
+        :param token_counter: Tokens of a text, estimate_tokens by default
+        :param summarizer: Folds evicted messages into the summary, (summary, evicted) -> summary; None to drop them
+        :param message_overhead: Tokens of the chat template around every message
+        :param low_water: Share of the budget the window shrinks to when it slides, so that the following turns keep
+            the same prompt prefix (and its KV cache) until the budget is reached again
+        """
+        super().__init__(messages)
+        self.budget = budget
+        self._token_counter = token_counter
+        self.summarizer = summarizer
+        self.message_overhead = message_overhead
+        self.low_water = low_water
+        self._reset()
+        self._sync()
+
+    def _reset(self):
+        self._counts: List[int] | None = None  # Tokens per message, recounted after bulk list changes
+        self._start = 0  # First message of the window
+        self._window_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+
+    @property
+    def token_counter(self) -> Callable[[str], int]:
+        return self._token_counter or estimate_tokens
+
+    @token_counter.setter
+    def token_counter(self, token_counter: Callable[[str], int] | None):
+        self._token_counter = token_counter
+        self._counts = None  # Recounted, the window and the summary are kept
+        self._summary_tokens = self._count(self._summary_message()[0]) if self.summary else 0
+
+    def _count(self, message: Dict[str, str]) -> int:
+        return self.token_counter(message['content']) + self.message_overhead
+
+    def _sync(self):
+        if self._counts is None:
+            self._counts = [self._count(message) for message in self]
+            self._start = min(self._start, len(self))
+            self._window_tokens = sum(self._counts[self._start:])
+
+    def _push(self, message: Dict[str, str]):
+        super().append(message)
+        if self._counts is not None:
+            count = self._count(message)
+            self._counts.append(count)
+            self._window_tokens += count
 
     def append(self, role: str | Iterable[str], content: str | Iterable[str]):
         if isinstance(content, str):
             if isinstance(role, str):
-                super().append({'role': role, 'content': content})
+                self._push({'role': role, 'content': content})
             else:
                 raise ValueError("Role must be a string when content is a string")
         else:
             if isinstance(role, str):
                 role = [role for _ in content]
             for r, c in zip(role, content):
-                super().append({'role': r, 'content': c})
+                self._push({'role': r, 'content': c})
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._reset()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._reset()
+
+    def __iadd__(self, other):
+        result = super().__iadd__(other)
+        self._reset()
+        return result
+
+    def extend(self, messages):
+        super().extend(messages)
+        self._reset()
+
+    def insert(self, index, message):
+        super().insert(index, message)
+        self._reset()
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        self._reset()
+        return message
+
+    def remove(self, message):
+        super().remove(message)
+        self._reset()
+
+    def clear(self):
+        super().clear()
+        self._reset()
+
+    def restore(self, messages: Iterable[Dict[str, str]], start: int = 0, summary: str = ""):
+        """ Replace the messages with a saved conversation, and the window and the summary with the saved ones
+        :param start: First message of the window when the conversation was saved
+        """
+        super().clear()
+        super().extend(messages)
+        self._counts = None
+        self._start = start
+        self.summary = summary
+        self._summary_tokens = self._count(self._summary_message()[0]) if summary else 0
+        self._sync()
+
+    @property
+    def start(self) -> int:
+        """ First message of the window """
+        self._sync()
+        return self._start
+
+    @property
+    def window(self) -> List[Dict[str, str]]:
+        """ Messages the next prompt includes """
+        self._sync()
+        return self[self._start:]
+
+    def _slide(self, available: int):
+        """ Move the window start forward until the summary and the window fit, the window to the low water mark
+        :param available: Tokens of the prompt left for the summary and the window
+        """
+        if self.summarizer is not None:  # Reserved before sliding, the summary grows by what the window drops
+            summary_budget = max(min(self.budget // 4, available), 0)
+        else:
+            summary_budget = self._summary_tokens
+        target = int((available - summary_budget) * self.low_water)
+        start, tokens = self._start, self._window_tokens
+        while start < len(self) and (tokens > target or self[start]['role'] != "user"):
+            tokens -= self._counts[start]  # Drops whole turns, the window starts with a user message
+            start += 1
+        if self.summarizer is not None and start > self._start:
+            self.summary = self.summarizer(self.summary, self[self._start:start])
+        limit = min(summary_budget, available - tokens)
+        while self.summary and self._count(self._summary_message()[0]) > limit:
+            self.summary = self.summary[len(self.summary) // 4 + 1:]  # Oldest first
+        self._summary_tokens = self._count(self._summary_message()[0]) if self.summary else 0
+        self._start, self._window_tokens = start, tokens
+
+    def _summary_message(self) -> List[Dict[str, str]]:
+        return [{'role': "system", 'content': f"Summary of the earlier conversation: {self.summary}"}] \
+            if self.summary else []
 
     def create_prompt(self, system_prompt: str, user_prompt: str = ""):
+        self._sync()
+        if self.budget:
+            fixed = self.token_counter(system_prompt) + self.token_counter(user_prompt) + 2 * self.message_overhead
+            if fixed + self._summary_tokens + self._window_tokens > self.budget:
+                self._slide(self.budget - fixed)
+
         return [
             {
                 'role': "system",
                 'content': system_prompt
             },
-            *self,
+            *self._summary_message(),
+            *self[self._start:],
             {
                 'role': "user",
                 'content': user_prompt
@@ -1,17 +1,16 @@
-from typing import Iterator
+from __future__ import annotations
 
-from llama_cpp import Llama, CreateChatCompletionStreamResponse
-from .config import ChatHistory
+from typing import Any, Callable, Iterator
+import threading
 
-# Set model id
-model_id = "lmstudio-community/Meta-Llama-3.1-8B-Instruct-GGUF"
+from llama_cpp import CreateChatCompletionStreamResponse
+from .config import ChatHistory
+from .manager import ModelManager, DEFAULT_MODEL
+from .session import ChatSession
+from .scheduler import InferenceScheduler, InferenceHandle, CancelToken, PRIORITY_INTERACTIVE
 
-# Load model
-model = Llama.from_pretrained(
-    repo_id=model_id,
-    filename="*Q4_K_M.gguf",  # 4bit quantized model
-    verbose=False
-)
+# Set model name, resolved from the registry of the model manager
+model_name = DEFAULT_MODEL
 
 # Prompt setting
 system_prompt = "" \
@@ -20,23 +19,42 @@ system_prompt = "" \
     + "Please answer in Korean language."
 print("INFO: Use default system prompt -", system_prompt)
 
+# Keeps the evaluated conversation in the KV cache across turns and restarts, created once the model is loaded
+session: ChatSession | None = None
+
+
+def load(
+        progress: Callable[[str, float], Any] | None = None, cancel: threading.Event | None = None
+) -> ChatSession:
+    """ Load the model in the shared model manager, if it is not yet, and return the chat session on it """
+    global session
+    model = ModelManager.shared().load(model_name, progress=progress, cancel=cancel)
+    if session is None or session.model is not model:
+        session = ChatSession(model, system_prompt)
+    return session
+
+
+# Runs the generations one at a time on the loaded model, for the UI and the kernels alike
+scheduler = InferenceScheduler(lambda cancel: load(cancel=cancel))
+
 
 def chat(
         chat_history: ChatHistory, user_prompt: str, temperature=0.5, print_prompt=True
 ) -> tuple[
     Iterator[CreateChatCompletionStreamResponse], bool
 ]:
-    """ Chatting interface """
-    prompt = chat_history.create_prompt(system_prompt, user_prompt)
-    chat_history.append("user", user_prompt)
+    """ Chatting interface, the turn is queued on the scheduler like any other and cancelled when its stream is closed
+    Only the tokens that are not in the KV cache of the session yet are evaluated.
+    """
+    handle = submit_chat(chat_history, user_prompt, temperature=temperature, print_prompt=print_prompt, chunks=True)
+    return _stream(handle), print_prompt
 
-    if print_prompt:
-        print("PROMPT:")
-        for line in prompt:
-            print(line)
-        print()
 
-    return model.create_chat_completion(prompt, temperature=temperature, stream=True), print_prompt
+def _stream(handle: InferenceHandle) -> Iterator[CreateChatCompletionStreamResponse]:
+    try:
+        yield from handle
+    finally:
+        handle.cancel()
 
 
 def token_streamer(tokens: Iterator[CreateChatCompletionStreamResponse], print_prompt: bool = True) -> Iterator[str]:
@@ -51,3 +69,18 @@ def token_streamer(tokens: Iterator[CreateChatCompletionStreamResponse], print_p
             print(token_delta, end="")
         yield token_delta if token_delta else ""
     print()
+
+
+def submit_chat(
+        chat_history: ChatHistory, user_prompt: str, temperature=0.5, priority=PRIORITY_INTERACTIVE,
+        block: bool = True, timeout: float | None = None, print_prompt: bool = False, chunks: bool = False
+) -> InferenceHandle:
+    """ Queue a chat turn on the scheduler, the handle streams the text of the reply and cancels it
+    :param chunks: Stream the completion chunks instead of the text
+    :raises QueueFull: If too many turns are waiting already
+    """
+    def job(session: ChatSession, token: CancelToken) -> Iterator[Any]:
+        stream, _ = session.chat(chat_history, user_prompt, temperature=temperature, print_prompt=print_prompt)
+        return stream if chunks else token_streamer(stream, print_prompt)
+
+    return scheduler.submit(job, priority=priority, block=block, timeout=timeout)
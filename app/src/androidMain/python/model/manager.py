@@ -0,0 +1,228 @@
+""" Shared, lazily loaded language models
+
+Models are resolved by name from a local registry (built-in entries, overridden by registry.json in the model
+directory): a file on the device, a file in the Hugging Face cache left by an earlier Llama.from_pretrained, or a
+download from the Hub, resumed where it stopped. Loading memory-maps the model file and pages it in first, so the
+load can report progress and be cancelled; the pages are locked in RAM when the memlock limit allows it.
+One model is loaded at a time and shared by every caller.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List
+import urllib.request
+import urllib.error
+import threading
+import fnmatch
+import glob
+import json
+import os
+
+from llama_cpp import Llama
+import llama_cpp
+
+
+__all__ = ["LoadCancelled", "ModelManager", "DEFAULT_MODEL"]
+
+MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyrepl", "models")
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co")
+CHUNK_SIZE = 4 * 1024 * 1024
+
+DEFAULT_MODEL = "llama3.1-8b-instruct-q4"
+REGISTRY = {
+    DEFAULT_MODEL: {
+        "repo_id": "lmstudio-community/Meta-Llama-3.1-8B-Instruct-GGUF",
+        "filename": "*Q4_K_M.gguf",  # 4bit quantized model
+        "n_ctx": 2048
+    }
+}
+
+
+class LoadCancelled(Exception):
+    """ The load was cancelled by its caller """
+
+
+class _Progress:
+    """ Reports the phases of a load, and their fraction done in steps """
+
+    def __init__(self, callback: Callable[[str, float], Any] | None, cancel: threading.Event | None, step: float):
+        self.callback = callback
+        self.cancel = cancel
+        self.step = step
+        self.phase = None
+        self.reported = 0.0
+
+    def __call__(self, phase: str, fraction: float = 0.0):
+        if self.cancel is not None and self.cancel.is_set():
+            raise LoadCancelled(f"Cancelled while {phase.lower()}")
+        if self.callback is None:
+            return
+        if phase != self.phase or fraction - self.reported >= self.step or fraction >= 1.0 > self.reported:
+            self.phase, self.reported = phase, fraction
+            self.callback(phase, fraction)
+
+
+class ModelManager:
+    """ Resolves models from the registry and keeps the loaded one """
+    _shared: ModelManager | None = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model_dir: str = MODEL_DIR, registry: Dict[str, Dict[str, Any]] | None = None):
+        self.model_dir = model_dir
+        self.registry = dict(REGISTRY if registry is None else registry)
+        try:
+            with open(os.path.join(model_dir, "registry.json"), encoding="utf-8") as f:
+                self.registry.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        self._lock = threading.Lock()
+        self.name: str | None = None
+        self.model: Llama | None = None
+
+    @classmethod
+    def shared(cls) -> ModelManager:
+        """ The manager of the app, shared by the UI and the kernels """
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def entry(self, name: str) -> Dict[str, Any]:
+        try:
+            return self.registry[name]
+        except KeyError:
+            raise KeyError(f"No model {name} in the registry, known models: {', '.join(self.registry)}") from None
+
+    def _local_file(self, name: str, entry: Dict[str, Any]) -> str | None:
+        """ The model file if it is on the device already """
+        if entry.get("path"):
+            return entry["path"] if os.path.exists(entry["path"]) else None
+        matches = glob.glob(os.path.join(self.model_dir, name, entry["filename"]))
+        if matches:
+            return sorted(matches)[0]
+        repo_cache = "models--" + entry["repo_id"].replace("/", "--")
+        hub_cache = os.environ.get("HF_HUB_CACHE") or os.path.join(
+            os.environ.get("HF_HOME") or os.path.join(os.path.expanduser("~"), ".cache", "huggingface"), "hub"
+        )
+        matches = glob.glob(os.path.join(hub_cache, repo_cache, "snapshots", "*", entry["filename"]))
+        return sorted(matches)[0] if matches else None
+
+    def _download(self, name: str, entry: Dict[str, Any], progress: _Progress) -> str:
+        progress("Resolving")
+        with urllib.request.urlopen(f"{HF_ENDPOINT}/api/models/{entry['repo_id']}", timeout=30) as response:
+            files = [sibling["rfilename"] for sibling in json.load(response).get("siblings", [])]
+        matches = sorted(file for file in files if fnmatch.fnmatch(file, entry["filename"]))
+        if not matches:
+            raise FileNotFoundError(f"No file matching {entry['filename']} in {entry['repo_id']}")
+
+        path = os.path.join(self.model_dir, name, os.path.basename(matches[0]))
+        part_path = path + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(f"{HF_ENDPOINT}/{entry['repo_id']}/resolve/main/{matches[0]}")
+        if done:
+            request.add_header("Range", f"bytes={done}-")  # Resume the download of an earlier run
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not done:
+                raise
+            size = e.headers.get("Content-Range", "").rpartition("/")[2]  # bytes */<size>
+            e.close()
+            if size.isdigit() and int(size) != done:  # Not a part of this file
+                os.remove(part_path)
+                return self._download(name, entry, progress)
+            os.replace(part_path, path)  # Downloaded to the end by an earlier run, which stopped before the rename
+            return path
+        with response:
+            if response.status != 206:
+                done = 0
+            total = done + int(response.headers.get("Content-Length", 0))
+            with open(part_path, "ab" if done else "wb") as f:
+                while chunk := response.read(CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    progress("Downloading", done / total if total else 0.0)
+        os.replace(part_path, path)
+        return path
+
+    @staticmethod
+    def _can_mlock(size: int) -> bool:
+        """ Whether the whole model can be locked in RAM """
+        if not llama_cpp.llama_supports_mlock():
+            return False
+        try:
+            import resource
+            limit = resource.getrlimit(resource.RLIMIT_MEMLOCK)[0]
+        except (ImportError, ValueError, OSError):
+            return False
+        return limit == resource.RLIM_INFINITY or limit >= size
+
+    @staticmethod
+    def _page_in(path: str, progress: _Progress):
+        """ Read the model file through the page cache, so that its mmap is backed before llama.cpp touches it """
+        size = os.path.getsize(path)
+        done = 0
+        with open(path, "rb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            buffer = bytearray(CHUNK_SIZE)
+            while read := f.readinto(buffer):
+                done += read
+                progress("Loading", 0.9 * done / size)  # The rest is llama.cpp setting up the model
+
+    def load(
+            self,
+            name: str = DEFAULT_MODEL,
+            progress: Callable[[str, float], Any] | None = None,
+            cancel: threading.Event | None = None,
+            progress_step: float = 0.1
+    ) -> Llama:
+        """ The loaded model, loaded first if needed; concurrent callers wait for the same load
+        :param progress: Called with the phase (Resolving, Downloading, Loading, Ready) and its fraction done
+        :param cancel: Set to stop the download or the load, which then raises LoadCancelled
+        :param progress_step: Fraction of a phase between two progress reports
+        """
+        report = _Progress(progress, cancel, progress_step)
+        with self._lock:
+            if self.name == name and self.model is not None:
+                report("Ready", 1.0)
+                return self.model
+            entry = self.entry(name)
+            path = self._local_file(name, entry)
+            if path is None:
+                if "repo_id" not in entry:
+                    raise FileNotFoundError(f"Model file of {name} not found: {entry.get('path')}")
+                path = self._download(name, entry, report)
+            self.unload()  # One model at a time, there is no memory for two
+
+            self._page_in(path, report)
+            use_mlock = self._can_mlock(os.path.getsize(path))
+            model = Llama(
+                model_path=path,
+                n_ctx=entry.get("n_ctx", 2048),
+                use_mmap=True,
+                use_mlock=use_mlock,
+                verbose=False
+            )
+            if cancel is not None and cancel.is_set():
+                model.close()
+                raise LoadCancelled("Cancelled while loading")
+            self.name, self.model = name, model
+            report("Ready", 1.0)
+            print(f"INFO: Loaded {name} from {path} (mmap{', mlock' if use_mlock else ''})")
+            return model
+
+    def unload(self):
+        """ Free the loaded model, callers still holding it must not use it anymore """
+        if self.model is not None:
+            self.model.close()
+            self.name, self.model = None, None
+
+    def models(self) -> List[str]:
+        """ Names of the registered models """
+        return list(self.registry)
@@ -0,0 +1,205 @@
+""" Inference scheduler that serializes the generations on one model
+
+A Llama instance is not safe to use from two threads, and two generations sharing it are slower than the same two
+one after the other. Requests are queued by priority (FIFO within a priority) in a bounded queue and run, one at a
+time, by a single worker thread that owns the model. Callers get a handle to stream the chunks from, synchronously
+(UI coroutines) or asynchronously (kernels), and to cancel the request, which is checked between two chunks.
+A full queue blocks the callers or rejects their requests.
+"""
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Callable, Iterator, List
+import threading
+import asyncio
+import heapq
+import queue
+import time
+
+
+__all__ = [
+    "CancelToken", "InferenceHandle", "InferenceScheduler", "QueueFull", "PRIORITY_INTERACTIVE", "PRIORITY_BACKGROUND"
+]
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_END = object()
+
+
+class QueueFull(Exception):
+    """ The scheduler has no room for another request """
+
+
+class CancelToken(threading.Event):
+    """ Set to cancel a request; also accepted where a threading.Event is, as by ModelManager.load """
+    cancel = threading.Event.set
+
+    @property
+    def cancelled(self) -> bool:
+        return self.is_set()
+
+
+class InferenceHandle:
+    """ A request to the scheduler, and the chunks it generates """
+
+    def __init__(self, job: Callable[[Any, CancelToken], Iterator[str]], priority: int, sequence: int):
+        self.job = job
+        self.priority = priority
+        self.sequence = sequence
+        self.token = CancelToken()
+        self.state = "pending"  # running, done, cancelled or failed
+        self.error: BaseException | None = None
+        self.submitted = time.monotonic()
+        self.started: float | None = None
+        self.finished = threading.Event()
+        self._chunks: queue.Queue = queue.Queue()
+        self._scheduler: InferenceScheduler | None = None
+
+    def __lt__(self, other: InferenceHandle) -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def cancel(self):
+        """ Stop the request, before it starts or between two chunks """
+        self.token.cancel()
+        if self._scheduler is not None:
+            self._scheduler._withdraw(self)
+
+    def _put(self, chunk: Any):
+        self._chunks.put(chunk)
+
+    def _finish(self, state: str, error: BaseException | None = None):
+        self.state, self.error = state, error
+        self._chunks.put(_END)
+        self.finished.set()
+
+    def _end(self):
+        self._chunks.put(_END)  # For any other reader
+        if self.error is not None:
+            raise self.error
+
+    def __iter__(self) -> Iterator[str]:
+        """ The chunks as they are generated, blocking; ends early if the request is cancelled """
+        while (chunk := self._chunks.get()) is not _END:
+            yield chunk
+        self._end()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """ The chunks as they are generated, without blocking the event loop """
+        while True:
+            try:
+                chunk = self._chunks.get_nowait()
+            except queue.Empty:
+                chunk = await asyncio.to_thread(self._chunks.get)
+            if chunk is _END:
+                break
+            yield chunk
+        self._end()
+
+    def text(self, timeout: float | None = None) -> str:
+        """ Wait for the request and return everything it generated """
+        if not self.finished.wait(timeout):
+            raise TimeoutError("Inference request is still running")
+        return "".join(self)
+
+    def __repr__(self):
+        return f"<InferenceHandle #{self.sequence} priority={self.priority} {self.state}>"
+
+
+class InferenceScheduler:
+    """ Single worker running the inference requests, highest priority first """
+
+    def __init__(self, load_model: Callable[[CancelToken], Any], max_pending: int = 8):
+        """
+        :param load_model: Called on the worker before every request with its cancel token, returns what the jobs
+            run on (the model)
+        :param max_pending: Requests waiting at most, beyond which submit blocks or raises QueueFull
+        """
+        self.load_model = load_model
+        self.max_pending = max_pending
+        self._pending: List[InferenceHandle] = []
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._thread: threading.Thread | None = None
+        self.current: InferenceHandle | None = None
+        self.completed = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(
+            self,
+            job: Callable[[Any, CancelToken], Iterator[str]],
+            priority: int = PRIORITY_INTERACTIVE,
+            block: bool = True,
+            timeout: float | None = None
+    ) -> InferenceHandle:
+        """ Queue a request
+        :param job: Run on the worker with the model and the cancel token, yields the generated chunks
+        :param priority: Lower runs first
+        :param block: Wait for room in the queue, instead of raising QueueFull at once
+        :raises QueueFull: If there is no room after the timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._pending) < self.max_pending, timeout if block else 0):
+                raise QueueFull(f"{len(self._pending)} inference requests are waiting already")
+            self._sequence += 1
+            handle = InferenceHandle(job, priority, self._sequence)
+            handle._scheduler = self
+            heapq.heappush(self._pending, handle)
+            self._condition.notify_all()
+            self._start()
+        return handle
+
+    def _withdraw(self, handle: InferenceHandle):
+        with self._condition:
+            if handle in self._pending:
+                self._pending.remove(handle)
+                heapq.heapify(self._pending)
+                handle._finish("cancelled")
+                self._condition.notify_all()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._work, name="InferenceScheduler", daemon=True)
+            self._thread.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                handle = self.current = heapq.heappop(self._pending)
+                self._condition.notify_all()  # Room for a blocked caller
+            self._run(handle)
+            self.current = None
+
+    def _run(self, handle: InferenceHandle):
+        handle.state, handle.started = "running", time.monotonic()
+        chunks = None
+        try:
+            chunks = handle.job(self.load_model(handle.token), handle.token)
+            for chunk in chunks:
+                if handle.token.cancelled:
+                    break
+                handle._put(chunk)
+        except Exception as e:
+            if handle.token.cancelled:  # As the load of the model raises when it is cancelled
+                handle._finish("cancelled")
+            else:
+                handle._finish("failed", e)
+            return
+        finally:
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()  # Stops a cancelled generation where it is
+            self.completed += 1
+        handle._finish("cancelled" if handle.token.cancelled else "done")
+
+    def cancel_all(self):
+        """ Cancel the running request and every pending one """
+        with self._condition:
+            pending = list(self._pending)
+        for handle in pending:
+            handle.cancel()
+        if self.current is not None:
+            self.current.cancel()
+
@@ -0,0 +1,313 @@
+""" Chat session that keeps the evaluated prompt prefix of a model across turns and restarts
+
+llama.cpp only evaluates the part of a prompt that differs from the tokens already in its KV cache, so a turn costs
+the new user message instead of the whole conversation, as long as the prompt of the next turn starts with the
+tokens of the previous one. The session keeps it that way: the reply of every turn goes into the chat history, so
+the next prompt repeats what the model has just generated, and the KV cache is snapshotted with the history after each
+turn, so a conversation resumes after an app restart without evaluating it again. The snapshot is copied out of the
+model when the turn ends and written to disk by a background thread, the next turn does not wait for the disk.
+
+    python session.py MODEL.gguf [--turns N] [--n-ctx N]  # Time to first token per turn, with and without reuse
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List
+import threading
+import ctypes
+import json
+import time
+import os
+
+import llama_cpp
+from llama_cpp import Llama, CreateChatCompletionStreamResponse
+
+try:
+    from .config import ChatHistory
+except ImportError:  # Running as a script, without the Android bridge of the model package
+    from config import ChatHistory
+
+
+__all__ = ["ChatSession"]
+
+SESSION_VERSION = 2
+SESSION_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyrepl", "chat")
+
+
+class ChatSession:
+    """ Turns of a chat on a model, with the KV cache of the conversation kept in the model and on disk """
+
+    def __init__(
+            self,
+            model: Llama,
+            system_prompt: str,
+            state_dir: str | None = SESSION_DIR,
+            autosave: bool = True,
+            reply_tokens: int = 512
+    ):
+        """
+        :param state_dir: Directory of the snapshot, None to keep the session in memory only
+        :param autosave: Snapshot after every turn
+        :param reply_tokens: Tokens of the context window left for a reply, the prompt gets the rest
+        """
+        self.model = model
+        self.system_prompt = system_prompt
+        self.state_dir = state_dir
+        self.autosave = autosave
+        self.reply_tokens = reply_tokens
+        self.turns: List[Dict[str, float]] = []  # Prompt tokens, reused tokens and time to first token per turn
+        self._pending: Dict[str, Any] | None = None  # Snapshot waiting for the writer thread
+        self._writer: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.state_dir, "kv.bin")
+
+    @property
+    def history_path(self) -> str:
+        return os.path.join(self.state_dir, "session.json")
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """ What a snapshot depends on: the model file, the context size and the state format """
+        stat = os.stat(self.model.model_path)
+        return {
+            "model": os.path.abspath(self.model.model_path),
+            "size": stat.st_size,
+            "mtime": int(stat.st_mtime),
+            "n_ctx": self.model.n_ctx(),
+            "llama_cpp": llama_cpp.__version__
+        }
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def chat(
+            self, chat_history: ChatHistory, user_prompt: str, temperature=0.5, print_prompt=True, **kwargs
+    ) -> tuple[
+        Iterator[CreateChatCompletionStreamResponse], bool
+    ]:
+        """ Start a turn; the reply is added to the chat history once it is streamed to the end """
+        if not chat_history.budget:  # Counted with the tokenizer of the model, to fit its context window
+            chat_history.token_counter = self.count_tokens
+            chat_history.budget = self.model.n_ctx() - self.reply_tokens
+        kwargs.setdefault("max_tokens", self.reply_tokens)
+        prompt = chat_history.create_prompt(self.system_prompt, user_prompt)
+        chat_history.append("user", user_prompt)
+
+        if print_prompt:
+            print("PROMPT:")
+            for line in prompt:
+                print(line)
+            print()
+
+        cached = self.model.input_ids[:self.model.n_tokens].tolist()
+        begin = time.perf_counter()
+        stream = self.model.create_chat_completion(prompt, temperature=temperature, stream=True, **kwargs)
+        return self._follow(stream, chat_history, cached, begin), print_prompt
+
+    def _follow(
+            self, stream: Iterator[CreateChatCompletionStreamResponse], chat_history: ChatHistory,
+            cached: List[int], begin: float
+    ) -> Iterator[CreateChatCompletionStreamResponse]:
+        reply = []
+        first = True
+        try:
+            for chunk in stream:
+                if first:  # The prompt is evaluated, nothing is sampled yet
+                    first = False
+                    prompt_tokens = self.model.n_tokens
+                    reused = Llama.longest_token_prefix(cached, self.model.input_ids[:prompt_tokens].tolist())
+                    self.turns.append({
+                        "prompt_tokens": prompt_tokens,
+                        "reused_tokens": reused,
+                        "ttft": time.perf_counter() - begin
+                    })
+                content = chunk['choices'][0]['delta'].get('content')
+                if content:
+                    reply.append(content)
+                yield chunk
+        finally:  # Also when the turn is cancelled, the history has to follow what the KV cache holds
+            stream.close()
+            chat_history.append("assistant", "".join(reply))  # The next prompt starts with what the model generated
+            if self.autosave and self.state_dir is not None:
+                self.save(chat_history, block=False)
+
+    def save(self, chat_history: ChatHistory, block: bool = True):
+        """ Snapshot the KV cache and the chat history it holds
+        Only the copy out of the model runs on the calling thread, the model is free again once it returns.
+        :param block: Wait until the snapshot is on disk, else it is written by a background thread
+        """
+        n_tokens = self.model.n_tokens
+        size = llama_cpp.llama_state_get_size(self.model.ctx)
+        state = (ctypes.c_uint8 * size)()
+        size = llama_cpp.llama_state_get_data(self.model.ctx, state, size)
+        snapshot = {
+            "state": memoryview(state)[:size],
+            "session": {
+                "version": SESSION_VERSION,
+                "fingerprint": self.fingerprint(),
+                "system_prompt": self.system_prompt,
+                "state_size": size,
+                "tokens": self.model.input_ids[:n_tokens].tolist(),
+                "history": list(chat_history),
+                "start": chat_history.start,
+                "summary": chat_history.summary
+            }
+        }
+        with self._writer_lock:
+            self._pending = snapshot  # Replaces an older one that is not written yet
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending, name="chat-session-writer", daemon=True)
+                self._writer.start()
+        if block:
+            self.flush()
+
+    def flush(self):
+        """ Wait until the last snapshot is on disk """
+        writer = self._writer
+        if writer is not None:
+            writer.join()
+
+    def _write_pending(self):
+        while True:
+            with self._writer_lock:
+                snapshot, self._pending = self._pending, None
+                if snapshot is None:
+                    self._writer = None
+                    return
+            try:
+                self._write(snapshot)
+            except OSError as e:
+                print(f"Could not snapshot the chat session to {self.state_dir}: {e}")
+
+    def _write(self, snapshot: Dict[str, Any]):
+        os.makedirs(self.state_dir, exist_ok=True)
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(snapshot["state"])
+        os.replace(temp_path, self.state_path)
+
+        temp_path = f"{self.history_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot["session"], f, ensure_ascii=False)
+        os.replace(temp_path, self.history_path)
+
+    def restore(self, chat_history: ChatHistory) -> bool:
+        """ Load the snapshot into the model and its conversation into the chat history
+        :return: False if there is no snapshot for this model, the chat history is then left as it is
+        """
+        if self.state_dir is None:
+            return False
+        self.flush()
+        try:
+            with open(self.history_path, encoding="utf-8") as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if session.get("version") != SESSION_VERSION or session.get("fingerprint") != self.fingerprint():
+            print("INFO: Chat session snapshot is of another model, dropped")
+            self.clear()
+            return False
+
+        try:
+            with open(self.state_path, "rb") as f:
+                state = f.read()
+        except OSError:
+            state = b""
+        size = len(state)
+        loaded = size == session["state_size"] and len(session["tokens"]) <= self.model.n_ctx()
+        if loaded:  # Else torn between the two files
+            buffer = (ctypes.c_uint8 * size).from_buffer_copy(state)
+            loaded = llama_cpp.llama_state_set_data(self.model.ctx, buffer, size) == size
+        if not loaded:
+            print("INFO: Chat session snapshot is incomplete, dropped")
+            self.model.reset()
+            self.clear()
+            return False
+
+        n_tokens = len(session["tokens"])
+        self.model.n_tokens = n_tokens  # First: input_ids is a view of the first n_tokens in older versions
+        self.model.input_ids[:n_tokens] = session["tokens"]
+        chat_history.restore(session["history"], session["start"], session["summary"])
+        if session["system_prompt"] != self.system_prompt:  # Still valid, reused up to the system prompt only
+            print("INFO: System prompt changed since the chat session was saved")
+        return True
+
+    def clear(self):
+        """ Forget the conversation, in the model and on disk """
+        self.flush()
+        self.model.reset()
+        if self.state_dir is not None:
+            for path in (self.state_path, self.history_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def benchmark(model_path: str, turns: int = 8, n_ctx: int = 4096, max_tokens: int = 48) -> Dict[str, List[float]]:
+    """ Seconds to the first token of every turn of a conversation, evaluating the whole prompt every turn (cold)
+    and reusing the prefix (reused), then of one more turn after a restart, without and with the snapshot (restart)
+    """
+    import tempfile
+
+    questions = [
+        "What is a Python generator?", "How does it differ from a list comprehension?",
+        "Show me a generator that yields Fibonacci numbers.", "How can I take the first ten of them?",
+        "What does the yield from statement do?", "Can generators receive values?",
+        "What is an async generator?", "Summarize what we discussed."
+    ]
+    system_prompt = "You are a concise assistant for Python programmers."
+    results = {"cold": [], "reused": [], "restart": []}
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        model = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False)
+        for mode in ("cold", "reused"):
+            session = ChatSession(model, system_prompt, state_dir, autosave=mode == "reused")
+            session.clear()
+            history = ChatHistory()
+            for index in range(turns):
+                if mode == "cold":
+                    model.reset()
+                stream, _ = session.chat(
+                    history, questions[index % len(questions)], temperature=0.0, print_prompt=False,
+                    max_tokens=max_tokens
+                )
+                for _ in stream:
+                    pass
+                results[mode].append(session.turns[-1]["ttft"])
+            session.flush()
+        model.close()
+
+        for restored in (False, True):  # As after an app restart
+            model = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False)
+            session = ChatSession(model, system_prompt, state_dir, autosave=False)
+            history = ChatHistory()
+            begin = time.perf_counter()
+            if restored:
+                session.restore(history)
+            else:
+                with open(session.history_path, encoding="utf-8") as f:
+                    history[:] = json.load(f)["history"]
+            stream, _ = session.chat(history, "Thanks!", temperature=0.0, print_prompt=False, max_tokens=max_tokens)
+            next(stream)
+            results["restart"].append(time.perf_counter() - begin)
+            for _ in stream:
+                pass
+            model.close()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="GGUF model file")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--n-ctx", type=int, default=4096)
+    args = parser.parse_args()
+
+    results = benchmark(args.model, args.turns, args.n_ctx)
+    print("turn   cold TTFT   reused TTFT")
+    for turn, (cold, reused) in enumerate(zip(results["cold"], results["reused"]), 1):
+        print(f"{turn:>4}  {cold * 1000:>8.0f} ms  {reused * 1000:>9.0f} ms")
+    print(f"After a restart: {results['restart'][0] * 1000:.0f} ms evaluating the conversation, "
+          f"{results['restart'][1] * 1000:.0f} ms restoring the snapshot, to the first token of the next turn")
@@ -0,0 +1,152 @@
+""" Batched streaming of generated text into UI state
+
+Appending every token to a Compose state copies the whole transcript (getValue() + text) and recomposes it once per
+token, O(n²) in the length of the answer. A TextStreamSink keeps the text as a list of chunks, joined only when it is
+published: at most once per flush interval, or every max_chunks chunks, and once more when the stream is closed. The
+interval is longer than the time between two tokens of a model on a phone (about 10 tokens/s), so that every
+publication carries a few of them. A flush timer publishes what a stream leaves pending when it slows down.
+
+    python streaming.py [--tokens N] [--token-interval SECONDS]  # Copies and updates of per-token vs batched publishing
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List
+import threading
+import time
+
+
+__all__ = ["TextStreamSink"]
+
+MIN_FLUSH_INTERVAL = 0.2
+
+
+class TextStreamSink:
+    """ Buffers streamed text and publishes it to a state at a bounded rate """
+
+    def __init__(
+            self,
+            get: Callable[[], str],
+            publish: Callable[[str], Any],
+            interval: float = MIN_FLUSH_INTERVAL,
+            max_chunks: int = 64,
+            timer: bool = True,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        :param get: Reads the text of the state, when a stream starts
+        :param publish: Sets the text of the state
+        :param interval: Seconds between two publications at least, longer than the time between two tokens of a
+            slow model so that its chunks are batched too
+        :param max_chunks: Chunks after which the text is published anyway
+        :param timer: Publish what is pending once the interval is over, without waiting for the next chunk
+        """
+        self.get = get
+        self.publish = publish
+        self.interval = interval
+        self.max_chunks = max_chunks
+        self.timer = timer
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._chunks: List[str] | None = None  # The text published last, then the chunks pending
+        self._last = 0.0
+        self._timer: threading.Timer | None = None
+        self.updates = 0
+        self.copied_chars = 0  # Characters of the texts published, each of which is a full copy
+
+    @property
+    def text(self) -> str:
+        """ The text with what is still pending """
+        with self._lock:
+            return "".join(self._chunks or ())
+
+    def write(self, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self._chunks is None:  # Start of a stream, the state may have been changed meanwhile
+                self._chunks = [self.get()]
+            self._chunks.append(text)
+            wait = self.interval - (self._clock() - self._last)
+            if len(self._chunks) > self.max_chunks or wait <= 0:
+                self._flush()
+            elif self.timer and self._timer is None:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    __call__ = write
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._chunks is None or len(self._chunks) == 1:
+            return
+        text = "".join(self._chunks)
+        self._chunks = [text]
+        self._last = self._clock()
+        self.updates += 1
+        self.copied_chars += len(text)
+        self.publish(text)
+
+    def flush(self):
+        """ Publish what is pending """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """ Publish the rest of the stream; the next write starts a new one """
+        with self._lock:
+            self._flush()
+            self._chunks = None
+
+
+def benchmark(tokens: int = 2000, token_interval: float = 0.1, transcript: int = 4000) -> Dict[str, Dict[str, float]]:
+    """ Updates, copied characters and seconds of publishing a stream of tokens per token and through a sink
+    :param token_interval: Seconds between two tokens, on a simulated clock
+    :param transcript: Characters of the transcript before the stream
+    """
+    chunks = [f"tok{index % 10} " for index in range(tokens)]
+    results = {}
+
+    state = {"value": "x" * transcript, "updates": 0, "copied": 0}
+
+    def publish(text: str):
+        state["value"] = text
+        state["updates"] += 1
+        state["copied"] += len(text)
+
+    begin = time.perf_counter()
+    for chunk in chunks:  # As print_messages: App.messages.setValue(App.messages.getValue() + text)
+        publish(state["value"] + chunk)
+    results["per_token"] = {
+        "updates": state["updates"], "copied_chars": state["copied"], "seconds": time.perf_counter() - begin
+    }
+
+    now = [0.0]
+    state["value"] = "x" * transcript
+    sink = TextStreamSink(lambda: state["value"], lambda text: state.update(value=text), timer=False,
+                          clock=lambda: now[0])
+    begin = time.perf_counter()
+    for chunk in chunks:
+        now[0] += token_interval
+        sink.write(chunk)
+    sink.close()
+    results["batched"] = {
+        "updates": sink.updates, "copied_chars": sink.copied_chars, "seconds": time.perf_counter() - begin
+    }
+    assert state["value"] == "x" * transcript + "".join(chunks)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--token-interval", type=float, default=0.1, help="Seconds between two tokens")
+    args = parser.parse_args()
+
+    for mode, result in benchmark(args.tokens, args.token_interval).items():
+        print(f"{mode:>9}: {result['updates']:>5} updates, {result['copied_chars']:>10} characters copied, "
+              f"{result['seconds'] * 1000:.1f} ms")
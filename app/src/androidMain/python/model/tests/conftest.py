@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported as the benchmark scripts do, outside of the model package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
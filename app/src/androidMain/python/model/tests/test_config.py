@@ -0,0 +1,91 @@
+import pytest
+
+from config import ChatHistory
+
+
+class WordCounter:
+    """ One token per word, counting the calls """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return len(text.split())
+
+
+def concat_summary(summary, evicted):
+    return " ".join([summary, *(message['content'] for message in evicted)]).strip()
+
+
+def prompt_tokens(history, prompt):
+    return sum(history.token_counter(message['content']) + history.message_overhead for message in prompt)
+
+
+def converse(history, turns, user_prompt="next question", words=30):
+    """ Appends the turns one at a time, as a chat does, and returns the prompt of every turn """
+    prompts = []
+    for index in range(turns):
+        prompts.append(history.create_prompt("You are helpful.", user_prompt))
+        history.append(["user", "assistant"], [f"question {index} " + "word " * words, "answer " * words])
+    return prompts
+
+
+def test_counts_are_cached_on_append():
+    counter = WordCounter()
+    history = ChatHistory(budget=10_000, token_counter=counter)
+
+    history.append(["user", "assistant"], ["one two", "three four five"])
+    history.append("user", "six")
+    assert counter.calls == 3
+
+    history.create_prompt("system", "prompt")
+    history.create_prompt("system", "prompt")
+    assert counter.calls == 3 + 2 * 2  # Only the system and user prompts are counted again
+
+
+def test_bulk_edit_resets_the_window():
+    history = ChatHistory(budget=300, token_counter=WordCounter(), summarizer=concat_summary)
+    converse(history, 10)
+    assert history.start > 0 and history.summary
+
+    history[:] = [{'role': "user", 'content': "a b c"}]
+
+    assert history.start == 0 and history.summary == ""
+    assert history.window == [{'role': "user", 'content': "a b c"}]
+    assert history.create_prompt("system")[1] == {'role': "user", 'content': "a b c"}
+
+
+@pytest.mark.parametrize("prompt_words", [0, 100, 400, 560])
+def test_prompt_fits_the_budget_with_a_summary(prompt_words):
+    history = ChatHistory(budget=1536, token_counter=WordCounter(), summarizer=concat_summary)
+    user_prompt = "prompt " * prompt_words
+
+    prompts = converse(history, 20, user_prompt, words=60)
+
+    assert history.summary
+    for prompt in prompts:
+        assert prompt_tokens(history, prompt) <= history.budget
+
+
+def test_window_starts_with_a_user_message():
+    history = ChatHistory(budget=250, token_counter=WordCounter())
+
+    prompts = converse(history, 12)
+
+    assert history.start > 0
+    for prompt in prompts:
+        assert prompt[1]['role'] == "user"
+
+
+def test_low_water_keeps_the_prefix_stable():
+    history = ChatHistory(budget=1000, token_counter=WordCounter(), low_water=0.5)
+
+    starts = []
+    for index in range(20):  # A turn is about 70 tokens, the window slides to half of the budget
+        history.create_prompt("You are helpful.", "next question")
+        starts.append(history.start)
+        history.append(["user", "assistant"], [f"question {index} " + "word " * 30, "answer " * 30])
+
+    first_slide = next(index for index, start in enumerate(starts) if start > 0)
+    assert starts[first_slide:first_slide + 5] == [starts[first_slide]] * 5
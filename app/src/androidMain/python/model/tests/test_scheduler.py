@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import InferenceScheduler, CancelToken, QueueFull, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+
+def words(text, delay=0.0, log=None):
+    """ Job yielding the words of a text, as a model yields tokens """
+    def job(model, token):
+        if log is not None:
+            log.append(text)
+        for word in text.split():
+            time.sleep(delay)
+            yield word + " "
+    return job
+
+
+def blocking(release, started=None):
+    """ Job that holds the worker until it is released """
+    def job(model, token):
+        if started is not None:
+            started.set()
+        release.wait(5)
+        yield "released"
+    return job
+
+
+def test_priority_order():
+    scheduler = InferenceScheduler(lambda token: None)
+    release, started, log = threading.Event(), threading.Event(), []
+    first = scheduler.submit(blocking(release, started))
+    assert started.wait(5)
+
+    background = scheduler.submit(words("background", log=log), priority=PRIORITY_BACKGROUND)
+    second = scheduler.submit(words("second", log=log))
+    third = scheduler.submit(words("third", log=log))
+    release.set()
+
+    assert background.text(5) == "background "
+    assert log == ["second", "third", "background"]  # Priority first, FIFO within a priority
+    assert [handle.state for handle in (first, second, third, background)] == ["done"] * 4
+    assert background.started >= third.started >= second.started
+
+
+def test_cancel_running_request():
+    closed = threading.Event()
+
+    def job(model, token):
+        try:
+            for index in range(1000):
+                time.sleep(0.005)
+                yield f"{index} "
+        finally:
+            closed.set()
+
+    scheduler = InferenceScheduler(lambda token: None)
+    handle = scheduler.submit(job)
+    chunks = iter(handle)
+    next(chunks)
+    handle.cancel()
+
+    assert handle.finished.wait(5)
+    assert handle.state == "cancelled"
+    assert closed.is_set()  # The generation is stopped where it is
+    assert len(list(chunks)) < 999
+
+
+def test_cancel_pending_request():
+    scheduler = InferenceScheduler(lambda token: None)
+    release, started, log = threading.Event(), threading.Event(), []
+    scheduler.submit(blocking(release, started))
+    assert started.wait(5)
+
+    pending = scheduler.submit(words("never", log=log))
+    pending.cancel()
+    release.set()
+
+    assert pending.state == "cancelled"
+    assert list(pending) == []
+    assert scheduler.submit(words("after", log=log)).text(5) == "after "
+    assert log == ["after"]
+
+
+def test_cancel_while_loading_the_model():
+    loading, log = threading.Event(), []
+
+    def load_model(token: CancelToken):
+        loading.set()
+        if not token.wait(5):
+            raise AssertionError("The load was not cancelled")
+        raise RuntimeError("Cancelled while loading")  # As ModelManager.load raises LoadCancelled
+
+    scheduler = InferenceScheduler(load_model)
+    handle = scheduler.submit(words("never", log=log))
+    assert loading.wait(5)
+    handle.cancel()
+
+    assert handle.finished.wait(5)
+    assert handle.state == "cancelled"
+    assert list(handle) == []
+    assert log == []
+
+
+def test_queue_full():
+    scheduler = InferenceScheduler(lambda token: None, max_pending=2)
+    release, started = threading.Event(), threading.Event()
+    scheduler.submit(blocking(release, started))
+    assert started.wait(5)
+    scheduler.submit(words("a"))
+    scheduler.submit(words("b"))
+
+    with pytest.raises(QueueFull):
+        scheduler.submit(words("c"), block=False)
+    begin = time.monotonic()
+    with pytest.raises(QueueFull):
+        scheduler.submit(words("c"), timeout=0.1)
+    assert time.monotonic() - begin >= 0.1
+
+    release.set()  # Room again once the worker takes the next request
+    assert scheduler.submit(words("c"), timeout=5).text(5) == "c "
+    assert scheduler.pending == 0
+
+
+def test_failed_request():
+    def job(model, token):
+        yield "partial "
+        raise ValueError("broken model")
+
+    handle = InferenceScheduler(lambda token: None).submit(job)
+
+    with pytest.raises(ValueError, match="broken model"):
+        list(handle)
+    assert handle.state == "failed"
+
+
+def test_async_streaming():
+    scheduler = InferenceScheduler(lambda token: None)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.005)
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        handle = scheduler.submit(words("streamed to an event loop", delay=0.05))
+        chunks = [chunk async for chunk in handle]
+        ticker.cancel()
+        return chunks
+
+    assert asyncio.run(main()) == ["streamed ", "to ", "an ", "event ", "loop "]
+    assert len(ticks) > 10  # The event loop kept running while the chunks were awaited
@@ -0,0 +1,68 @@
+import threading
+
+from streaming import TextStreamSink
+
+
+class State:
+    def __init__(self, value=""):
+        self.value = value
+        self.published = []
+
+    def get(self):
+        return self.value
+
+    def publish(self, text):
+        self.value = text
+        self.published.append(text)
+
+
+def stream(sink, chunks, now, token_interval):
+    for chunk in chunks:
+        now[0] += token_interval
+        sink.write(chunk)
+    sink.close()
+
+
+def test_slow_stream_is_batched():
+    state, now = State("history\n"), [0.0]
+    sink = TextStreamSink(state.get, state.publish, timer=False, clock=lambda: now[0])
+    chunks = [f"tok{index} " for index in range(100)]
+
+    stream(sink, chunks, now, token_interval=0.1)  # 10 tokens/s
+
+    assert state.value == "history\n" + "".join(chunks)
+    assert sink.updates <= len(chunks) / 2
+
+
+def test_fast_stream_is_capped_by_max_chunks():
+    state, now = State(), [0.0]
+    sink = TextStreamSink(state.get, state.publish, max_chunks=8, timer=False, clock=lambda: now[0])
+
+    stream(sink, ["x"] * 64, now, token_interval=0.0)
+
+    assert state.published == ["x" * 8 * n for n in range(1, 9)]
+
+
+def test_timer_publishes_a_pending_chunk():
+    state = State()
+    published = threading.Event()
+    sink = TextStreamSink(state.get, lambda text: (state.publish(text), published.set()), interval=0.05)
+
+    sink.write("first ")
+    published.clear()
+    sink.write("second")  # Within the interval, left to the timer
+
+    assert published.wait(5)
+    assert state.value == "first second"
+    assert sink.text == "first second"
+
+
+def test_next_stream_starts_from_the_state():
+    state, now = State("a"), [0.0]
+    sink = TextStreamSink(state.get, state.publish, timer=False, clock=lambda: now[0])
+
+    stream(sink, ["b"], now, token_interval=1.0)
+    state.value += "\nuser: c\n"  # Changed by the UI between two streams
+    stream(sink, ["d"], now, token_interval=1.0)
+
+    assert state.value == "ab\nuser: c\nd"
@@ -1,17 +1,16 @@
 from __future__ import annotations
 
 from typing import Optional, Any, Dict, List
-import signal
-import time
-import sys
+from concurrent.futures import Future
+import asyncio
+import weakref
 import os
 
-from jupyter_server.services.kernels.kernelmanager import ServerKernelManager
+from jupyter_server.services.kernels.kernelmanager import ServerKernelManager, AsyncMappingKernelManager
 import jupyter_client.provisioning as provisioning
 from jupyter_client import KernelConnectionInfo
-
-from ipykernel.kernelapp import IPKernelApp
-from IPython import get_ipython
+from traitlets import Float, Bool, Unicode, CaselessStrEnum, Integer as IntegerTrait
+from jupyter_core.paths import jupyter_runtime_dir
 
 from java import jclass
 from java.lang import Integer
@@ -21,39 +20,30 @@ from com.chaquo.python import Python
 from repl import InAppKernelServiceBase
 from repl import UIThreadKernelService
 
-app = Python.getPlatform().getApplication()
-
-
-def prepare_kernel():
-    """ Will be called from the InAppKernelService (Multi-Process) """
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
+from .pool import PooledKernel, KernelLauncher, KernelProcessPool
+from .monitor import ProcessTable, process_key
+from .slots import SlotAllocator
+from .interrupt import send_interrupt_request
+from .transport import TRANSPORTS, ipc_supported, ipc_prefix, remove_ipc_files
+from .phases import LaunchTrace, start_kernel_info_trace
+from .culling import KernelActivity, CullingPolicy, snapshot_code
 
-    stdin_file = os.path.join(os.environ['HOME'], ".jupyter", "lab", "stdin.redirected")
-    stdout_file = os.path.join(os.environ['HOME'], ".jupyter", "lab", "stdout.redirected")
-    stderr_file = os.path.join(os.environ['HOME'], ".jupyter", "lab", "stderr.redirected")
-
-    if not os.path.isdir(os.path.dirname(stdin_file)):
-        os.makedirs(os.path.dirname(stdin_file))
-
-    sys.stdin, sys.stdout, sys.stderr = [open(file, "w+") for file in [stdin_file, stdout_file, stderr_file]]
+app = Python.getPlatform().getApplication()
 
 
-def start_kernel(workdir: str | None, filename: str):
-    """ Will be called from the InAppKernelService (Multi-Process) """
-    if workdir is not None:
-        os.chdir(workdir)
-    IPKernelApp.launch_instance(["-f", filename])
+def _running_processes() -> Dict[str, int]:
+    """ Snapshot of the app's processes (by ":name" suffix) and running services (by class name) """
+    activity_manager = app.getSystemService(app.ACTIVITY_SERVICE)
+    table = {
+        process_key(p_info.processName): p_info.pid
+        for p_info in activity_manager.getRunningAppProcesses(Integer.MAX_VALUE).toArray()
+    }
+    for service_info in activity_manager.getRunningServices(Integer.MAX_VALUE).toArray():
+        table[service_info.service.getClassName()] = service_info.pid
+    return table
 
 
-def interrupt_kernel(signum: int = signal.SIGINT):
-    """ Send an interrupt signal to the kernel """
-    ipython = get_ipython()
-    if ipython is not None and signum == signal.SIGINT:
-        print("Interrupting cell...")
-        ipython.kernel.interrupt()  # TODO: Not working properly
-    else:
-        print("Interrupting kernel...")
-        os.kill(os.getpid(), signum)
+process_table = ProcessTable(_running_processes)  # Shared by every kernel manager and provisioner in this process
 
 
 class InAppKernelManager(ServerKernelManager):
@@ -67,11 +57,119 @@ class InAppKernelManager(ServerKernelManager):
         return await super().shutdown_kernel(*args, **kwargs)
 
     async def interrupt_kernel(self, *args, **kwargs):
-        return await super().interrupt_kernel(*args, **kwargs)
+        send_interrupt_request(self)  # Delivered on the control channel, no signal or intent involved
+
+
+class InAppMappingKernelManager(AsyncMappingKernelManager):
+    """ MultiKernelManager that reclaims the least recently active kernels when slots or memory run out """
+    lru_idle_timeout = Float(
+        0, config=True, help="Seconds of inactivity after which a kernel is shut down, 0 to disable"
+    )
+    rss_budget = IntegerTrait(
+        0, config=True, help="Total kernel RSS in bytes above which the LRU kernels are shut down, 0 to disable"
+    )
+    evict_on_exhaustion = Bool(
+        True, config=True, help="Shut down the LRU idle kernel when a new kernel needs a slot and none is free"
+    )
+    snapshot_before_evict = Bool(
+        False, config=True, help="Pickle the user namespace of a kernel to snapshot_dir before culling it"
+    )
+    snapshot_dir = Unicode(
+        os.path.join(os.environ['HOME'], ".jupyter", "lab", "snapshots"), config=True,
+        help="Directory of the namespace snapshots of culled kernels"
+    )
+    lru_check_interval = Float(30, config=True, help="Seconds between two idle/memory checks")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.culling_policy = CullingPolicy(
+            self.lru_idle_timeout or None, self.rss_budget or None, self.evict_on_exhaustion
+        )
+        self._lru_callback = None
+        # Kernel services left running by an earlier server hold slots, they are stopped before the first launch
+        reclaimed = InAppLocalPrivateProvisioner.Process.reclaim_orphans()
+        if reclaimed:
+            self.log.info(f"Reclaimed orphaned kernel slots: {reclaimed}")
+
+    def _kernel_activity(self) -> List[KernelActivity]:
+        import psutil
+
+        activity = []
+        for kernel_id in self.list_kernel_ids():
+            kernel = self.get_kernel(kernel_id)
+            pid = getattr(kernel.provisioner, "pid", None)
+            rss = None
+            if pid:
+                try:
+                    rss = psutil.Process(pid).memory_info().rss
+                except psutil.Error:
+                    pass
+            activity.append(KernelActivity(
+                kernel_id, kernel.last_activity.timestamp(), rss, kernel.execution_state == "busy"
+            ))
+        return activity
+
+    @staticmethod
+    def _slot_exhausted() -> bool:
+        process = InAppLocalPrivateProvisioner.Process
+        pool_idle = process.pool.idle if process.pool is not None else 0
+        return process.slots.in_use >= process.slots.capacity and pool_idle == 0
+
+    async def cull_kernels(self, need_slot: bool = False) -> List[str]:
+        """ Shut down the kernels chosen by the culling policy
+        :return: The culled kernel ids
+        """
+        victims = self.culling_policy.select(self._kernel_activity(), need_slot)
+        for kernel_id in victims:
+            if self.snapshot_before_evict:
+                await self.snapshot_kernel(kernel_id)
+            self.log.info(f"Culling kernel {kernel_id} to free resources")
+            await self.shutdown_kernel(kernel_id)
+        return victims
+
+    async def snapshot_kernel(self, kernel_id: str, timeout: float = 10) -> str | None:
+        """ Save the picklable part of the kernel's user namespace
+        :return: The snapshot path, None if it failed
+        """
+        path = os.path.join(self.snapshot_dir, f"{kernel_id}.pickle")
+        client = self.get_kernel(kernel_id).client()
+        client.start_channels()
+        try:
+            await client.execute(snapshot_code(path), silent=True, store_history=False, reply=True, timeout=timeout)
+            return path
+        except Exception as e:
+            self.log.warning(f"Failed to snapshot kernel {kernel_id}: {e}")
+            return None
+        finally:
+            client.stop_channels()
+
+    async def _periodic_cull(self):
+        try:
+            await self.cull_kernels()
+        except Exception as e:
+            self.log.exception(f"Kernel culling failed: {e}")
+
+    def _start_lru_culling(self):
+        if self._lru_callback is None and (self.lru_idle_timeout or self.rss_budget):
+            from tornado.ioloop import PeriodicCallback
+            self._lru_callback = PeriodicCallback(self._periodic_cull, 1000 * self.lru_check_interval)
+            self._lru_callback.start()
+
+    async def start_kernel(self, *args, **kwargs):
+        self._start_lru_culling()
+        if self._slot_exhausted():
+            await self.cull_kernels(need_slot=True)
+        return await super().start_kernel(*args, **kwargs)
 
 
 class UIThreadKernelManager(ServerKernelManager):
     """ KernelManager that will run the kernel in the UI thread """
+    launch_timeout = Float(5, config=True, help="Seconds to wait for the kernel service to start")
+    kill_timeout = Float(5, config=True, help="Seconds to wait for the kernel service to stop")
+    cooperative = Bool(
+        False, config=True,
+        help="Run cells in frame-budgeted slices to keep the UI responsive, at the cost of the cell throughput"
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -88,11 +186,7 @@ class UIThreadKernelManager(ServerKernelManager):
             app.startService(intent)
 
     def is_alive(self):
-        activity_manager = app.getSystemService(app.ACTIVITY_SERVICE)
-        for service_info in activity_manager.getRunningServices(Integer.MAX_VALUE).toArray():
-            if service_info.service.getClassName() == self.kernel_service_class.getName():
-                return True
-        return False
+        return process_table.is_alive(self.kernel_service_class.getName())
 
     async def start_kernel(self, *args, **kwargs):
         return await super().start_kernel(*args, **kwargs)
@@ -100,7 +194,12 @@ class UIThreadKernelManager(ServerKernelManager):
     async def _async_launch_kernel(self, kernel_cmd: List[str], **kwargs: Any) -> None:
         if self.is_alive():
             raise RuntimeError("Only one kernel can be run at a time with the UI thread mode.")
-        self._send_intent(workdir=kwargs['cwd'], filename=kernel_cmd[-1])
+        started = process_table.started(self.kernel_service_class.getName())
+        self._send_intent(workdir=kwargs['cwd'], filename=kernel_cmd[-1], cooperative=self.cooperative)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(started), self.launch_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Failed to start kernel.")
 
     async def restart_kernel(self, *args, **kwargs):
         return await super().restart_kernel(*args, **kwargs)
@@ -109,15 +208,59 @@ class UIThreadKernelManager(ServerKernelManager):
         return await super().shutdown_kernel(*args, **kwargs)
 
     async def _async_kill_kernel(self, restart: bool = False) -> None:
+        exited = process_table.exited(self.kernel_service_class.getName())
         self._send_intent(stop=True)
-        start_time = time.time()
-        while self.is_alive():
-            if time.time() > start_time + 5:
-                raise RuntimeError("Failed to kill kernel.")
-            time.sleep(0.1)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(exited), self.kill_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Failed to kill kernel.")
 
     async def interrupt_kernel(self, *args, **kwargs):
-        return  # await super().interrupt_kernel(*args, **kwargs)
+        send_interrupt_request(self)
+
+
+class AndroidKernelLauncher(KernelLauncher):
+    """ Launches kernels in the InAppKernelServiceN services (one process per slot) """
+    kernel_service_basename = InAppKernelServiceBase.getClass().getName().replace("Base", "")
+
+    def _send_intent(self, slot: int, stop=False, **extras):
+        intent = Intent(app, jclass(self.kernel_service_basename + str(slot)).getClass())
+        for key, value in extras.items():
+            intent.putExtra(key, value)
+
+        if stop:
+            app.stopService(intent)
+        else:
+            app.startService(intent)
+
+    @staticmethod
+    def process_key(slot: int) -> str:
+        return f":kernel{slot}"
+
+    def spawn(self, slot: int) -> PooledKernel:
+        ready = process_table.started(self.process_key(slot))
+        self._send_intent(slot, prewarm=True)
+        return PooledKernel(slot, ready=ready)
+
+    def attach(self, kernel: PooledKernel, workdir: str | None, filename: str):
+        self._send_intent(kernel.slot, workdir=workdir, filename=filename)
+
+    def launch(self, slot: int, workdir: str | None, filename: str) -> PooledKernel:
+        ready = process_table.started(self.process_key(slot))
+        self._send_intent(slot, workdir=workdir, filename=filename)
+        return PooledKernel(slot, ready=ready)
+
+    def is_alive(self, kernel: PooledKernel) -> bool:
+        return process_table.is_alive(self.process_key(kernel.slot))
+
+    def exited(self, kernel: PooledKernel) -> Future:
+        return process_table.exited(self.process_key(kernel.slot))
+
+    def send_signal(self, kernel: PooledKernel, signum: int):
+        self._send_intent(kernel.slot, signum=signum)
+
+    def stop(self, kernel: PooledKernel):
+        self._send_intent(kernel.slot, stop=True)
 
 
 class InAppLocalPrivateProvisioner(provisioning.local_provisioner.LocalProvisioner):
@@ -127,38 +270,90 @@ class InAppLocalPrivateProvisioner(provisioning.local_provisioner.LocalProvision
         """ Represents a kernel process """
         max_workers = InAppKernelServiceBase.MAX_WORKERS  # Maximum number of kernels that can be started simultaneously
                                                         #  (declared in AndroidManifest.xml)
-        kernel_service_basename = InAppKernelServiceBase.getClass().getName().replace("Base", "")
-        _reserved_procs = []
-        intent_wait_time = 5
+        slots = SlotAllocator(max_workers)
+        pool: KernelProcessPool | None = None
+        _instances: weakref.WeakValueDictionary[int, "InAppLocalPrivateProvisioner.Process"] = \
+            weakref.WeakValueDictionary()
+
+        @classmethod
+        def running(cls) -> Dict[str, int]:
+            """ Running kernel processes as {"kernelN": pid} """
+            return {
+                f"kernel{slot}": process.pid for slot, process in list(cls._instances.items())
+                if process.poll() is None
+            }
+
+        @classmethod
+        def get_pool(
+                cls, size: int = 0, max_idle_time: float | None = None, launcher: KernelLauncher | None = None
+        ) -> KernelProcessPool:
+            """ Get the shared pool of pre-warmed kernel processes, resized to the requested size """
+            if cls.pool is None:
+                cls.pool = KernelProcessPool(
+                    launcher or AndroidKernelLauncher(), size, cls.reserve_new_proc_name, cls.release_proc,
+                    max_idle_time
+                )
+                cls.pool.refill()
+            elif cls.pool.size != size:
+                cls.pool.resize(size)
+            return cls.pool
+
+        @classmethod
+        def reclaim_orphans(cls) -> list[int]:
+            """ Stop kernel services left running by a previous server so that their slots can be reused
+            :return: The reclaimed slots
+            """
+            launcher = AndroidKernelLauncher()
+
+            def stop(slot: int):
+                exited = process_table.exited(launcher.process_key(slot))
+                launcher._send_intent(slot, stop=True)
+                return exited
+
+            return cls.slots.reclaim(lambda slot: process_table.is_alive(launcher.process_key(slot)), stop)
 
         @classmethod
         def reserve_new_proc_name(cls):
-            new_id = next((proc for proc in list(range(cls.max_workers)) if proc not in cls._reserved_procs), None)
-            if new_id is None:
-                raise RuntimeError(f"Maximum number of kernels({cls.max_workers}) reached."
-                                + f" Please exit the kernel that is not in use and try again.")
-            cls._reserved_procs.append(new_id)
-            return new_id
+            return cls.slots.acquire()
 
-        def release_proc_name(self):
-            self._reserved_procs.remove(self.process_name)
+        @classmethod
+        def release_proc(cls, proc: int):
+            cls.slots.release(proc)
 
-        def __init__(self, cmd: List[str], **kwargs):
-            self.process_name = self.reserve_new_proc_name()
-            self.kernel_service_class = jclass(self.kernel_service_basename + str(self.process_name)).getClass()
-            self._send_intent(workdir=kwargs['cwd'], filename=cmd[-1])
+        def release_proc_name(self):
+            self.release_proc(self.process_name)
 
-            start_time = time.time()
-            while self.process_info is None:
-                if time.time() > start_time + self.intent_wait_time:
-                    raise RuntimeError("Failed to start kernel process.")
-                time.sleep(0.1)
+        @classmethod
+        async def start(
+                cls, cmd: List[str], pool: KernelProcessPool, timeout: float, trace: LaunchTrace | None = None,
+                **kwargs
+        ) -> "Process":
+            """ Start the kernel without blocking the event loop
+            :raises RuntimeError: If the kernel process does not show up within the timeout
+            """
+            hits = pool.hits
+            kernel = pool.claim(kwargs['cwd'], cmd[-1])  # Hand-over to an idle kernel, or a cold start
+            if trace is not None:
+                trace.mark("intent_sent", warm=pool.hits > hits)
+            await pool.wait_ready(kernel, timeout)
+            if trace is not None:
+                trace.mark("process_visible", pid=kernel.pid)
+            process = cls(kernel, pool.launcher)
+            cls.slots.release_on(kernel.slot, process.exited)  # Crashes free the slot too
+            return process
+
+        def __init__(self, kernel: PooledKernel, launcher: KernelLauncher):
+            self.kernel = kernel
+            self.launcher = launcher  # Kernel services and forked kernels are watched and stopped differently
+            self.process_name = kernel.slot
+            self.exited = launcher.exited(kernel)
 
             class DummyIOStream:
                 def close(self):
                     pass
 
-            self.pid = self.process_info.pid
+            self.pid = kernel.pid
+            self._instances[int(self.process_name)] = self
             self.stdin = DummyIOStream()
             self.stdout = DummyIOStream()
             self.stderr = DummyIOStream()
@@ -166,56 +361,68 @@ class InAppLocalPrivateProvisioner(provisioning.local_provisioner.LocalProvision
         def __del__(self):
             self.release_proc_name()
 
-        def _send_intent(self, stop=False, **extras):
-            """ Send an intent to the InAppKernelService """
-            intent = Intent(app, self.kernel_service_class)
-            for key, value in extras.items():
-                intent.putExtra(key, value)
-
-            if stop:
-                app.stopService(intent)
-            else:
-                app.startService(intent)
-
-        @property
-        def process_info(self):
-            """ Get the process info
-            :return: The process info if the kernel is running, None otherwise
-            """
-            activity_manager = app.getSystemService(app.ACTIVITY_SERVICE)
-            for p_info in activity_manager.getRunningAppProcesses(Integer.MAX_VALUE).toArray():
-                if ":".join(["", *p_info.processName.split(":")[1:]]) == f":kernel{self.process_name}":
-                    return p_info
-            return None
-
         def poll(self) -> None | int:
             """ Check if the kernel is dead
             :return: None if the kernel is running, 0 if the kernel is dead
             """
-            if self.process_info is None:
-                return 0
-            return None
-
-        def wait(self):
-            while self.poll() is None:
-                time.sleep(0.1)
+            if self.launcher.is_alive(self.kernel):
+                return None
             return 0
 
+        def wait(self, timeout: float | None = None):
+            """ Block until the kernel process exits
+            :raises TimeoutError: If the kernel is still running after the timeout
+            """
+            return self.exited.result(timeout=timeout)
+
+        async def async_wait(self) -> int:
+            """ Wait for the kernel process to exit without blocking the event loop """
+            return await asyncio.wrap_future(self.exited)
+
         def send_signal(self, signum: int):
-            self._send_intent(signum=signum)
-            time.sleep(1)
+            self.launcher.send_signal(self.kernel, signum)
 
         def kill(self):
-            self._send_intent(kill=True)
+            self.launcher.stop(self.kernel)
 
         def terminate(self):
-            self._send_intent(kill=True)
+            self.launcher.stop(self.kernel)
+
+    pool_size = IntegerTrait(
+        0, config=True,
+        help="Number of idle, pre-warmed kernel processes to keep ready (they share the MAX_WORKERS slots)"
+    )
+    pool_max_idle_time = Float(
+        None, allow_none=True, config=True,
+        help="Seconds after which an unused pre-warmed kernel process is stopped, None to keep it forever"
+    )
+    launch_timeout = Float(5, config=True, help="Seconds to wait for a kernel process to start")
+    transport = CaselessStrEnum(
+        TRANSPORTS, "tcp", config=True,
+        help="ZMQ transport between the lab server and the kernels, ipc falls back to tcp where it is not usable"
+    )
+    ipc_dir = Unicode(
+        jupyter_runtime_dir(), config=True, help="Directory of the Unix-domain sockets of the ipc transport"
+    )
+    trace_kernel_info = Bool(
+        True, config=True, help="Time the first kernel_info_reply of every launch (needs one extra client connection)"
+    )
+    launch_trace: LaunchTrace | None = None
+
+    def _create_launcher(self) -> KernelLauncher:
+        return AndroidKernelLauncher()  # Kernels cannot be forked from a template here, see fork_supported
 
     async def poll(self) -> Optional[int]:
         return await super().poll()
 
     async def wait(self) -> Optional[int]:
-        return await super().wait()
+        ret = 0
+        if self.process:
+            ret = await self.process.async_wait()
+            for attr in ['stdout', 'stderr', 'stdin']:
+                getattr(self.process, attr).close()
+            self.process = None  # allow has_process to now return False
+        return ret
 
     async def send_signal(self, signum: int) -> None:
         self.process.send_signal(signum)
@@ -234,12 +441,50 @@ class InAppLocalPrivateProvisioner(provisioning.local_provisioner.LocalProvision
             except OSError as e:
                 self._tolerate_no_process(e)
 
+    def _use_ipc(self) -> bool:
+        """ Switch the kernel manager to the ipc transport
+        :return: False if ipc is not usable here and the kernel stays on tcp
+        """
+        km = self.parent
+        if km.transport == "ipc":  # Restart, the socket paths are already set
+            return True
+        prefix = ipc_prefix(self.ipc_dir, self.kernel_id)
+        if not ipc_supported() or prefix is None:
+            self.log.warning("The ipc transport is not usable, falling back to tcp.")
+            return False
+        os.makedirs(self.ipc_dir, exist_ok=True)
+        remove_ipc_files(prefix)  # Leftovers of a crashed kernel with the same prefix
+        km.transport = "ipc"
+        km.ip = prefix
+        km.cache_ports = False  # Ports are only socket file suffixes
+        return True
+
     async def pre_launch(self, **kwargs: Any) -> Dict[str, Any]:
-        return await super().pre_launch(**kwargs)
+        self.launch_trace = LaunchTrace(self.kernel_id)
+        if self.transport == "ipc":
+            self._use_ipc()
+        kwargs = await super().pre_launch(**kwargs)
+        self.launch_trace.mark("connection_file_ready")
+        return kwargs
+
+    async def post_launch(self, **kwargs: Any) -> None:
+        await super().post_launch(**kwargs)
+        if self.trace_kernel_info and self.launch_trace is not None:
+            self.kernel_info_task = start_kernel_info_trace(self.parent, self.launch_trace)
+
+    async def cleanup(self, restart: bool = False) -> None:
+        await super().cleanup(restart)
+        km = self.parent
+        if not restart and km is not None and km.transport == "ipc":
+            remove_ipc_files(km.ip)
 
     async def launch_kernel(self, cmd: List[str], **kwargs: Any) -> KernelConnectionInfo:
         scrubbed_kwargs = self._scrub_kwargs(kwargs)
-        self.process = self.Process(cmd, **scrubbed_kwargs)
+        launcher = self._create_launcher() if self.Process.pool is None else None
+        pool = self.Process.get_pool(self.pool_size, self.pool_max_idle_time, launcher)
+        self.process = await self.Process.start(
+            cmd, pool, self.launch_timeout, self.launch_trace, **scrubbed_kwargs
+        )
         pgid = None
         if hasattr(os, "getpgid"):
             try:
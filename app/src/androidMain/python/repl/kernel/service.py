@@ -0,0 +1,67 @@
+""" Entry points called by the kernel services in their own processes
+
+Kept apart from the kernel managers so that a kernel process does not import the Jupyter server stack.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+import importlib
+import signal
+import sys
+import os
+
+from .capture import StreamCapture, capture_dir
+from .interrupt import install_interrupter
+from .cooperative import install_cooperative_mode
+
+
+def prepare_kernel(slot: int | None = None):
+    """ Will be called from the InAppKernelService (Multi-Process) """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    directory = capture_dir(os.getpid() if slot is None else slot)
+    sys.stdin = open(os.devnull)
+    sys.stdout, sys.stderr = [StreamCapture(directory, name) for name in ("stdout", "stderr")]
+
+
+def prewarm_kernel(
+        slot: int | None = None, preload: Iterable[str] = ("ipykernel.ipkernel", "IPython.core.interactiveshell", "zmq")
+):
+    """ Will be called from the InAppKernelService (Multi-Process) when it is started as an idle pool member """
+    prepare_kernel(slot)
+    for name in preload:
+        importlib.import_module(name)
+
+
+def start_kernel(workdir: str | None, filename: str, cooperative: bool = False):
+    """ Will be called from the InAppKernelService (Multi-Process) """
+    if workdir is not None:
+        os.chdir(workdir)
+    from ipykernel.kernelapp import IPKernelApp
+
+    kernel_app = IPKernelApp.instance()
+    kernel_app.initialize(["-f", filename])
+    install_interrupter(kernel_app.kernel)  # The kernel runs in a service thread, out of reach of SIGINT
+    if cooperative:
+        install_cooperative_mode(kernel_app.kernel)
+    kernel_app.start()
+
+
+def start_ui_thread_kernel(workdir: str | None, filename: str, cooperative: bool = False):
+    """ Will be called from the UIThreadKernelService (Single-Process)
+    :param cooperative: Run cells in frame-budgeted slices, the UI stays responsive but cells run slower
+    """
+    start_kernel(workdir, filename, cooperative=cooperative)
+
+
+def interrupt_kernel(signum: int = signal.SIGINT):
+    """ Send an interrupt signal to the kernel """
+    from IPython import get_ipython
+
+    ipython = get_ipython()
+    if ipython is not None and signum == signal.SIGINT:
+        print("Interrupting cell...")
+        ipython.kernel.cell_interrupter.interrupt()
+    else:
+        print("Interrupting kernel...")
+        os.kill(os.getpid(), signum)
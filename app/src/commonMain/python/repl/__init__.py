@@ -1,3 +1,9 @@
+import os
+
+if os.environ.get("PYREPL_IMPORT_PROFILE"):  # Startup profile mode, see repl.profiling
+    from .profiling import enable
+    enable()
+
 from .config import REPLConfig
 from .server import run_lab_server, send_server_launch_intent
 
@@ -0,0 +1,384 @@
+""" Precompressed static assets of JupyterLab
+
+The lab bundle under REPLConfig.LAB_ASSETS is several megabytes of JS and CSS. PrecompressedAssets compresses it once
+(gzip, and brotli when the brotli module is installed) into a content-addressed cache with a manifest, and rebuilds
+only when the bundle changes. PrecompressedFileHandler serves the variant the browser accepts, with strong ETags,
+from memory: tornado has no sendfile path, so the small compressed variants are kept in one buffer each and written
+without per-request file reads. The files with a content hash in their name are cached as immutable, the others
+(bootstrap.js, package.json...) are revalidated with their ETag.
+
+    python assets.py build [STATIC_DIR] [CACHE_DIR]  # Build once, e.g. while packaging
+    python assets.py bench [STATIC_DIR]  # Bytes transferred and load time, plain vs precompressed
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+import mimetypes
+import threading
+import hashlib
+import gzip
+import json
+import time
+import re
+import os
+
+from tornado import web
+from jupyter_server.base.handlers import FileFindHandler
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only
+    brotli = None
+
+
+__all__ = ["PrecompressedAssets", "PrecompressedFileHandler", "is_hashed", "accepted_encodings"]
+
+MANIFEST_VERSION = 2
+COMPRESSIBLE = (".js", ".css", ".html", ".json", ".svg", ".map", ".txt", ".ttf", ".eot", ".mjs")
+ENCODINGS = {"br": ".br", "gzip": ".gz"}  # Preferred first
+HASHED_NAME = re.compile(r"(?:^|[.-])[0-9a-f]{16,}\.")  # As webpack names its chunks: 1036.b7aaba381aaa04073a6b.js
+
+
+def is_hashed(name: str) -> bool:
+    """ Whether a file name carries the hash of its content, so that the file never changes under that name """
+    return HASHED_NAME.search(os.path.basename(name)) is not None
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """ Content codings of an Accept-Encoding header and their q-values, 0 where they are refused """
+    accepted = {}
+    for token in header.split(","):
+        coding, *params = [part.strip() for part in token.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+class PrecompressedAssets:
+    """ Content-addressed gzip/brotli variants of a static directory and their manifest """
+
+    def __init__(self, source_dir: str, cache_dir: str, min_size: int = 1024, memory_limit: int = 32 * 1024 * 1024):
+        """
+        :param min_size: Files below are served as they are
+        :param memory_limit: Bytes of compressed variants kept in memory
+        """
+        self.source_dir = os.path.abspath(source_dir)
+        self.cache_dir = cache_dir
+        self.min_size = min_size
+        self.memory_limit = memory_limit
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._memory: Dict[str, bytes] = {}
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.files)
+
+    def _walk(
+            self, directory: str | None = None, directories: Dict[str, int] | None = None
+    ) -> List[Tuple[str, os.stat_result]]:
+        """ The source files and their stats
+        :param directories: Filled with the modification times of the directories walked
+        """
+        directory = directory or self.source_dir
+        if directories is not None:
+            directories[os.path.relpath(directory, self.source_dir)] = os.stat(directory).st_mtime_ns
+        found = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    found.extend(self._walk(entry.path, directories))
+                elif entry.is_file(follow_symlinks=False):
+                    found.append((os.path.relpath(entry.path, self.source_dir), entry.stat(follow_symlinks=False)))
+        return found
+
+    def _current(self, sources: Dict[str, Any]) -> bool:
+        """ Whether the source files are still those of a build, without walking them
+        Adding, removing or renaming a file changes the modification time of its directory, and only the files
+        without a content hash in their name can change in place.
+        """
+        try:
+            for name, mtime in sources["directories"].items():
+                if os.stat(os.path.join(self.source_dir, name)).st_mtime_ns != mtime:
+                    return False
+            for name, (size, mtime) in sources["unhashed"].items():
+                stat = os.stat(os.path.join(self.source_dir, name))
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                    return False
+        except (OSError, KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def load(self) -> bool:
+        """ Use the manifest if it was built from the current source files
+        :return: False if it has to be built
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if manifest.get("version") != MANIFEST_VERSION or not self._current(manifest.get("sources", {})):
+            return False
+        self.files = manifest["files"]  # A variant that went missing is looked up as it is served
+        return True
+
+    def _variant_path(self, content_hash: str, encoding: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], content_hash + ENCODINGS[encoding])
+
+    def build(self) -> Dict[str, int]:
+        """ Compress the source files whose variants are not in the cache yet and write the manifest
+        :return: Source and compressed byte counts
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        directories: Dict[str, int] = {}
+        found = self._walk(directories=directories)
+        sources = {
+            "directories": directories,
+            "unhashed": {name: [stat.st_size, stat.st_mtime_ns] for name, stat in found if not is_hashed(name)}
+        }
+        files = {}
+        source_bytes = compressed_bytes = 0
+        for name, stat in found:
+            with open(os.path.join(self.source_dir, name), "rb") as f:
+                data = f.read()
+            content_hash = hashlib.sha256(data).hexdigest()[:32]
+            entry = {"hash": content_hash, "size": len(data), "variants": {}}
+            if name.endswith(COMPRESSIBLE) and len(data) >= self.min_size:
+                for encoding in ENCODINGS:
+                    if encoding == "br" and brotli is None:
+                        continue
+                    size = self._compress(data, content_hash, encoding)
+                    if size < len(data):
+                        entry["variants"][encoding] = size
+                        compressed_bytes += size
+            files[name.replace(os.sep, "/")] = entry
+            source_bytes += len(data)
+
+        manifest = {"version": MANIFEST_VERSION, "sources": sources, "time": time.time(), "files": files}
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+        self.files = files
+        return {"files": len(files), "source_bytes": source_bytes, "compressed_bytes": compressed_bytes}
+
+    def _compress(self, data: bytes, content_hash: str, encoding: str) -> int:
+        path = self._variant_path(content_hash, encoding)
+        if os.path.exists(path):  # Content-addressed, unchanged files are not compressed again
+            return os.path.getsize(path)
+        compressed = brotli.compress(data) if encoding == "br" else gzip.compress(data, 9, mtime=0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return len(compressed)
+
+    def ensure(self, background: bool = True):
+        """ Load the manifest, or build it (on a background thread); plain files are served meanwhile """
+        def run():
+            try:
+                if not self.load():
+                    begin = time.perf_counter()
+                    stats = self.build()
+                    print(f"Precompressed {stats['files']} lab assets in {time.perf_counter() - begin:.1f}s: "
+                          f"{stats['source_bytes']} -> {stats['compressed_bytes']} bytes")
+            except Exception as e:
+                print(f"Could not precompress the lab assets: {e}")
+
+        if not background:
+            return run()
+        if self._thread is None:
+            self._thread = threading.Thread(target=run, name="PrecompressedAssets", daemon=True)
+            self._thread.start()
+
+    def lookup(self, absolute_path: str, accept_encoding: str) -> Tuple[str, str | None, Dict[str, Any]] | None:
+        """ The file to serve for a request
+        :return: (path, content encoding or None, manifest entry), None if the file is not in the manifest
+        """
+        if not absolute_path.startswith(self.source_dir + os.sep):
+            return None
+        entry = self.files.get(os.path.relpath(absolute_path, self.source_dir).replace(os.sep, "/"))
+        if entry is None:
+            return None
+        accepted = accepted_encodings(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in ENCODINGS:  # Highest q-value first, then the preferred encoding
+            quality = accepted.get(encoding, accepted.get("*", 0.0))
+            if encoding in entry["variants"] and quality > best_quality:
+                path = self._variant_path(entry["hash"], encoding)
+                if path in self._memory or os.path.exists(path):
+                    best, best_quality = encoding, quality
+        if best is None:
+            return absolute_path, None, entry
+        return self._variant_path(entry["hash"], best), best, entry
+
+    def read(self, path: str) -> bytes:
+        """ Content of a variant, from memory while the memory limit allows """
+        data = self._memory.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            with self._lock:
+                if self._memory_size + len(data) <= self.memory_limit and path not in self._memory:
+                    self._memory[path] = data
+                    self._memory_size += len(data)
+        return data
+
+
+class PrecompressedMixin:
+    """ Serves a precompressed variant in place of the file, for StaticFileHandler subclasses """
+    assets: PrecompressedAssets
+    _encoding: str | None = None
+    _entry: Dict[str, Any] | None = None
+    _original_path: str | None = None
+
+    def validate_absolute_path(self, root: str, absolute_path: str) -> str | None:
+        absolute_path = super().validate_absolute_path(root, absolute_path)
+        if absolute_path is None or not self.assets.ready:
+            return absolute_path
+        found = self.assets.lookup(absolute_path, self.request.headers.get("Accept-Encoding", ""))
+        if found is None:
+            return absolute_path
+        self._original_path = absolute_path
+        path, self._encoding, self._entry = found
+        return path
+
+    def compute_etag(self) -> str | None:
+        if self._entry is None:
+            return None  # Like FileFindHandler, no hashing of the file on every request
+        return f'"{self._entry["hash"]}-{self._encoding}"' if self._encoding else f'"{self._entry["hash"]}"'
+
+    def get_content_size(self) -> int:
+        if self._entry is None:
+            return super().get_content_size()
+        return self._entry["variants"][self._encoding] if self._encoding else self._entry["size"]
+
+    def get_content_type(self) -> str:
+        if self._original_path is None:
+            return super().get_content_type()
+        return mimetypes.guess_type(self._original_path)[0] or "application/octet-stream"
+
+    def set_extra_headers(self, path: str) -> None:
+        super().set_extra_headers(path)
+        if self._entry is not None:
+            self.set_header("Vary", "Accept-Encoding")
+            if self._encoding:
+                self.set_header("Content-Encoding", self._encoding)
+
+    def set_headers(self) -> None:
+        super().set_headers()
+        if self._entry is not None:  # After FileFindHandler, which sets its own Cache-Control
+            if is_hashed(self._original_path):
+                self.set_header("Cache-Control", "public, max-age=31536000, immutable")
+            else:
+                self.set_header("Cache-Control", "no-cache")  # Revalidated with the ETag
+
+    def get_content(self, abspath: str, start: int | None = None, end: int | None = None):
+        if self._entry is None or not self._encoding:
+            return super().get_content(abspath, start, end)
+        data = self.assets.read(abspath)
+        return data if start is None and end is None else data[start:end]
+
+
+class PrecompressedFileHandler(PrecompressedMixin, FileFindHandler):
+    """ FileFindHandler of the lab static files that serves their precompressed variants """
+
+    def initialize(self, path, default_filename=None, no_cache_paths=None, assets=None, **kwargs):
+        super().initialize(path, default_filename, no_cache_paths, **kwargs)
+        self.assets = assets
+
+
+class _BenchHandler(PrecompressedMixin, web.StaticFileHandler):
+    def initialize(self, path, assets=None):
+        super().initialize(path)
+        self.assets = assets
+
+
+def benchmark(static_dir: str, runs: int = 3, bandwidth: float = 20.0) -> Dict[str, Dict[str, float]]:
+    """ Cold load of the lab bundle from a local HTTP server, without and with the precompressed variants
+    :param bandwidth: Mbit/s of the simulated Wi-Fi link the transfer time is estimated for
+    :return: Per mode, bytes transferred and milliseconds to the first paint (entry bundles) and to the full load
+    """
+    import asyncio
+    import tempfile
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpserver import HTTPServer
+    from tornado.netutil import bind_sockets
+
+    critical = [name for name in os.listdir(static_dir) if name.endswith(".js") and not name[0].isdigit()]
+    everything = [name for name in os.listdir(static_dir) if os.path.isfile(os.path.join(static_dir, name))]
+
+    async def load(client, base: str, names: List[str]) -> Tuple[int, float]:
+        begin = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.fetch(f"{base}/{name}", headers={"Accept-Encoding": "gzip, br"}, decompress_response=False)
+            for name in names
+        ])
+        return sum(len(response.body) for response in responses), time.perf_counter() - begin
+
+    async def run(cache_dir: str):
+        assets = PrecompressedAssets(static_dir, cache_dir)
+        assets.ensure(background=False)
+        application = web.Application([
+            (r"/plain/(.*)", web.StaticFileHandler, {"path": static_dir}),
+            (r"/precompressed/(.*)", _BenchHandler, {"path": static_dir, "assets": assets}),
+        ])
+        sockets = bind_sockets(0, "127.0.0.1")
+        server = HTTPServer(application)
+        server.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+        client = AsyncHTTPClient(max_clients=6)  # As many connections as a browser opens per host
+        results = {}
+        for mode in ("plain", "precompressed"):
+            base = f"http://127.0.0.1:{port}/{mode}"
+            first_paint, full = [], []
+            for _ in range(runs):
+                paint_bytes, paint_time = await load(client, base, critical)
+                full_bytes, full_time = await load(client, base, everything)
+                first_paint.append(paint_time)
+                full.append(full_time)
+            link = bandwidth * 1e6 / 8
+            results[mode] = {
+                "first_paint_bytes": paint_bytes,
+                "full_load_bytes": full_bytes,
+                "first_paint_ms": min(first_paint) * 1000,
+                "full_load_ms": min(full) * 1000,
+                "first_paint_ms_on_link": (min(first_paint) + paint_bytes / link) * 1000,
+                "full_load_ms_on_link": (min(full) + full_bytes / link) * 1000
+            }
+        server.stop()
+        client.close()
+        return results
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        return asyncio.run(run(cache_dir))
+
+
+if __name__ == "__main__":
+    import sys
+
+    default_static = os.path.join(os.path.dirname(os.path.abspath(__file__)), "share", "jupyter", "lab", "static")
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    static = sys.argv[2] if len(sys.argv) > 2 else default_static
+    if command == "bench":
+        print(json.dumps(benchmark(static), indent=2))
+    else:
+        cache = sys.argv[3] if len(sys.argv) > 3 else os.path.join(os.path.expanduser("~"), ".cache", "pyrepl", "lab")
+        print(PrecompressedAssets(static, cache).build())
@@ -0,0 +1,212 @@
+""" Background garbage collection of the runtime and workspace directories
+
+Connection files, server info files and workspace JSONs pile up across kernel restarts. A DirectoryCleaner scans
+each directory once with os.scandir (one lstat per file), removes what is older than the age budget, then the least
+recently used files until the count and size budgets hold, in small batches off the calling thread.
+Files of live kernels and of live processes are never removed.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, List, Tuple
+import threading
+import socket
+import json
+import time
+import re
+import os
+
+
+__all__ = ["CacheBudget", "DirectoryCleaner", "is_live_file"]
+
+DAY = 24 * 60 * 60
+_PID_FILE = re.compile(r"^(?:jpserver|nbserver)-(\d+)")
+
+
+class CacheBudget:
+    """ What may stay in a directory """
+
+    def __init__(self, path: str, max_age: float = 3 * DAY, max_files: int = 0, max_bytes: int = 0):
+        """
+        :param max_age: Seconds since the last use after which a file is removed, 0 for no limit
+        :param max_files: Number of files kept at most, 0 for no limit
+        :param max_bytes: Total size kept at most, 0 for no limit
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        return f"<CacheBudget {self.path} age={self.max_age} files={self.max_files} bytes={self.max_bytes}>"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OverflowError):
+        return True
+    return True
+
+
+def _kernel_listening(path: str) -> bool:
+    """ Whether the kernel of a connection file still listens on its shell socket """
+    try:
+        with open(path) as f:
+            info = json.load(f)
+        transport, ip, port = info.get("transport", "tcp"), info["ip"], info["shell_port"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    try:
+        if transport == "ipc":
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.settimeout(0.2)
+                sock.connect(f"{ip}-{port}")
+        else:
+            with socket.create_connection((ip, port), timeout=0.2):
+                pass
+    except OSError:
+        return False
+    return True
+
+
+def is_live_file(path: str) -> bool:
+    """ Whether the file belongs to a running kernel or process (connection, server info or ready file) """
+    name = os.path.basename(path)
+    match = _PID_FILE.match(name)
+    if match:
+        return _pid_alive(int(match.group(1)))
+    if name.startswith("kernel-") and name.endswith(".json"):
+        return _kernel_listening(path)
+    if name.startswith("pyrepl-lab-") and name.endswith("-ready.json"):
+        try:
+            with open(path) as f:
+                return _pid_alive(json.load(f).get("pid", 0))
+        except (OSError, ValueError):
+            return False
+    return False
+
+
+class DirectoryCleaner:
+    """ Enforces CacheBudgets on their directories, on a background thread """
+
+    def __init__(
+            self,
+            budgets: Iterable[CacheBudget],
+            batch_size: int = 32,
+            pause: float = 0.01,
+            is_protected: Callable[[str], bool] = is_live_file,
+            clock: Callable[[], float] = time.time
+    ):
+        """
+        :param batch_size: Files removed before the cleaner yields for the pause
+        :param is_protected: Files it returns True for are kept, whatever the budget
+        """
+        self.budgets = list(budgets)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.is_protected = is_protected
+        self._clock = clock
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.removed = 0
+        self.freed_bytes = 0
+
+    @staticmethod
+    def scan(path: str) -> List[Tuple[float, int, str]]:
+        """ (last use, size, path) of the regular files of a directory, least recently used first """
+        entries = []
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    try:
+                        if not entry.is_file(follow_symlinks=False):  # Also skips ipc sockets
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries.append((max(stat.st_mtime, stat.st_atime), stat.st_size, entry.path))
+        except FileNotFoundError:
+            return []
+        entries.sort()
+        return entries
+
+    def select(self, budget: CacheBudget, entries: List[Tuple[float, int, str]]) -> Tuple[list, int]:
+        """ Files to remove to satisfy the budget, oldest first
+        :return: The victims, and the number of live files that were spared
+        """
+        now = self._clock()
+        count = len(entries)
+        size = sum(entry[1] for entry in entries)
+        victims, kept = [], 0
+        for entry in entries:
+            last_use, file_size, path = entry
+            expired = budget.max_age and now - last_use > budget.max_age
+            over = (budget.max_files and count > budget.max_files) or (budget.max_bytes and size > budget.max_bytes)
+            if not expired and not over:
+                break  # The rest is newer, and the budgets hold
+            if self.is_protected(path):
+                kept += 1  # Still counts against the budget, the next file goes instead
+                continue
+            victims.append(entry)
+            count -= 1
+            size -= file_size
+        return victims, kept
+
+    def clean(self, budget: CacheBudget) -> Dict[str, int]:
+        """ One pass over a directory """
+        removed = freed = 0
+        victims, kept = self.select(budget, self.scan(budget.path))
+        for index, (_, file_size, path) in enumerate(victims):
+            if self._stop.is_set():
+                break
+            if index and index % self.batch_size == 0:
+                self._stop.wait(self.pause)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Could not remove {path}: {e}")
+                continue
+            removed += 1
+            freed += file_size
+        self.removed += removed
+        self.freed_bytes += freed
+        if removed:
+            print(f"Cleaned {budget.path}: removed {removed} files ({freed} bytes), kept {kept} live files")
+        return {"removed": removed, "freed_bytes": freed, "kept_live": kept}
+
+    def run_once(self) -> Dict[str, Dict[str, int]]:
+        return {budget.path: self.clean(budget) for budget in self.budgets}
+
+    def _run(self, delay: float, interval: float):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Directory cleaning failed: {e}")
+            if not interval or self._stop.wait(interval):
+                return
+
+    def start(self, delay: float = 5.0, interval: float = 0.0):
+        """ Clean in the background
+        :param delay: Seconds to wait first, so that the cleaning does not compete with the startup
+        :param interval: Seconds between two passes, 0 for a single pass
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(delay, interval), name="DirectoryCleaner", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
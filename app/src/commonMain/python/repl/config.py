@@ -1,11 +1,9 @@
 import os
-import time
-
-from jupyter_server import auth
-from jupyter_server.auth.identity import IdentityProvider
 
+from .cleaner import CacheBudget, DirectoryCleaner, DAY
 from .host import get_private_ip
-from . import kernel
+from .launch_cache import LaunchConfigCache, PASSWORD_PLACEHOLDER
+from . import readiness
 
 
 class REPLConfig:
@@ -14,53 +12,68 @@ class REPLConfig:
 
     LAB_ASSETS = os.path.join(os.path.dirname(__file__), "share", "jupyter", "lab")
     LAB_SPACE = os.path.join(os.environ['HOME'], "lab")
+    LAUNCH_CACHE = os.path.join(os.environ['HOME'], ".jupyter", "pyrepl", "launch.json")
+    LAB_ASSETS_CACHE = os.path.join(os.environ['HOME'], ".cache", "pyrepl", "lab")  # Precompressed LAB_ASSETS
+    WS_COMPRESSION_OPTIONS = {"compression_level": 6, "mem_level": 8}  # tornado permessage-deflate options
 
     @staticmethod
-    def clean_directory(target_directory):
-        # Get the current time
-        current_time = time.time()
-
-        if not os.path.isdir(target_directory):
-            return
-
-        # Iterate through all files in the target directory
-        for filename in os.listdir(target_directory):
-            file_path = os.path.join(target_directory, filename)
-
-            # Check if it is a file
-            if os.path.isfile(file_path):
-                # Get the file's creation time
-                creation_time = os.path.getctime(file_path)
+    def clean_directory(target_directory, max_age=3 * DAY, max_files=0, max_bytes=0):
+        """ Remove the expired and least recently used files of a directory now, keeping the files of live kernels """
+        return DirectoryCleaner([CacheBudget(target_directory, max_age, max_files, max_bytes)]).run_once()
 
-                # Check if the file is older than 3 days (3 days * 24 hours * 60 minutes * 60 seconds)
-                if (current_time - creation_time) > (3 * 24 * 60 * 60):
-                    # Delete the file
-                    os.remove(file_path)
-                    print(f"Deleted {file_path}")
+    def cache_budgets(self):
+        return [
+            CacheBudget(self.RUNTIME_DIR, max_age=3 * DAY, max_files=256, max_bytes=16 * 1024 * 1024),
+            CacheBudget(self.WORKSPACE_DIR, max_age=3 * DAY, max_files=64, max_bytes=16 * 1024 * 1024)
+        ]
 
     def __init__(
             self,
-            ip=get_private_ip(),
+            ip=None,
             port=55555,
             password="password",
-            token=IdentityProvider.token,
-            manager_class=kernel.InAppKernelManager,
-            cache_clean=False
+            token=None,
+            manager_class="repl.kernel.InAppKernelManager",
+            cache_clean=False,
+            kernel_pool_size=0,
+            cull_idle_timeout=0.0,
+            cull_rss_budget=0,
+            cull_snapshot=False,
+            transport="tcp",
+            coalesce_window=0.05,
+            cell_output_limit=0,
+            notebook_journal=True,
+            websocket_compression=True,
+            batch_window=0.0,
+            launch_cache=None
         ):
         self._LAB_PW = password
-        self._LAB_HOST = ip, port
-        self._LAB_TOKEN = token
-        self._KERNEL_MANAGER = manager_class.__module__ + "." + manager_class.__name__
+        self._LAB_HOST = ip, port  # The private ip is looked up on first use
+        self._LAB_TOKEN = token  # Generated on first use
+        self.manager = manager_class
+        self._KERNEL_POOL_SIZE = kernel_pool_size
+        self._CULL_IDLE_TIMEOUT = float(cull_idle_timeout)  # Seconds, 0 disables idle culling
+        self._CULL_RSS_BUDGET = cull_rss_budget  # Bytes, 0 disables memory culling
+        self._CULL_SNAPSHOT = cull_snapshot
+        self._KERNEL_TRANSPORT = transport  # "tcp" or "ipc" (Unix-domain sockets under RUNTIME_DIR)
+        self._COALESCE_WINDOW = float(coalesce_window)  # Seconds stream output is merged for, 0 disables it
+        self._CELL_OUTPUT_LIMIT = cell_output_limit  # Bytes of stream output per cell, 0 for no limit
+        self._NOTEBOOK_JOURNAL = notebook_journal  # Journal notebook saves in LAB_SPACE instead of rewriting them
+        self._WS_COMPRESSION = websocket_compression  # permessage-deflate for remote lab clients
+        self._BATCH_WINDOW = float(batch_window)  # Seconds kernel frames are batched into full packets, 0 disables it
+        self._launch_cache = LaunchConfigCache(launch_cache or self.LAUNCH_CACHE)
 
         if not os.path.isdir(self.LAB_SPACE):
             os.makedirs(self.LAB_SPACE)
 
-        if cache_clean:
-            self.clean_directory(self.RUNTIME_DIR)
-            self.clean_directory(self.WORKSPACE_DIR)
+        self.cleaner = None
+        if cache_clean:  # In the background, after the startup
+            self.cleaner = DirectoryCleaner(self.cache_budgets()).start()
 
     @property
     def ip(self):
+        if self._LAB_HOST[0] is None:
+            self._LAB_HOST = (get_private_ip(), self._LAB_HOST[1])
         return self._LAB_HOST[0]
 
     @ip.setter
@@ -75,6 +88,12 @@ class REPLConfig:
     def port(self, value):
         self._LAB_HOST = (self._LAB_HOST[0], value)
 
+    @property
+    def token(self):
+        if self._LAB_TOKEN is None:  # Kept in the launch cache, the lab URL stays the same across restarts
+            self._LAB_TOKEN = self._launch_cache.token()
+        return self._LAB_TOKEN
+
     @property
     def password(self):
         return self._LAB_PW
@@ -94,28 +113,180 @@ class REPLConfig:
         else:
             self._KERNEL_MANAGER = value.__module__ + "." + value.__name__
 
+    @property
+    def kernel_pool_size(self):
+        return self._KERNEL_POOL_SIZE
+
+    @kernel_pool_size.setter
+    def kernel_pool_size(self, value):
+        self._KERNEL_POOL_SIZE = value
+
+    @property
+    def cull_idle_timeout(self):
+        return self._CULL_IDLE_TIMEOUT
+
+    @cull_idle_timeout.setter
+    def cull_idle_timeout(self, value):
+        self._CULL_IDLE_TIMEOUT = float(value)
+
+    @property
+    def cull_rss_budget(self):
+        return self._CULL_RSS_BUDGET
+
+    @cull_rss_budget.setter
+    def cull_rss_budget(self, value):
+        self._CULL_RSS_BUDGET = value
+
+    @property
+    def cull_snapshot(self):
+        return self._CULL_SNAPSHOT
+
+    @cull_snapshot.setter
+    def cull_snapshot(self, value):
+        self._CULL_SNAPSHOT = value
+
+    @property
+    def transport(self):
+        return self._KERNEL_TRANSPORT
+
+    @transport.setter
+    def transport(self, value):
+        self._KERNEL_TRANSPORT = value
+
+    @property
+    def coalesce_window(self):
+        return self._COALESCE_WINDOW
+
+    @coalesce_window.setter
+    def coalesce_window(self, value):
+        self._COALESCE_WINDOW = float(value)
+
+    @property
+    def cell_output_limit(self):
+        return self._CELL_OUTPUT_LIMIT
+
+    @cell_output_limit.setter
+    def cell_output_limit(self, value):
+        self._CELL_OUTPUT_LIMIT = value
+
+    @property
+    def notebook_journal(self):
+        return self._NOTEBOOK_JOURNAL
+
+    @notebook_journal.setter
+    def notebook_journal(self, value):
+        self._NOTEBOOK_JOURNAL = value
+
+    @property
+    def websocket_compression(self):
+        return self._WS_COMPRESSION
+
+    @websocket_compression.setter
+    def websocket_compression(self, value):
+        self._WS_COMPRESSION = value
+
+    @property
+    def batch_window(self):
+        return self._BATCH_WINDOW
+
+    @batch_window.setter
+    def batch_window(self, value):
+        self._BATCH_WINDOW = float(value)
+
+    @property
+    def ready_file(self):
+        """ File the lab server publishes once it listens on this port """
+        return os.path.join(self.RUNTIME_DIR, f"pyrepl-lab-{self._LAB_HOST[1]}-ready.json")
+
+    def is_ready(self) -> bool:
+        """ Whether the lab server published readiness and accepts connections, without waiting """
+        return readiness.read_ready(self.ready_file) is not None and \
+            readiness.accepts_connections(self.ip, self._LAB_HOST[1])
+
+    def wait_until_ready(self, timeout: float = 30.0) -> bool:
+        """ Block until the lab server is ready
+        :param timeout: Seconds to wait at most
+        :return: False on timeout
+        """
+        return readiness.wait_for_ready(self.ready_file, self.ip, self._LAB_HOST[1], timeout) is not None
+
+    def health(self, timeout: float = 2.0) -> dict | None:
+        """ Ask the running lab server for its version
+        :return: {"version": ..., "latency": seconds}, None if it does not answer
+        """
+        return readiness.probe_health(f"http://{self.ip}:{self._LAB_HOST[1]}", timeout)
+
     @property
     def uri(self):
-        return f"http://{self._LAB_HOST[0]}:{self._LAB_HOST[1]}/lab?token={self._LAB_TOKEN}"
+        return f"http://{self.ip}:{self._LAB_HOST[1]}/lab?token={self.token}"
 
     @property
     def dict(self):
         return {
-            "ip": self._LAB_HOST[0],
+            "ip": self.ip,
             "port": self._LAB_HOST[1],
             "password": self._LAB_PW,
-            "token": str(self._LAB_TOKEN),
-            "manager": self._KERNEL_MANAGER
+            "token": str(self.token),
+            "manager": self._KERNEL_MANAGER,
+            "kernel_pool_size": self._KERNEL_POOL_SIZE,
+            "cull_idle_timeout": self._CULL_IDLE_TIMEOUT,
+            "cull_rss_budget": self._CULL_RSS_BUDGET,
+            "cull_snapshot": self._CULL_SNAPSHOT,
+            "transport": self._KERNEL_TRANSPORT,
+            "coalesce_window": self._COALESCE_WINDOW,
+            "cell_output_limit": self._CELL_OUTPUT_LIMIT,
+            "notebook_journal": self._NOTEBOOK_JOURNAL,
+            "websocket_compression": self._WS_COMPRESSION,
+            "batch_window": self._BATCH_WINDOW
         }
 
+    @staticmethod
+    def _hash_password(password):
+        from jupyter_server import auth
+
+        return auth.passwd(password)
+
     @property
     def list(self):
+        """ Server argv, reused from the launch cache while the configuration and the password are unchanged """
+        return self._launch_cache.get(
+            self._launch_fields, self._LAB_PW, lambda: self._list_template, self._hash_password
+        )
+
+    @property
+    def _launch_fields(self):
+        fields = {k: v for k, v in self.dict.items() if k != "password"}  # The password is keyed on its own
+        fields.update(
+            runtime_dir=self.RUNTIME_DIR, lab_assets=self.LAB_ASSETS, lab_space=self.LAB_SPACE,
+            lab_assets_cache=self.LAB_ASSETS_CACHE, ws_compression_options=self.WS_COMPRESSION_OPTIONS
+        )
+        return fields
+
+    @property
+    def _list_template(self):
         return [
-            f"--ip={self._LAB_HOST[0]}", f"--port={self._LAB_HOST[1]}",
+            f"--ip={self.ip}", f"--port={self._LAB_HOST[1]}",
             f"--app-dir={self.LAB_ASSETS}",  f"--notebook-dir={self.LAB_SPACE}",
-            f"--IdentityProvider.token={self._LAB_TOKEN}",  # Token is automatically disabled when password is set
-            f"--PasswordIdentityProvider.hashed_password={auth.passwd(self._LAB_PW)}",
+            f"--IdentityProvider.token={self.token}",  # Token is automatically disabled when password is set
+            f"--PasswordIdentityProvider.hashed_password={PASSWORD_PLACEHOLDER}",
             f"--MultiKernelManager.kernel_manager_class={self._KERNEL_MANAGER}",
+            f"--InAppLocalPrivateProvisioner.pool_size={self._KERNEL_POOL_SIZE}",
+            "--ServerApp.kernel_manager_class=repl.kernel.InAppMappingKernelManager",
+            f"--InAppMappingKernelManager.lru_idle_timeout={self._CULL_IDLE_TIMEOUT}",
+            f"--InAppMappingKernelManager.rss_budget={self._CULL_RSS_BUDGET}",
+            f"--InAppMappingKernelManager.snapshot_before_evict={self._CULL_SNAPSHOT}",
+            f"--InAppLocalPrivateProvisioner.transport={self._KERNEL_TRANSPORT}",
+            f"--InAppLocalPrivateProvisioner.ipc_dir={self.RUNTIME_DIR}",
+            "--ServerApp.kernel_websocket_connection_class=repl.kernel.CoalescingWebsocketConnection",
+            f"--CoalescingWebsocketConnection.coalesce_window={self._COALESCE_WINDOW}",
+            f"--CoalescingWebsocketConnection.cell_output_limit={self._CELL_OUTPUT_LIMIT}",
+            f"--CoalescingWebsocketConnection.batch_window={self._BATCH_WINDOW}",
+            "--ServerApp.websocket_compression_options="
+            f"{self.WS_COMPRESSION_OPTIONS if self._WS_COMPRESSION else None}",  # None disables it
+            "--ServerApp.contents_manager_class=repl.contents.JournalContentsManager",
+            f"--JournalContentsManager.journal_notebooks={self._NOTEBOOK_JOURNAL}",
+            f"--REPLLabApp.ready_file={self.ready_file}",
+            f"--REPLLabApp.assets_cache_dir={self.LAB_ASSETS_CACHE}",
             "--ServerApp.allow_remote_access=True",
             "--no-browser"
         ]
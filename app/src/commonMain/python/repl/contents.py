@@ -0,0 +1,174 @@
+""" Contents manager of LAB_SPACE that journals notebook saves
+
+Autosaves append the changed cells to a NotebookJournal instead of rewriting the whole .ipynb, and the journals are
+compacted to the canonical .ipynb periodically, before the file is read as a plain file, copied, renamed or
+checkpointed, and when the server stops. Notebook reads replay the journal, so clients see the saved notebook.
+"""
+from __future__ import annotations
+
+from typing import Dict
+from datetime import datetime, timezone
+import asyncio
+import glob
+import json
+import os
+
+import nbformat
+from tornado.ioloop import PeriodicCallback
+from traitlets import Bool, Float, Integer, Unicode
+from jupyter_server.services.contents.largefilemanager import AsyncLargeFileManager
+
+from .journal import NotebookJournal
+
+
+__all__ = ["JournalContentsManager"]
+
+
+class JournalContentsManager(AsyncLargeFileManager):
+    """ AsyncLargeFileManager that writes notebook saves to append-only journals """
+    journal_notebooks = Bool(True, config=True, help="Journal notebook saves instead of rewriting the .ipynb")
+    journal_dir = Unicode("", config=True, help="Directory of the journals, .ipynb_journal in the root by default")
+    inline_output_limit = Integer(
+        16 * 1024, config=True, help="Serialized size from which an output is stored out of line, deduplicated"
+    )
+    compact_every = Integer(50, config=True, help="Saves after which a journal is compacted into the .ipynb")
+    compact_bytes = Integer(8 * 1024 * 1024, config=True, help="Journal size after which it is compacted")
+    compact_interval = Float(120.0, config=True, help="Seconds after which a pending journal is compacted")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._journals: Dict[str, NotebookJournal] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._compactor: PeriodicCallback | None = None
+
+    @property
+    def _journal_dir(self) -> str:
+        return self.journal_dir or os.path.join(self.root_dir, ".ipynb_journal")
+
+    def _journal(self, os_path: str) -> NotebookJournal:
+        journal = self._journals.get(os_path)
+        if journal is None:
+            journal = self._journals[os_path] = NotebookJournal(
+                os_path, self._journal_dir, self.inline_output_limit, self.log
+            )
+            self._locks[os_path] = asyncio.Lock()
+        return journal
+
+    def _pending(self, os_path: str) -> bool:
+        return os_path.endswith(".ipynb") and self._journal(os_path).pending  # Also replays one of an earlier run
+
+    async def _save_notebook(self, os_path, nb, capture_validation_error=None):
+        if not self.journal_notebooks or not os.path.exists(os_path):  # A new notebook is written in full
+            if os_path in self._journals:
+                self._journals[os_path].discard()
+            return await super()._save_notebook(os_path, nb, capture_validation_error)
+
+        try:  # As nbformat.write would
+            nbformat.validate(nb)
+        except nbformat.ValidationError as e:
+            self.log.error(f"Notebook JSON is invalid: {e}")
+            if isinstance(capture_validation_error, dict):
+                capture_validation_error["ValidationError"] = e
+        journal = self._journal(os_path)
+        async with self._locks[os_path]:
+            await asyncio.to_thread(journal.append, nb)
+        if journal.due(self.compact_every, self.compact_bytes, self.compact_interval):
+            await self.compact(os_path)
+        self._start_compactor()
+
+    async def _read_notebook(self, os_path, as_version=4, capture_validation_error=None, raw: bool = False):
+        if not self._pending(os_path):
+            return await super()._read_notebook(os_path, as_version, capture_validation_error, raw)
+        journal = self._journal(os_path)
+        async with self._locks[os_path]:
+            text = nbformat.writes(nbformat.from_dict(journal.notebook()), version=nbformat.NO_CONVERT)
+        nb = nbformat.reads(text, as_version=as_version, capture_validation_error=capture_validation_error)
+        return (nb, text.encode("utf-8")) if raw else nb
+
+    async def _read_file(self, os_path, format, raw: bool = False):
+        if self._pending(os_path):  # Read as a plain file (download, /files), bring the .ipynb up to date first
+            await self.compact(os_path)
+        return await super()._read_file(os_path, format, raw)
+
+    def _base_model(self, path):
+        model = super()._base_model(path)
+        os_path = self._get_os_path(path)
+        if self._pending(os_path):  # Saved when the journal was, not when the .ipynb was last compacted
+            journal = self._journal(os_path)
+            try:
+                journaled = datetime.fromtimestamp(os.stat(journal.path).st_mtime, tz=timezone.utc)
+                model["last_modified"] = max(model["last_modified"], journaled)
+            except FileNotFoundError:
+                pass
+        return model
+
+    async def compact(self, os_path: str):
+        """ Write the journaled notebook to the .ipynb and start the journal over """
+        journal = self._journal(os_path)
+        async with self._locks[os_path]:
+            if not journal.pending:
+                return
+            nb = nbformat.from_dict(journal.notebook())
+            saved = os.stat(journal.path).st_mtime_ns
+            await super()._save_notebook(os_path, nb)
+            os.utime(os_path, ns=(saved, saved))  # Keeps last_modified as the clients saw it, no "changed on disk"
+            journal.compacted()
+        self.log.debug(f"Compacted the notebook journal of {os_path}")
+
+    async def compact_all(self):
+        """ Compact every pending journal, including those left by an earlier run """
+        for path in glob.glob(os.path.join(self._journal_dir, "*.jsonl")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    os_path = json.loads(f.readline())["path"]
+            except (OSError, ValueError, KeyError):
+                continue
+            self._journal(os_path)
+        for os_path in list(self._journals):
+            try:
+                await self.compact(os_path)
+            except Exception as e:
+                self.log.error(f"Could not compact the notebook journal of {os_path}: {e}")
+
+    def _start_compactor(self):
+        if self._compactor is None:
+            self._compactor = PeriodicCallback(self._compact_due, self.compact_interval * 1000 / 4)
+            self._compactor.start()
+
+    async def _compact_due(self):
+        for os_path, journal in list(self._journals.items()):
+            if journal.due(self.compact_every, self.compact_bytes, self.compact_interval):
+                await self.compact(os_path)
+
+    async def _settle(self, path: str, drop: bool):
+        """ Compact the journals of a file or of the notebooks under a directory, and forget them if dropped """
+        os_path = self._get_os_path(path.strip("/"))
+        if os_path.endswith(".ipynb"):
+            self._journal(os_path)  # May have been left by an earlier run
+        for journaled in [p for p in self._journals if p == os_path or p.startswith(os_path + os.sep)]:
+            if drop:
+                self._journals.pop(journaled).discard()
+                self._locks.pop(journaled, None)
+            else:
+                await self.compact(journaled)
+
+    async def delete_file(self, path):
+        await self._settle(path, drop=True)
+        return await super().delete_file(path)
+
+    async def rename_file(self, old_path, new_path):
+        await self._settle(old_path, drop=False)
+        await self._settle(old_path, drop=True)
+        return await super().rename_file(old_path, new_path)
+
+    async def copy(self, from_path, to_path=None):
+        await self._settle(from_path, drop=False)
+        return await super().copy(from_path, to_path)
+
+    async def create_checkpoint(self, path):
+        await self._settle(path, drop=False)
+        return await super().create_checkpoint(path)
+
+    async def restore_checkpoint(self, checkpoint_id, path):
+        await self._settle(path, drop=True)
+        return await super().restore_checkpoint(checkpoint_id, path)
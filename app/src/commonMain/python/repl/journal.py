@@ -0,0 +1,248 @@
+""" Append-only save journal of a notebook
+
+A save appends one record with the hashes of the cells in order and the bodies of the cells that the journal does not
+know yet. Outputs above the inline limit are stored out of line in content-addressed blobs, so a plot or a dataframe
+that survives a save is written once. The notebook is the canonical .ipynb (the base) plus the replayed records;
+compaction writes it back to the .ipynb and starts over. An .ipynb changed by someone else invalidates the journal.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+import logging
+import hashlib
+import shutil
+import json
+import time
+import os
+
+import nbformat
+
+
+__all__ = ["NotebookJournal"]
+
+JOURNAL_VERSION = 1
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _stamp(path: str) -> List[int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class NotebookJournal:
+    """ Save journal of one notebook file """
+
+    def __init__(
+            self, os_path: str, journal_dir: str, inline_limit: int = 16 * 1024, log: logging.Logger | None = None
+    ):
+        """
+        :param os_path: The canonical .ipynb
+        :param inline_limit: Serialized size of an output from which it is stored out of line
+        :param log: Logger of the contents manager
+        """
+        self.log = log or logging.getLogger(__name__)
+        self.os_path = os_path
+        key = _digest(os.path.abspath(os_path).encode())
+        self.path = os.path.join(journal_dir, key + ".jsonl")
+        self.blob_dir = os.path.join(journal_dir, key + ".blobs")
+        self.inline_limit = inline_limit
+        self.cells: Dict[str, Dict[str, Any]] = {}  # Cell hash -> cell, of the base and the records
+        self.latest: Dict[str, Any] | None = None  # Last record
+        self.base: List[int] | None = None  # Stamp (mtime, size) of the .ipynb the cells were seeded from
+        self.records = 0
+        self.journal_bytes = 0
+        self.since = time.monotonic()  # Of the first record not compacted yet
+        self._loaded = False
+
+    @property
+    def pending(self) -> bool:
+        """ Whether the .ipynb is behind the journal """
+        self.load()
+        if self.records and self.base != _stamp(self.os_path):
+            self.discard()  # Written by someone else meanwhile, the .ipynb wins
+        return self.records > 0
+
+    def _blob_path(self, blob_hash: str) -> str:
+        return os.path.join(self.blob_dir, blob_hash)
+
+    def _split(self, cell: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Dict[str, bytes]]:
+        """ Move the large outputs of a cell out of line
+        :return: The cell hash, the cell as stored and the blobs it refers to
+        """
+        blobs = {}
+        outputs = cell.get("outputs")
+        if outputs:
+            stored_outputs = []
+            for output in outputs:
+                data = _canonical(output)
+                if len(data) >= self.inline_limit:
+                    blob_hash = _digest(data)
+                    blobs[blob_hash] = data
+                    stored_outputs.append({"$blob": blob_hash})
+                else:
+                    stored_outputs.append(output)
+            cell = {**cell, "outputs": stored_outputs}
+        return _digest(_canonical(cell)), cell, blobs
+
+    def _join(self, stored: Dict[str, Any]) -> Dict[str, Any]:
+        """ The cell with its out-of-line outputs read back """
+        outputs = stored.get("outputs")
+        if not outputs or not any("$blob" in output for output in outputs):
+            return stored
+        joined = []
+        for output in outputs:
+            if "$blob" in output:
+                with open(self._blob_path(output["$blob"]), "rb") as f:
+                    output = json.loads(f.read())
+            joined.append(output)
+        return {**stored, "outputs": joined}
+
+    def _read_base(self) -> Dict[str, Any] | None:
+        try:
+            with open(self.os_path, encoding="utf-8") as f:
+                return nbformat.read(f, as_version=nbformat.NO_CONVERT)  # Joins the multiline strings, as saves have
+        except (OSError, ValueError):
+            return None
+
+    def _seed(self):
+        self.base = _stamp(self.os_path)
+        self.cells = {}
+        for cell in (self._read_base() or {}).get("cells", []):
+            self.cells[self._split(cell)[0]] = cell
+
+    def load(self):
+        """ Replay the journal once; a journal whose base changed is discarded """
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = {}
+        if header.get("version") != JOURNAL_VERSION or header.get("base") != _stamp(self.os_path):
+            self.discard()  # Written by someone else since, the .ipynb wins
+            return
+
+        self._seed()
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:  # Torn by a crash while appending, the previous records stand
+                break
+            try:
+                for cell_hash, stored in record["new"].items():
+                    self.cells[cell_hash] = self._join(stored)
+            except OSError as e:
+                self.log.warning(f"Notebook journal {self.path} is missing an output ({e}), dropped")
+                self.discard()
+                return
+            self.latest = record
+            self.records += 1
+        self.journal_bytes = sum(len(line) for line in lines)
+
+    def append(self, nb: Dict[str, Any]) -> int:
+        """ Journal a save
+        :return: Bytes written
+        """
+        self.load()
+        written = 0
+        if self.base != _stamp(self.os_path):  # Never seeded, or the .ipynb was written by someone else
+            self.discard()
+            self._seed()
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            header = {"version": JOURNAL_VERSION, "path": self.os_path, "base": self.base}
+            with open(self.path, "w", encoding="utf-8") as f:
+                written += f.write(json.dumps(header) + "\n")
+            self.since = time.monotonic()
+
+        order, new = [], {}
+        for cell in nb["cells"]:
+            cell_hash, stored, blobs = self._split(cell)
+            order.append(cell_hash)
+            if cell_hash in self.cells or cell_hash in new:
+                continue
+            for blob_hash, data in blobs.items():
+                path = self._blob_path(blob_hash)
+                if not os.path.exists(path):  # Deduplicated by content
+                    os.makedirs(self.blob_dir, exist_ok=True)
+                    with open(path, "wb") as f:
+                        written += f.write(data)
+            new[cell_hash] = stored
+            self.cells[cell_hash] = cell
+
+        record = {
+            "time": time.time(),
+            "metadata": nb.get("metadata", {}),
+            "nbformat": nb.get("nbformat", 4),
+            "nbformat_minor": nb.get("nbformat_minor", 0),
+            "cells": order,
+            "new": new
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            written += f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        if not self.records:
+            self.since = time.monotonic()
+        self.latest = record
+        self.records += 1
+        self.journal_bytes += written
+        return written
+
+    def notebook(self) -> Dict[str, Any]:
+        """ The notebook as of the last record """
+        self.load()
+        record = self.latest
+        return {
+            "cells": [self.cells[cell_hash] for cell_hash in record["cells"]],
+            "metadata": record["metadata"],
+            "nbformat": record["nbformat"],
+            "nbformat_minor": record["nbformat_minor"]
+        }
+
+    def compacted(self):
+        """ Start over once the .ipynb holds the notebook of the last record """
+        if self.latest is not None:
+            self.cells = {cell_hash: self.cells[cell_hash] for cell_hash in self.latest["cells"]}
+        self.base = _stamp(self.os_path)
+        self._remove_files()
+        self.latest = None
+        self.records = 0
+        self.journal_bytes = 0
+
+    def discard(self):
+        """ Drop the journal, the .ipynb is the notebook """
+        self._remove_files()
+        self.base = None
+        self.cells = {}
+        self.latest = None
+        self.records = 0
+        self.journal_bytes = 0
+
+    def _remove_files(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        shutil.rmtree(self.blob_dir, ignore_errors=True)
+
+    def due(self, every: int, max_bytes: int, interval: float) -> bool:
+        """ Whether the journal should be compacted """
+        if not self.records:
+            return False
+        return self.records >= every or self.journal_bytes >= max_bytes or time.monotonic() - self.since >= interval
@@ -1,2 +1,46 @@
-from .kernel import *
-from .kernel_android import *
+from .pool import *
+from .monitor import *
+from .slots import *
+from .capture import *
+from .template import *
+from .interrupt import *
+from .cooperative import *
+from .transport import *
+from .phases import *
+from .culling import *
+
+import importlib
+
+
+# Heavy modules (Jupyter server stack, Android bridge) are imported on the first use of one of their names,
+#  so that the kernel service processes and the app's main module do not pay for them.
+#  A name listed with several modules comes from the first one of them that exists on the platform.
+_LAZY_NAMES = {
+    "prepare_kernel": (".service",),
+    "prewarm_kernel": (".service",),
+    "start_kernel": (".service",),
+    "start_ui_thread_kernel": (".service",),
+    "interrupt_kernel": (".service",),
+    "InAppKernelManager": (".kernel_android", ".kernel"),
+    "InAppMappingKernelManager": (".kernel_android",),
+    "UIThreadKernelManager": (".kernel_android", ".kernel"),
+    "AndroidKernelLauncher": (".kernel_android",),
+    "InAppLocalPrivateProvisioner": (".kernel_android",),
+    "process_table": (".kernel_android",),
+    "StreamCoalescer": (".coalesce",),
+    "FrameBatcher": (".coalesce",),
+    "CoalescingWebsocketConnection": (".coalesce",),
+}
+
+
+def __getattr__(name):
+    for module_name in _LAZY_NAMES.get(name, ()):
+        try:
+            module = importlib.import_module(module_name, __name__)
+        except ModuleNotFoundError as e:
+            if e.name != __name__ + module_name:  # The module is there, one of its imports is not
+                raise
+            continue
+        value = globals()[name] = getattr(module, name)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,245 @@
+""" Benchmark suite of the kernel subsystem
+
+Runs on a Linux host against StandInProvisioner, which launches kernels the way InAppLocalPrivateProvisioner does
+(through a KernelProcessPool, with the same launch phase events) but as plain subprocesses:
+
+    python bench.py [--runs N] [--pool-size N] [--output FILE]
+
+Covers cold start, warm start, execute latency percentiles, iopub throughput, interrupt latency and shutdown time.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import time
+import json
+import os
+
+from jupyter_client import AsyncKernelManager
+from jupyter_client.provisioning import LocalProvisioner, KernelProvisionerFactory
+
+try:
+    from .pool import SubprocessKernelLauncher, KernelProcessPool
+    from .slots import SlotAllocator
+    from .phases import LaunchTrace, LAUNCH_PHASES, subscribe, unsubscribe, start_kernel_info_trace
+except ImportError:  # Running as a script, without the Android bridge of the repl package
+    from pool import SubprocessKernelLauncher, KernelProcessPool
+    from slots import SlotAllocator
+    from phases import LaunchTrace, LAUNCH_PHASES, subscribe, unsubscribe, start_kernel_info_trace
+
+
+STAND_IN_PROVISIONER = "repl-stand-in-provisioner"
+
+
+class StandInProvisioner(LocalProvisioner):
+    """ InAppLocalPrivateProvisioner stand-in that runs the kernels as subprocesses """
+    slots = SlotAllocator(10)
+    pool: KernelProcessPool | None = None
+    launch_timeout = 30
+
+    @classmethod
+    def get_pool(cls, size: int) -> KernelProcessPool:
+        if cls.pool is None:
+            launcher = SubprocessKernelLauncher()
+            launcher.start_timeout = cls.launch_timeout
+            cls.pool = KernelProcessPool(launcher, size, cls.slots.acquire, cls.slots.release)
+        elif cls.pool.size != size:
+            cls.pool.resize(size)
+        return cls.pool
+
+    async def pre_launch(self, **kwargs: Any) -> Dict[str, Any]:
+        self.launch_trace = LaunchTrace(self.kernel_id)
+        kwargs = await super().pre_launch(**kwargs)
+        self.launch_trace.mark("connection_file_ready")
+        return kwargs
+
+    async def launch_kernel(self, cmd: List[str], **kwargs: Any):
+        pool = self.pool or self.get_pool(0)
+        hits = pool.hits
+        kernel = pool.claim(kwargs.get("cwd"), cmd[-1])
+        self.launch_trace.mark("intent_sent", warm=pool.hits > hits)
+        await asyncio.wait_for(asyncio.wrap_future(kernel.ready), self.launch_timeout)
+        self.launch_trace.mark("process_visible", pid=kernel.pid)
+        self.kernel = kernel
+        self.process = kernel.process
+        self.pid = kernel.pid
+        self.pgid = os.getpgid(kernel.pid)
+        return self.connection_info
+
+    async def post_launch(self, **kwargs: Any) -> None:
+        await super().post_launch(**kwargs)
+        self.kernel_info_task = start_kernel_info_trace(self.parent, self.launch_trace)
+
+    async def cleanup(self, restart: bool = False) -> None:
+        await super().cleanup(restart)
+        if not restart and getattr(self, "kernel", None) is not None:
+            self.slots.release(self.kernel.slot)
+            self.kernel = None
+
+
+class _EntryPoint:
+    """ Registers a provisioner class without installing an entry point """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.name = STAND_IN_PROVISIONER
+
+    def load(self) -> type:
+        return self.cls
+
+
+def use_stand_in_provisioner():
+    factory = KernelProvisionerFactory.instance()
+    factory.provisioners[STAND_IN_PROVISIONER] = _EntryPoint(StandInProvisioner)
+    factory.default_provisioner_name = STAND_IN_PROVISIONER
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """ Milliseconds percentiles """
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def percentile(p: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return {
+        "n": len(values), "min": values[0] * 1000, "p50": percentile(0.5), "p90": percentile(0.9),
+        "p99": percentile(0.99), "max": values[-1] * 1000
+    }
+
+
+class KernelBenchmark:
+    def __init__(self, runs: int = 5, executes: int = 200, payload_size: int = 1 << 20, payloads: int = 20,
+                 timeout: float = 30):
+        self.runs = runs
+        self.executes = executes
+        self.payload_size = payload_size
+        self.payloads = payloads
+        self.timeout = timeout
+        self.phase_events: List[Dict[str, Any]] = []
+
+    async def _start(self):
+        manager = AsyncKernelManager()
+        begin = time.perf_counter()
+        await manager.start_kernel()
+        client = manager.client()
+        client.start_channels()
+        try:
+            await client.wait_for_ready(timeout=self.timeout)
+        except Exception:
+            await self._stop(manager, client)
+            raise
+        return manager, client, time.perf_counter() - begin
+
+    async def _stop(self, manager, client) -> float:
+        client.stop_channels()
+        begin = time.perf_counter()
+        await manager.shutdown_kernel()
+        return time.perf_counter() - begin
+
+    async def start_times(self, pool_size: int) -> tuple[List[float], List[float]]:
+        """ Time until the kernel answers kernel_info, and shutdown time """
+        starts, stops = [], []
+        for _ in range(self.runs):
+            pool = StandInProvisioner.get_pool(pool_size)
+            if pool_size:
+                await asyncio.to_thread(pool.refill, True)
+            manager, client, elapsed = await self._start()
+            starts.append(elapsed)
+            stops.append(await self._stop(manager, client))
+        return starts, stops
+
+    async def session(self) -> Dict[str, Any]:
+        """ Execute latency, iopub throughput and interrupt latency on one kernel """
+        StandInProvisioner.get_pool(0)
+        manager, client, _ = await self._start()
+        try:
+            latencies = []
+            for _ in range(self.executes):
+                begin = time.perf_counter()
+                await client.execute_interactive("", store_history=False, timeout=self.timeout,
+                                                 output_hook=lambda msg: None)
+                latencies.append(time.perf_counter() - begin)
+
+            received = 0
+
+            def count(msg):
+                nonlocal received
+                if msg["msg_type"] == "stream":
+                    received += len(msg["content"]["text"])
+
+            code = "\n".join([
+                "import sys",
+                f"for _ in range({self.payloads}):",
+                f"    sys.stdout.write('x' * {self.payload_size}); sys.stdout.flush()",
+            ])
+            begin = time.perf_counter()
+            await client.execute_interactive(code, store_history=False, timeout=self.timeout, output_hook=count)
+            throughput = received / (time.perf_counter() - begin) / 2 ** 20
+
+            interrupts = []
+            for _ in range(self.runs):
+                msg_id = client.execute("while True: pass")
+                while True:  # Wait until the cell is running
+                    msg = await client.get_iopub_msg(timeout=self.timeout)
+                    if msg["parent_header"].get("msg_id") == msg_id and msg["msg_type"] == "execute_input":
+                        break
+                await asyncio.sleep(0.05)
+                begin = time.perf_counter()
+                await manager.interrupt_kernel()
+                while True:
+                    reply = await client.get_shell_msg(timeout=self.timeout)
+                    if reply["parent_header"].get("msg_id") == msg_id:
+                        break
+                interrupts.append(time.perf_counter() - begin)
+        finally:
+            await self._stop(manager, client)
+        return {
+            "execute_ms": summarize(latencies),
+            "iopub_mib_per_s": throughput,
+            "interrupt_ms": summarize(interrupts)
+        }
+
+    def phases(self) -> Dict[str, Dict[str, float]]:
+        """ Launch phase timings, seconds since the launch began """
+        return {
+            phase: summarize([event["elapsed"] for event in self.phase_events if event["phase"] == phase])
+            for phase in LAUNCH_PHASES
+        }
+
+    async def run(self, pool_size: int = 1) -> Dict[str, Any]:
+        use_stand_in_provisioner()
+        subscribe(self.phase_events.append)
+        try:
+            cold, cold_stops = await self.start_times(0)
+            warm, warm_stops = await self.start_times(pool_size)
+            results = {
+                "cold_start_ms": summarize(cold),
+                "warm_start_ms": summarize(warm),
+                "shutdown_ms": summarize(cold_stops + warm_stops),
+                **await self.session()
+            }
+            await asyncio.sleep(0.5)  # Let the last kernel_info traces land
+            results["launch_phases_ms"] = self.phases()
+            return results
+        finally:
+            unsubscribe(self.phase_events.append)
+            if StandInProvisioner.pool is not None:
+                StandInProvisioner.pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--executes", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file as well")
+    args = parser.parse_args()
+
+    report = asyncio.run(KernelBenchmark(args.runs, args.executes).run(args.pool_size))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from typing import Iterator
+import threading
+import mmap
+import time
+import io
+import os
+
+
+__all__ = ["CAPTURE_DIR", "capture_dir", "StreamCapture", "CaptureReader"]
+
+
+CAPTURE_DIR = os.path.join(os.environ['HOME'], ".jupyter", "lab", "logs")
+
+
+def capture_dir(slot: int | str) -> str:
+    """ Directory holding the captured stdio of the kernel in the slot """
+    return os.path.join(CAPTURE_DIR, f"kernel{slot}")
+
+
+def _segment_name(name: str, start: int) -> str:
+    return f"{name}.{start:016d}.log"
+
+
+def _list_segments(directory: str, name: str) -> list[tuple[int, str]]:
+    """ Segments of a stream ordered by their start offset """
+    segments = []
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return segments
+    with entries:
+        for entry in entries:
+            stream, _, rest = entry.name.partition(".")
+            start, _, ext = rest.partition(".")
+            if stream == name and ext == "log" and start.isdigit():
+                segments.append((int(start), entry.path))
+    segments.sort()
+    return segments
+
+
+class StreamCapture(io.TextIOBase):
+    """ Size-capped capture of a text stream in rotating segment files
+    Offsets are counted over the whole stream, so a reader can resume from where it stopped even after rotations.
+    Only the newest `segments` files are kept, so the capture never takes more than segment_size * segments bytes.
+    Segments are cut at exact byte offsets, a character can be split between two of them.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            name: str,
+            segment_size: int = 1024 * 1024,
+            segments: int = 4,
+            buffer_size: int = 8192,
+            encoding: str = "utf-8"
+    ):
+        super().__init__()
+        self.directory = directory
+        self.name = name
+        self.segment_size = segment_size
+        self.segments = segments
+        self.buffer_size = buffer_size
+        self._encoding = encoding
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        for _, path in _list_segments(directory, name):  # A new kernel starts a new capture
+            os.remove(path)
+        self._offset = 0
+        self._segment_start = 0
+        self._file = self._open_segment()
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    @property
+    def offset(self) -> int:
+        """ Number of bytes written to the stream so far """
+        return self._offset
+
+    def writable(self):
+        return True
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, _segment_name(self.name, self._segment_start))
+        return open(path, "ab", buffering=self.buffer_size)
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_start = self._offset
+        self._file = self._open_segment()
+        for _, path in _list_segments(self.directory, self.name)[:-self.segments]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def write(self, s: str) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed capture.")
+        data = memoryview(s.encode(self._encoding, errors="replace"))
+        with self._lock:
+            while data:  # Split at the segment boundaries, a long write rotates as many times as it needs
+                room = self.segment_size - (self._offset - self._segment_start)
+                if room <= 0:
+                    self._rotate()
+                    continue
+                chunk, data = data[:room], data[room:]
+                self._file.write(chunk)
+                self._offset += len(chunk)
+        return len(s)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        if not self.closed:
+            with self._lock:
+                self._file.close()
+        super().close()
+
+
+class CaptureReader:
+    """ Reads a captured stream from any offset without loading whole segment files """
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+
+    @property
+    def start(self) -> int:
+        """ Oldest offset that is still available """
+        segments = _list_segments(self.directory, self.name)
+        return segments[0][0] if segments else 0
+
+    def read(self, offset: int = 0, size: int = 65536) -> tuple[bytes, int]:
+        """ Read up to size bytes from the offset
+        If the offset was already rotated away, reading continues from the oldest available offset.
+        :return: The data and the offset to continue from
+        """
+        segments = _list_segments(self.directory, self.name)
+        chunks = []
+        for index, (start, path) in enumerate(segments):
+            end = segments[index + 1][0] if index + 1 < len(segments) else None
+            if end is not None and end <= offset:
+                continue
+            offset = max(offset, start)
+            try:
+                with open(path, "rb") as f:
+                    length = os.fstat(f.fileno()).st_size
+                    if length <= offset - start:
+                        continue
+                    with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as view:
+                        chunk = view[offset - start:offset - start + size]
+            except (FileNotFoundError, ValueError):
+                continue  # Rotated away or still empty
+            chunks.append(chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+            if size <= 0 or (end is not None and offset < end):
+                break
+        return b"".join(chunks), offset
+
+    def follow(self, offset: int = 0, interval: float = 0.5) -> Iterator[bytes]:
+        """ Yield new data as it is written, like `tail -f` """
+        while True:
+            data, offset = self.read(offset)
+            if data:
+                yield data
+            else:
+                time.sleep(interval)
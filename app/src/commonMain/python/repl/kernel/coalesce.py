@@ -0,0 +1,282 @@
+""" Server-side coalescing of iopub stream output
+
+A cell that prints in a tight loop makes the kernel publish one stream message per write. Forwarding each of them
+to the browser costs a serialization, a signature and a websocket frame, so consecutive stream messages of the same
+cell and stream are merged within a time/size window before they are forwarded, and the output of a cell can be
+capped with a truncation marker. Optionally, the frames written within a small window are batched into full TCP
+segments (TCP_CORK) instead of leaving one packet per kernel message.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Tuple
+import socket
+import time
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+from traitlets import Float, Integer
+from jupyter_server.services.kernels.connection.channels import ZMQChannelsWebsocketConnection
+from jupyter_server.services.kernels.connection.base import serialize_msg_to_ws_v1
+
+
+__all__ = ["StreamCoalescer", "FrameBatcher", "CoalescingWebsocketConnection"]
+
+TRUNCATION_MARKER = "\n[Output truncated: this cell exceeded {limit} bytes of output, the rest is dropped]\n"
+
+
+class StreamCoalescer:
+    """ Merges consecutive stream messages per (parent, name) and caps the output of every cell
+    Messages go in through feed() and come out, in order, from feed() and flush().
+    """
+
+    def __init__(
+            self,
+            window: float = 0.05,
+            max_bytes: int = 64 * 1024,
+            cell_limit: int = 0,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        :param window: Seconds a stream message may be held back to merge the following ones into it
+        :param max_bytes: Size of a merged message above which it is forwarded right away
+        :param cell_limit: Bytes of stream output per cell, 0 for no limit
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self.cell_limit = cell_limit
+        self._clock = clock
+        self._pending: Dict[str, Any] | None = None
+        self._pending_key: Tuple[str, str] | None = None
+        self._pending_since = 0.0
+        self._pending_parts: List[str] = []
+        self._pending_size = 0
+        self._cell_bytes: Dict[str, int] = {}
+        self.received = 0  # Stream messages fed
+        self.forwarded = 0  # Stream messages that came out
+        self.truncated_bytes = 0
+
+    @property
+    def saved(self) -> int:
+        """ Number of stream messages that were not forwarded """
+        return self.received - self.forwarded
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "saved": self.saved,
+            "truncated_bytes": self.truncated_bytes
+        }
+
+    @property
+    def pending(self) -> bool:
+        return self._pending is not None
+
+    @staticmethod
+    def is_stream(msg_type: str) -> bool:
+        return msg_type == "stream"
+
+    def _cap(self, parent_id: str, text: str) -> str:
+        """ Cut the text to the remaining output budget of the cell """
+        if not self.cell_limit:
+            return text
+        used = self._cell_bytes.get(parent_id, 0)
+        if used > self.cell_limit:  # Already truncated
+            self.truncated_bytes += len(text)
+            return ""
+        remaining = self.cell_limit - used
+        self._cell_bytes[parent_id] = used + len(text)
+        if len(text) <= remaining:
+            return text
+        self._cell_bytes[parent_id] = self.cell_limit + 1
+        self.truncated_bytes += len(text) - remaining
+        return text[:remaining] + TRUNCATION_MARKER.format(limit=self.cell_limit)
+
+    def feed(self, msg: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ Take an iopub message
+        :return: The messages to forward now
+        """
+        if not self.is_stream(msg["header"]["msg_type"]):
+            out = self.flush()
+            if msg["header"]["msg_type"] == "status" and msg["content"].get("execution_state") == "idle":
+                self._cell_bytes.pop(msg["parent_header"].get("msg_id"), None)  # The cell is done
+            return out + [msg]
+
+        self.received += 1
+        parent_id = msg["parent_header"].get("msg_id", "")
+        key = parent_id, msg["content"].get("name", "stdout")
+        text = self._cap(parent_id, msg["content"].get("text", ""))
+
+        out = []
+        if self._pending is not None and (key != self._pending_key or self._expired()):
+            out = self.flush()
+        if not text:
+            return out
+
+        if self._pending is None:
+            self._pending = msg
+            self._pending_key = key
+            self._pending_since = self._clock()
+            self._pending_parts = []
+            self._pending_size = 0
+        self._pending_parts.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.max_bytes:
+            out += self.flush()
+        return out
+
+    def _expired(self) -> bool:
+        return self._clock() - self._pending_since >= self.window
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """ Give out the merged message that is held back, if any """
+        if self._pending is None:
+            return []
+        msg = self._pending
+        msg["content"] = {**msg["content"], "text": "".join(self._pending_parts)}
+        self._pending = self._pending_key = None
+        self._pending_parts = []
+        self._pending_size = 0
+        self.forwarded += 1
+        return [msg]
+
+
+class FrameBatcher:
+    """ Corks a TCP socket for a window, so that the websocket frames written meanwhile leave in full packets
+    Every frame stays one message, as the kernel websocket protocol requires.
+    """
+
+    def __init__(self, window: float = 0.005):
+        self.window = window
+        self._corked: socket.socket | None = None
+
+    def hold(self, stream: Any) -> bool:
+        """ Cork the socket of an IOStream until the window is over
+        :return: False if the socket cannot be corked
+        """
+        if self._corked is not None:
+            return True
+        try:
+            sock = stream.socket
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+        except (AttributeError, OSError):  # Closed, not a TCP socket, or no TCP_CORK on this platform
+            return False
+        self._corked = sock
+        IOLoop.current().call_later(self.window, self.release)
+        return True
+
+    def release(self):
+        """ Uncork, which sends what is held """
+        sock, self._corked = self._corked, None
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+            except OSError:
+                pass
+
+
+class CoalescingWebsocketConnection(ZMQChannelsWebsocketConnection):
+    """ Kernel websocket connection that coalesces iopub stream messages before they are sent to the browser
+    Only stream messages are deserialized, everything else is forwarded as it is.
+    The counts are reported on the kernel manager as iopub_stats.
+    """
+    coalesce_window = Float(
+        0.05, config=True, help="Seconds stream output may be held back to be merged, 0 to disable coalescing"
+    )
+    coalesce_max_bytes = Integer(64 * 1024, config=True, help="Size of a merged stream message that is sent at once")
+    cell_output_limit = Integer(
+        0, config=True, help="Bytes of stream output sent per cell before it is truncated, 0 for no limit"
+    )
+    batch_window = Float(
+        0.0, config=True, help="Seconds frames are held in the socket to leave in full packets, 0 to disable"
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.coalescer = StreamCoalescer(self.coalesce_window, self.coalesce_max_bytes, self.cell_output_limit)
+        self._flush_handle = None
+        self._reported = dict.fromkeys(("received", "forwarded", "saved", "truncated_bytes"), 0)
+        self.batcher = FrameBatcher(self.batch_window) if self.batch_window > 0 else None
+
+    @property
+    def write_message(self):
+        ws_connection = self.websocket_handler.ws_connection
+        if self.batcher is not None and ws_connection is not None and not self.batcher.hold(ws_connection.stream):
+            self.batcher = None  # Not a TCP socket
+        return self.websocket_handler.write_message
+
+    @property
+    def enabled(self) -> bool:
+        return self.coalesce_window > 0 or self.cell_output_limit > 0
+
+    def handle_outgoing_message(self, stream: Any, outgoing_msg: list) -> None:
+        if isinstance(stream, str):
+            stream = self.channels[stream]
+        if not self.enabled or getattr(stream, "channel", None) != "iopub":
+            return super().handle_outgoing_message(stream, outgoing_msg)
+
+        _, fed_msg_list = self.session.feed_identities(outgoing_msg)
+        msg_type = self.session.unpack(fed_msg_list[1])["msg_type"]  # Header only, the content stays packed
+        cell_end = msg_type == "status" and self.cell_output_limit > 0  # Resets the output budget of the cell
+        if not self.coalescer.is_stream(msg_type) and not self.coalescer.pending and not cell_end:
+            return super().handle_outgoing_message(stream, outgoing_msg)
+
+        msg = self.session.deserialize(fed_msg_list)
+        for out in self.coalescer.feed(msg):
+            if out is msg and not self.coalescer.is_stream(msg_type):
+                super().handle_outgoing_message(stream, outgoing_msg)  # Keep the original (rate limit, errors)
+            else:
+                self._send_iopub(stream, out)
+        self._schedule_flush(stream)
+        self._report()
+
+    def _send_iopub(self, stream: Any, msg: Dict[str, Any]):
+        """ Send a merged message, under the same rate limit as the messages the parent forwards """
+        if self.websocket_handler.ws_connection is None:  # Closed, before on_close has run
+            return
+        if self._limit_rate("iopub", msg, [self.session.pack(msg["content"])]):
+            return
+        try:
+            if self.subprotocol == "v1.kernel.websocket.jupyter.org":
+                self.write_message(serialize_msg_to_ws_v1(msg, "iopub", self.session.pack), binary=True)
+            else:
+                self._on_zmq_reply(stream, msg)
+        except WebSocketClosedError as e:
+            self.log.warning(f"Kernel {self.kernel_id}: stream output dropped, {e!r}")
+
+    def _schedule_flush(self, stream: Any):
+        if self.coalescer.pending and self._flush_handle is None:
+            self._flush_handle = IOLoop.current().call_later(self.coalesce_window, self._flush, stream)
+
+    def _flush(self, stream: Any):
+        self._flush_handle = None
+        if stream.closed():
+            return
+        for out in self.coalescer.flush():
+            self._send_iopub(stream, out)
+        self._report()
+
+    def _report(self):
+        """ Add the counts since the last report to the kernel manager """
+        stats = self.coalescer.stats
+        total = getattr(self.kernel_manager, "iopub_stats", None)
+        if total is None:
+            total = self.kernel_manager.iopub_stats = dict.fromkeys(stats, 0)
+        for name, value in stats.items():
+            total[name] += value - self._reported[name]
+        self._reported = stats
+
+    def disconnect(self):
+        if self.batcher is not None:
+            self.batcher.release()
+        if self._flush_handle is not None:
+            IOLoop.current().remove_timeout(self._flush_handle)
+            self._flush_handle = None
+        if self.coalescer.received:
+            self.log.info(
+                f"Kernel {self.kernel_id}: coalesced {self.coalescer.received} stream messages into "
+                f"{self.coalescer.forwarded} (saved {self.coalescer.saved}, "
+                f"truncated {self.coalescer.truncated_bytes} bytes)"
+            )
+        super().disconnect()
@@ -0,0 +1,257 @@
+""" Frame-budgeted cooperative execution for kernels that share their process with the UI
+
+A CPU-bound cell holds the GIL and starves the UI thread's Python callbacks: every callback of a frame waits for the
+interpreter's switch interval. In cooperative mode the cell is sliced: once it has used its per-frame budget, it stops
+at its next statement boundary, the pending UI-state updates are flushed in one batch and the cell sleeps for a gap,
+so that the UI thread can run a whole frame.
+
+    python cooperative.py [SECONDS]  # Frame stalls of a headless frame loop next to a CPU-bound cell
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable
+import threading
+import time
+import json
+import sys
+
+
+__all__ = ["CooperativeRunner", "BatchedState", "install_cooperative_mode"]
+
+
+class CooperativeRunner:
+    """ Slices the execution of the current thread under a time budget
+    The cell runs untraced; a watcher thread arms a trace function on the frames of the cell once the budget is
+    used, and the cell ends the slice at its next statement boundary. Running with a global trace function still
+    costs a call per Python function call, but no Python call per line.
+    """
+
+    def __init__(
+            self,
+            budget: float = 0.008,
+            gap: float = 0.008,
+            clock: Callable[[], float] = time.perf_counter,
+            pause: Callable[[float], None] = time.sleep
+    ):
+        """
+        :param budget: Seconds of execution per slice (half a 60 Hz frame by default)
+        :param gap: Seconds yielded to the other threads between two slices
+        :param clock: Time source
+        :param pause: Gives up the GIL for the gap
+        """
+        self.budget = budget
+        self.gap = gap
+        self._clock = clock
+        self._pause = pause
+        self._slice_start = 0.0
+        self._pending: Dict[Hashable, tuple[Callable, tuple]] = {}
+        self._lock = threading.Lock()
+        self._active = False
+        self._due = False  # The budget of the slice is used, the cell pauses at its next statement
+        self._thread_id: int | None = None
+        self._armed: list = []
+        self._stopped = threading.Event()
+        self._slice_ended = threading.Condition()
+        self.slices = 0
+        self.flushes = 0
+
+    def defer(self, key: Hashable, func: Callable, *args):
+        """ Queue a UI update for the next slice boundary, replacing a pending one with the same key """
+        if not self._active:
+            func(*args)
+            return
+        with self._lock:
+            self._pending[key] = (func, args)
+
+    def pending(self, key: Hashable) -> tuple[Callable, tuple] | None:
+        with self._lock:
+            return self._pending.get(key)
+
+    def flush(self):
+        """ Apply the queued UI updates """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for func, args in pending.values():
+            func(*args)
+        if pending:
+            self.flushes += 1
+
+    def _watch(self, stopped: threading.Event):
+        while not stopped.is_set():
+            remaining = self._slice_start + self.budget - self._clock()
+            if remaining > 0:
+                stopped.wait(remaining)
+                continue
+            with self._slice_ended:
+                self._arm()
+                self._slice_ended.wait_for(lambda: not self._due or stopped.is_set())
+
+    def _arm(self):
+        frame = sys._current_frames().get(self._thread_id)
+        armed = []
+        while frame is not None:
+            if _sliceable(frame):
+                frame.f_trace = self._trace
+                armed.append(frame)
+            frame = frame.f_back
+        self._armed = armed
+        self._due = True
+
+    def _disarm(self):
+        for frame in self._armed:
+            frame.f_trace = None
+        self._armed = []
+
+    def _end_slice(self):
+        self._disarm()
+        self.flush()
+        self._pause(self.gap)
+        self.slices += 1
+        with self._slice_ended:
+            self._slice_start = self._clock()
+            self._due = False
+            self._slice_ended.notify()
+
+    def _trace(self, frame, event, arg):
+        if self._due and event == "line":
+            self._end_slice()
+            return None
+        return self._trace if self._due else None
+
+    def _trace_call(self, frame, event, arg):
+        if self._due and _sliceable(frame):
+            return self._trace  # Frames entered after the arming pause too
+        return None
+
+    def start(self, *_):
+        """ Start slicing the current thread """
+        self._active = True
+        self._due = False
+        self._thread_id = threading.get_ident()
+        self._slice_start = self._clock()
+        self._stopped = threading.Event()
+        sys.settrace(self._trace_call)
+        threading.Thread(target=self._watch, args=(self._stopped,), name="CooperativeRunner", daemon=True).start()
+
+    def stop(self, *_):
+        sys.settrace(None)
+        with self._slice_ended:
+            self._stopped.set()
+            self._active = False
+            self._due = False
+            self._slice_ended.notify()
+        self._disarm()
+        self.flush()
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run a function cooperatively """
+        self.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop()
+
+
+class BatchedState:
+    """ Wraps a Compose MutableState so that writes from a cooperative cell are applied once per slice """
+
+    def __init__(self, state: Any, runner: CooperativeRunner):
+        self._state = state
+        self._runner = runner
+
+    def getValue(self):
+        pending = self._runner.pending(id(self._state))
+        return pending[1][0] if pending is not None else self._state.getValue()
+
+    def setValue(self, value):
+        self._runner.defer(id(self._state), self._state.setValue, value)
+
+
+# A slice must not end while the runner, or a lock, is half way through
+_RUNNER_CODE = {
+    function.__code__ for cls in (CooperativeRunner, BatchedState) for function in vars(cls).values()
+    if callable(function) and hasattr(function, "__code__")
+}
+
+
+def _sliceable(frame) -> bool:
+    return frame.f_code not in _RUNNER_CODE and frame.f_globals.get("__name__") != "threading"
+
+
+def install_cooperative_mode(kernel: Any, budget: float = 0.008, gap: float = 0.008) -> CooperativeRunner:
+    """ Run every cell of an ipykernel kernel cooperatively
+    Cells can wrap UI states with `batched(state)` to get their writes batched per slice.
+    """
+    runner = CooperativeRunner(budget, gap)
+    kernel.shell.events.register("pre_run_cell", runner.start)
+    kernel.shell.events.register("post_run_cell", runner.stop)
+    kernel.shell.push({"batched": lambda state: BatchedState(state, runner)})
+    kernel.cooperative_runner = runner
+    return runner
+
+
+class _HeadlessFrameLoop(threading.Thread):
+    """ Stand-in for the UI main loop
+    Every interval it runs a frame that calls into Python a few times, with native work in between that releases the
+    GIL (as recomposition calling Python callbacks through JNI), and records how late each frame completes.
+    """
+
+    def __init__(self, interval: float = 1 / 60, callbacks: int = 8):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.callbacks = callbacks
+        self.stalls: list[float] = []
+        self.frames = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        expected = time.perf_counter() + self.interval
+        while not self._stop_event.is_set():
+            time.sleep(max(0.0, expected - time.perf_counter()))
+            for _ in range(self.callbacks):
+                time.sleep(0)  # Native work, then the GIL is taken again for the next callback
+            now = time.perf_counter()
+            self.stalls.append(max(0.0, now - expected))
+            self.frames += 1
+            expected = max(expected + self.interval, now)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def benchmark(duration: float = 2.0, budget: float = 0.008, gap: float = 0.008) -> dict:
+    """ Frame stalls of a headless main loop while a CPU-bound cell runs, with and without slicing,
+    and how much of its work the cell gets done in the same time
+    """
+
+    def cell():
+        end = time.perf_counter() + duration
+        total = iterations = 0
+        while time.perf_counter() < end:
+            for i in range(1000):
+                total += i * i
+            iterations += 1
+        return iterations
+
+    results = {}
+    for mode in ("plain", "cooperative"):
+        loop = _HeadlessFrameLoop()
+        loop.start()
+        if mode == "plain":
+            work = cell()
+        else:
+            work = CooperativeRunner(budget, gap).run(cell)
+        loop.stop()
+        stalls = sorted(loop.stalls)
+        results[mode] = {
+            "frames": loop.frames,
+            "max_stall_ms": stalls[-1] * 1000 if stalls else None,
+            "p95_stall_ms": stalls[int(len(stalls) * 0.95)] * 1000 if stalls else None,
+            "cell_iterations": work
+        }
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0), indent=2))
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable, List
+import time
+
+
+__all__ = ["KernelActivity", "CullingPolicy", "snapshot_code"]
+
+
+class KernelActivity:
+    """ What the culling policy needs to know about a running kernel """
+
+    def __init__(self, kernel_id: str, last_activity: float, rss: int | None = None, busy: bool = False):
+        self.kernel_id = kernel_id
+        self.last_activity = last_activity  # Timestamp of the last message seen from the kernel
+        self.rss = rss  # Resident set size in bytes, None if unknown
+        self.busy = busy
+
+    def __repr__(self):
+        return f"<KernelActivity {self.kernel_id} last_activity={self.last_activity} rss={self.rss} busy={self.busy}>"
+
+
+class CullingPolicy:
+    """ Chooses the kernels to shut down, least recently active first
+    Busy kernels are never chosen. A kernel is culled when
+      - it has been idle for longer than idle_timeout,
+      - the total RSS of the kernels exceeds rss_budget (LRU kernels go until it fits), or
+      - a new kernel needs a slot and none is free (one LRU kernel goes).
+    """
+
+    def __init__(
+            self,
+            idle_timeout: float | None = None,
+            rss_budget: int | None = None,
+            evict_on_exhaustion: bool = True,
+            clock: Callable[[], float] = time.time
+    ):
+        self.idle_timeout = idle_timeout
+        self.rss_budget = rss_budget
+        self.evict_on_exhaustion = evict_on_exhaustion
+        self.clock = clock
+
+    def select(self, kernels: Iterable[KernelActivity], need_slot: bool = False) -> List[str]:
+        """ Kernel ids to cull, in eviction order """
+        kernels = list(kernels)
+        candidates = sorted((kernel for kernel in kernels if not kernel.busy), key=lambda kernel: kernel.last_activity)
+        culled = []
+
+        if self.idle_timeout is not None:
+            now = self.clock()
+            culled = [kernel for kernel in candidates if now - kernel.last_activity > self.idle_timeout]
+
+        if self.rss_budget is not None:
+            total = sum(kernel.rss or 0 for kernel in kernels) - sum(kernel.rss or 0 for kernel in culled)
+            for kernel in candidates:
+                if total <= self.rss_budget:
+                    break
+                if kernel not in culled:
+                    culled.append(kernel)
+                    total -= kernel.rss or 0
+
+        if need_slot and self.evict_on_exhaustion and not culled and candidates:
+            culled.append(candidates[0])
+
+        return [kernel.kernel_id for kernel in culled]
+
+
+def snapshot_code(path: str) -> str:
+    """ Code that pickles the picklable part of the user namespace to path, to be executed in the kernel """
+    return "\n".join([
+        "def __repl_snapshot__(path):",
+        "    import os, pickle, types",
+        "    ip = get_ipython()",
+        "    hidden = set(ip.user_ns_hidden)",
+        "    state = {}",
+        "    for name, value in list(ip.user_ns.items()):",
+        "        if name.startswith('_') or name in hidden or isinstance(value, types.ModuleType):",
+        "            continue",
+        "        try:",
+        "            state[name] = pickle.dumps(value)",
+        "        except Exception:",
+        "            pass",
+        "    os.makedirs(os.path.dirname(path), exist_ok=True)",
+        "    with open(path, 'wb') as f:",
+        "        pickle.dump(state, f)",
+        f"__repl_snapshot__({path!r})",
+        "del __repl_snapshot__",
+    ])
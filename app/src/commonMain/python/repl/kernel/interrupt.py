@@ -0,0 +1,143 @@
+""" Cell interrupts for kernels that do not run in the main thread of their process
+
+Signals only reach the main thread, and the in-app kernels are started from a service thread, so SIGINT can not stop
+a running cell. Instead, the kernel records the thread that executes the cell and an interrupt raises
+KeyboardInterrupt in that thread. Interrupts arrive as kernel-protocol interrupt_request messages on the control
+channel, which ipykernel serves in its own thread, so they are handled while a cell is running.
+
+This module only depends on the standard library so that it can be loaded into a plain ipykernel as well.
+"""
+from __future__ import annotations
+
+from typing import Any
+import threading
+import ctypes
+import time
+import json
+import sys
+
+
+__all__ = ["async_raise", "CellInterrupter", "install_interrupter", "send_interrupt_request"]
+
+
+def async_raise(thread_id: int, exc_type: type[BaseException] = KeyboardInterrupt) -> bool:
+    """ Raise an exception in another thread the next time it runs Python bytecode
+    A thread blocked inside a C call (e.g. time.sleep) only sees it once the call returns.
+    :return: True if the thread was found
+    """
+    found = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), ctypes.py_object(exc_type))
+    if found > 1:  # Should never happen, undo it
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+        return False
+    return found == 1
+
+
+class CellInterrupter:
+    """ Tracks the thread that executes the current cell and interrupts it on request """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread_id: int | None = None
+
+    def pre_run_cell(self, *_):
+        with self._lock:
+            self._thread_id = threading.get_ident()
+
+    def post_run_cell(self, *_):
+        with self._lock:
+            self._thread_id = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread_id is not None
+
+    def interrupt(self) -> bool:
+        """ Interrupt the running cell
+        :return: False if no cell was running
+        """
+        with self._lock:
+            if self._thread_id is None:
+                return False
+            return async_raise(self._thread_id)
+
+
+def install_interrupter(kernel: Any) -> CellInterrupter:
+    """ Make an ipykernel kernel interrupt its running cell instead of signalling its process group
+    Call it before the kernel starts serving requests.
+    """
+    interrupter = CellInterrupter()
+    kernel.shell.events.register("pre_run_cell", interrupter.pre_run_cell)
+    kernel.shell.events.register("post_run_cell", interrupter.post_run_cell)
+    kernel._send_interrupt_children = interrupter.interrupt
+    kernel.cell_interrupter = interrupter
+    return interrupter
+
+
+def send_interrupt_request(manager: Any):
+    """ Interrupt the kernel of a jupyter_client KernelManager with an interrupt_request on the control channel """
+    msg = manager.session.msg("interrupt_request", content={})
+    manager._connect_control_socket()
+    manager.session.send(manager._control_socket, msg)
+
+
+def benchmark(runs: int = 10, timeout: float = 30) -> dict:
+    """ Measure the time from interrupt_request until the execute_reply of an interrupted busy loop
+    Runs a local ipykernel with the interrupter installed.
+    """
+    import subprocess
+    import tempfile
+    import os
+    from jupyter_client import BlockingKernelClient
+    from jupyter_client.connect import write_connection_file
+
+    fd, filename = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    write_connection_file(filename)
+    script = "\n".join([
+        "import sys",
+        f"sys.path.append({os.path.dirname(os.path.abspath(__file__))!r})",
+        "from interrupt import install_interrupter",
+        "from ipykernel.kernelapp import IPKernelApp",
+        "app = IPKernelApp.instance()",
+        f"app.initialize(['-f', {filename!r}])",
+        "install_interrupter(app.kernel)",
+        "app.start()",
+    ])
+    kernel = subprocess.Popen([sys.executable, "-c", script])
+    client = BlockingKernelClient(connection_file=filename)
+    client.load_connection_file()
+    client.hb_channel.time_to_dead = 5.0  # The default of 1 s is missed by a kernel starting on a busy host
+    client.start_channels()
+    latencies = []
+    try:
+        client.wait_for_ready(timeout=timeout)
+        for _ in range(runs):
+            msg_id = client.execute("while True: pass", stop_on_error=False)  # Or the next cell would be aborted
+            while True:  # Wait until the cell is running
+                msg = client.get_iopub_msg(timeout=timeout)
+                if msg["parent_header"].get("msg_id") == msg_id and msg["msg_type"] == "execute_input":
+                    break
+            time.sleep(0.05)
+            begin = time.perf_counter()
+            client.control_channel.send(client.session.msg("interrupt_request", content={}))
+            reply = client.get_shell_msg(timeout=timeout)
+            while reply["parent_header"].get("msg_id") != msg_id:  # e.g. the kernel_info_reply of wait_for_ready
+                reply = client.get_shell_msg(timeout=timeout)
+            latencies.append(time.perf_counter() - begin)
+            assert reply["content"].get("ename") == "KeyboardInterrupt", reply["content"]
+    finally:
+        client.stop_channels()
+        kernel.terminate()
+        kernel.wait()
+        os.remove(filename)
+    latencies.sort()
+    return {
+        "runs": runs,
+        "min_ms": latencies[0] * 1000,
+        "median_ms": latencies[len(latencies) // 2] * 1000,
+        "max_ms": latencies[-1] * 1000
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10), indent=2))
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Callable, Dict
+from concurrent.futures import Future
+import threading
+import time
+
+
+__all__ = ["process_key", "ProcessTable"]
+
+
+def process_key(process_name: str) -> str:
+    """ Strip the package name from an Android process name ("io.github...:kernel3" -> ":kernel3") """
+    _, sep, suffix = process_name.partition(":")
+    return sep + suffix
+
+
+class ProcessTable:
+    """ Shared view of the running kernel processes, refreshed at most once per interval
+    Every reader shares one snapshot per interval instead of querying the system on its own,
+    lookups are O(1) by key, and waiters get futures that resolve when a process appears or exits.
+    A watcher thread refreshes the table while there are waiters, and stops once there are none left.
+    """
+
+    def __init__(self, snapshot: Callable[[], Dict[str, int]], interval: float = 0.5):
+        """
+        :param snapshot: Returns the current {key: pid} table (e.g. {":kernel0": 1234})
+        :param interval: Maximum age of the table in seconds before it is refreshed again
+        """
+        self._snapshot = snapshot
+        self.interval = interval
+        self._table: Dict[str, int] = {}
+        self._updated = float("-inf")
+        self._lock = threading.RLock()
+        self._started: Dict[str, list[Future]] = {}
+        self._exited: Dict[str, list[Future]] = {}
+        self._watcher: threading.Thread | None = None
+        self.refreshes = 0
+
+    def refresh(self):
+        """ Take a new snapshot and resolve the waiters whose process state changed """
+        table = self._snapshot()
+        with self._lock:
+            self._table = dict(table)
+            self._updated = time.monotonic()
+            self.refreshes += 1
+            self._notify()
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self._updated >= self.interval:
+            self.refresh()
+
+    def push(self, key: str, pid: int | None):
+        """ Record a process start (pid) or exit (None) known in this process before the snapshot shows it
+        E.g. a kernel forked by a launcher of this process. The next refresh replaces the table with the snapshot,
+        which has to report the process as well.
+        """
+        with self._lock:
+            if pid is None:
+                self._table.pop(key, None)
+            else:
+                self._table[key] = pid
+            self._notify()
+
+    def _notify(self):
+        for key in [key for key in self._started if key in self._table]:
+            for future in self._started.pop(key):
+                if not future.done():
+                    future.set_result(self._table[key])
+        for key in [key for key in self._exited if key not in self._table]:
+            for future in self._exited.pop(key):
+                if not future.done():
+                    future.set_result(0)
+
+    def pid(self, key: str) -> int | None:
+        """ Get the pid of the process
+        :return: The pid if the process is running, None otherwise
+        """
+        with self._lock:
+            self._refresh_if_stale()
+            return self._table.get(key)
+
+    def is_alive(self, key: str) -> bool:
+        return self.pid(key) is not None
+
+    def started(self, key: str) -> Future:
+        """ Future that resolves to the pid once the process is visible """
+        return self._watch(key, self._started, lambda: key in self._table, lambda: self._table[key])
+
+    def exited(self, key: str) -> Future:
+        """ Future that resolves to 0 once the process is gone """
+        return self._watch(key, self._exited, lambda: key not in self._table, lambda: 0)
+
+    def _watch(self, key: str, waiters: Dict[str, list[Future]], ready: Callable, result: Callable) -> Future:
+        future = Future()
+        with self._lock:
+            self._refresh_if_stale()
+            if ready():
+                future.set_result(result())
+                return future
+            waiters.setdefault(key, []).append(future)
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_loop, name="ProcessTable-watcher", daemon=True)
+                self._watcher.start()
+        return future
+
+    def _watch_loop(self):
+        """ Refresh the table while someone is waiting for a change, then stop """
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                for waiters in (self._started, self._exited):
+                    for key in list(waiters):
+                        waiters[key] = [future for future in waiters[key] if not future.cancelled()]
+                        if not waiters[key]:
+                            del waiters[key]
+                if not self._started and not self._exited:
+                    self._watcher = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh the process table: {e}")
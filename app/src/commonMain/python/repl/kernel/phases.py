@@ -0,0 +1,139 @@
+""" Phase timestamps of kernel launches
+
+A provisioner creates a LaunchTrace per launch and marks the phases as they happen:
+  connection_file_ready -> intent_sent -> process_visible -> kernel_info_reply
+Every mark is published as a structured event to the subscribers, e.g. the jupyter_server event logger.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List
+from collections import deque
+import logging
+import asyncio
+import time
+
+
+__all__ = [
+    "LAUNCH_PHASES", "LAUNCH_PHASE_SCHEMA_ID", "LAUNCH_PHASE_SCHEMA", "LaunchTrace",
+    "subscribe", "unsubscribe", "recent_launches", "trace_kernel_info", "start_kernel_info_trace",
+    "register_launch_events"
+]
+
+LAUNCH_PHASES = ("connection_file_ready", "intent_sent", "process_visible", "kernel_info_reply")
+LAUNCH_PHASE_SCHEMA_ID = "https://github.com/thisisthepy/PyREPL/events/kernel_launch_phase"
+LAUNCH_PHASE_SCHEMA = {
+    "$id": LAUNCH_PHASE_SCHEMA_ID,
+    "version": "1",
+    "title": "Kernel launch phase",
+    "personal-data": False,
+    "description": "Emitted when a kernel launch reaches one of its phases.",
+    "type": "object",
+    "required": ["kernel_id", "phase", "timestamp", "elapsed"],
+    "properties": {
+        "kernel_id": {"type": "string", "description": "Id of the launched kernel"},
+        "phase": {"enum": list(LAUNCH_PHASES), "description": "Reached phase"},
+        "timestamp": {"type": "number", "description": "Wall clock time of the phase (seconds since the epoch)"},
+        "elapsed": {"type": "number", "description": "Seconds since the launch began"},
+        "pid": {"type": ["integer", "null"], "description": "Kernel process id, once known"},
+        "warm": {"type": ["boolean", "null"], "description": "Whether a pre-warmed process was used"},
+    },
+}
+
+log = logging.getLogger(__name__)
+_subscribers: List[Callable[[Dict[str, Any]], None]] = []
+_recent: deque[LaunchTrace] = deque(maxlen=50)
+
+
+class LaunchTrace:
+    """ Timestamps of the phases of one kernel launch """
+
+    def __init__(self, kernel_id: str, clock: Callable[[], float] = time.perf_counter):
+        self.kernel_id = kernel_id
+        self._clock = clock
+        self.begin = clock()
+        self.events: List[Dict[str, Any]] = []
+        _recent.append(self)
+
+    def mark(self, phase: str, **extras) -> Dict[str, Any]:
+        """ Record a phase and publish it
+        :return: The event
+        """
+        event = {
+            "kernel_id": self.kernel_id,
+            "phase": phase,
+            "timestamp": time.time(),
+            "elapsed": self._clock() - self.begin,
+            **extras
+        }
+        self.events.append(event)
+        for subscriber in list(_subscribers):
+            try:
+                subscriber(event)
+            except Exception:
+                log.exception(f"Kernel {self.kernel_id}: launch phase subscriber failed at {phase}")
+        return event
+
+    @property
+    def phases(self) -> Dict[str, float]:
+        """ Seconds since the launch began, per reached phase """
+        return {event["phase"]: event["elapsed"] for event in self.events}
+
+    def __repr__(self):
+        return f"<LaunchTrace {self.kernel_id} {self.phases}>"
+
+
+def subscribe(subscriber: Callable[[Dict[str, Any]], None]):
+    _subscribers.append(subscriber)
+
+
+def unsubscribe(subscriber: Callable[[Dict[str, Any]], None]):
+    if subscriber in _subscribers:
+        _subscribers.remove(subscriber)
+
+
+def recent_launches() -> List[Dict[str, Any]]:
+    """ Events of the latest launches, oldest first """
+    return [{"kernel_id": trace.kernel_id, "events": list(trace.events)} for trace in _recent]
+
+
+async def trace_kernel_info(manager: Any, trace: LaunchTrace, timeout: float = 60):
+    """ Mark kernel_info_reply once the kernel of a jupyter_client KernelManager answers kernel_info """
+    from jupyter_client.session import Session
+
+    # A session of its own: sockets share the session id as identity, so a second client with the manager's
+    # session would shadow the first one that talks to the kernel
+    session = Session(key=manager.session.key, signature_scheme=manager.session.signature_scheme)
+    client = manager.client(session=session)
+    client.start_channels()
+    try:
+        ready = client.wait_for_ready(timeout=timeout)
+        if asyncio.iscoroutine(ready):
+            await ready
+        trace.mark("kernel_info_reply")
+    except Exception as e:
+        manager.log.debug(f"Kernel {trace.kernel_id} did not answer kernel_info: {e}")
+    finally:
+        client.stop_channels()
+
+
+_trace_tasks: set[asyncio.Task] = set()  # The event loop only keeps weak references to its tasks
+
+
+def start_kernel_info_trace(manager: Any, trace: LaunchTrace, timeout: float = 60) -> asyncio.Task:
+    """ Run trace_kernel_info in the background of the running event loop, logging it if it fails """
+    task = asyncio.ensure_future(trace_kernel_info(manager, trace, timeout))
+    _trace_tasks.add(task)
+
+    def done(task: asyncio.Task):
+        _trace_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            manager.log.warning(f"Kernel {trace.kernel_id} launch trace failed: {task.exception()!r}")
+
+    task.add_done_callback(done)
+    return task
+
+
+def register_launch_events(event_logger: Any):
+    """ Publish the launch phases through a jupyter_events EventLogger (served on /api/events/subscribe) """
+    event_logger.register_event_schema(LAUNCH_PHASE_SCHEMA)
+    subscribe(lambda event: event_logger.emit(schema_id=LAUNCH_PHASE_SCHEMA_ID, data=event))
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable
+from concurrent.futures import Future
+from collections import deque
+import subprocess
+import threading
+import asyncio
+import time
+import sys
+import os
+
+
+__all__ = ["PooledKernel", "KernelLauncher", "SubprocessKernelLauncher", "KernelProcessPool"]
+
+
+class PooledKernel:
+    """ A kernel process bound to a slot, either idle (warm) or claimed by a kernel manager
+    The pid is known once the ready future resolves (right away for launchers that know it up front).
+    """
+
+    def __init__(self, slot: int, pid: int | None = None, process: Any = None, ready: Future | None = None):
+        self.slot = slot
+        self.pid = pid
+        self.process = process  # Launcher specific process object
+        self.ready = ready or Future()
+        self.created = time.monotonic()
+        self.claimed = False
+        if pid is not None and not self.ready.done():
+            self.ready.set_result(pid)
+        self.ready.add_done_callback(self._set_pid)
+
+    def _set_pid(self, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.pid = future.result()
+
+    def __repr__(self):
+        state = "claimed" if self.claimed else "idle"
+        return f"<PooledKernel slot={self.slot} pid={self.pid} {state}>"
+
+
+class KernelLauncher:
+    """ Platform specific way of starting kernel processes (Android services, subprocesses, ...)
+    Starting methods must not block until the process is up, they return a kernel whose ready future resolves later.
+    """
+    start_timeout = 5  # Seconds to wait for a started process to become visible
+
+    def spawn(self, slot: int) -> PooledKernel:
+        """ Start a pre-warmed kernel process that waits for a connection file
+        :return: The idle kernel
+        """
+        raise NotImplementedError
+
+    def attach(self, kernel: PooledKernel, workdir: str | None, filename: str):
+        """ Hand a connection file to an idle kernel so that it starts serving it """
+        raise NotImplementedError
+
+    def launch(self, slot: int, workdir: str | None, filename: str) -> PooledKernel:
+        """ Cold start a kernel process that serves the given connection file """
+        kernel = self.spawn(slot)
+        self.attach(kernel, workdir, filename)
+        return kernel
+
+    def is_alive(self, kernel: PooledKernel) -> bool:
+        raise NotImplementedError
+
+    def exited(self, kernel: PooledKernel) -> Future:
+        """ Future that resolves once the kernel process is gone """
+        raise NotImplementedError
+
+    def send_signal(self, kernel: PooledKernel, signum: int):
+        os.kill(kernel.pid, signum)
+
+    def stop(self, kernel: PooledKernel):
+        raise NotImplementedError
+
+
+class SubprocessKernelLauncher(KernelLauncher):
+    """ Launcher stand-in that runs kernels as plain subprocesses (for Linux hosts and tests)
+    The child imports the preload modules first, then blocks until a "<workdir>\\t<filename>" line arrives on stdin.
+    """
+    script = "\n".join([
+        "import importlib, os, sys",
+        "for name in sys.argv[2:]:",
+        "    importlib.import_module(name)",
+        "workdir, filename = sys.stdin.readline().rstrip('\\n').split('\\t')",
+        "if workdir:",
+        "    os.chdir(workdir)",
+        "module, _, func = sys.argv[1].rpartition('.')",
+        "getattr(importlib.import_module(module), func)(['-f', filename])",
+    ])
+
+    def __init__(
+            self,
+            entry: str = "ipykernel.kernelapp.launch_new_instance",
+            preload: Iterable[str] = ("ipykernel.kernelapp",),
+            executable: str = sys.executable
+    ):
+        self.entry = entry
+        self.preload = list(preload)
+        self.executable = executable
+
+    def spawn(self, slot: int) -> PooledKernel:
+        process = subprocess.Popen(
+            [self.executable, "-c", self.script, self.entry, *self.preload],
+            stdin=subprocess.PIPE, text=True, start_new_session=True
+        )
+        return PooledKernel(slot, process.pid, process)
+
+    def attach(self, kernel: PooledKernel, workdir: str | None, filename: str):
+        kernel.process.stdin.write(f"{workdir or ''}\t{filename}\n")
+        kernel.process.stdin.flush()
+
+    def is_alive(self, kernel: PooledKernel) -> bool:
+        return kernel.process.poll() is None
+
+    def exited(self, kernel: PooledKernel) -> Future:
+        exited = Future()
+        threading.Thread(target=lambda: exited.set_result(kernel.process.wait()), daemon=True).start()
+        return exited
+
+    def send_signal(self, kernel: PooledKernel, signum: int):
+        kernel.process.send_signal(signum)
+
+    def stop(self, kernel: PooledKernel):
+        if self.is_alive(kernel):
+            kernel.process.terminate()
+            try:
+                kernel.process.wait(5)
+            except subprocess.TimeoutExpired:
+                kernel.process.kill()
+
+
+class KernelProcessPool:
+    """ Keeps a number of idle, pre-warmed kernel processes so that starting a kernel only needs a hand-over
+    Slots are shared with the kernels started outside the pool, so they are reserved through the given callbacks.
+    """
+
+    def __init__(
+            self,
+            launcher: KernelLauncher,
+            size: int,
+            reserve_slot: Callable[[], int],
+            release_slot: Callable[[int], None],
+            max_idle_time: float | None = None
+    ):
+        self.launcher = launcher
+        self.size = size
+        self.max_idle_time = max_idle_time  # Idle kernels older than this are evicted (seconds)
+        self._reserve_slot = reserve_slot
+        self._release_slot = release_slot
+        self._idle: deque[PooledKernel] = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.evictions = 0
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self.idle,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "evictions": self.evictions
+        }
+
+    def claim(self, workdir: str | None, filename: str) -> PooledKernel:
+        """ Start serving the connection file with an idle kernel, or cold start one if the pool is empty
+        A cold started kernel may not be up yet when this returns, wait on its ready future.
+        :raises RuntimeError: If no slot is available for a cold start
+        """
+        kernel = self._pop_idle()
+        if kernel is not None:
+            self.launcher.attach(kernel, workdir, filename)
+            self.hits += 1
+        else:
+            self.misses += 1
+            slot = self._reserve_slot()
+            try:
+                kernel = self.launcher.launch(slot, workdir, filename)
+            except Exception:
+                self._release_slot(slot)
+                raise
+        kernel.claimed = True
+        self.refill()
+        return kernel
+
+    async def wait_ready(self, kernel: PooledKernel, timeout: float) -> int:
+        """ Wait for a claimed kernel to come up without blocking the event loop
+        :return: The pid of the kernel process
+        :raises RuntimeError: If the kernel process does not show up within the timeout, its slot is then given back
+        """
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(kernel.ready), timeout)
+        except asyncio.TimeoutError:
+            self.discard(kernel)
+            raise RuntimeError("Failed to start kernel process.")
+
+    def discard(self, kernel: PooledKernel):
+        """ Stop a kernel that failed to come up and give its slot back """
+        try:
+            self.launcher.stop(kernel)
+        finally:
+            self._release_slot(kernel.slot)
+
+    def _pop_idle(self) -> PooledKernel | None:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                kernel = self._idle.popleft()
+            if self.launcher.is_alive(kernel) and not self._expired(kernel):
+                return kernel
+            self._evict(kernel)
+
+    def _expired(self, kernel: PooledKernel) -> bool:
+        return self.max_idle_time is not None and time.monotonic() - kernel.created > self.max_idle_time
+
+    def _evict(self, kernel: PooledKernel):
+        try:
+            self.discard(kernel)
+        finally:
+            self.evictions += 1
+
+    def evict_idle(self, count: int | None = None) -> int:
+        """ Stop idle kernels to give their slots back
+        :param count: Number of idle kernels to stop, all of them if None
+        :return: Number of evicted kernels
+        """
+        evicted = 0
+        while count is None or evicted < count:
+            with self._lock:
+                if not self._idle:
+                    break
+                kernel = self._idle.pop()  # Newest first, the oldest ones are claimed first anyway
+            self._evict(kernel)
+            evicted += 1
+        return evicted
+
+    def refill(self, wait: bool = False):
+        """ Top up the pool to its size in a background thread
+        :param wait: Block until the refill is finished
+        """
+        with self._lock:
+            if self._refilling or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        thread = threading.Thread(target=self._refill, name="KernelProcessPool-refill", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _refill(self):
+        try:
+            for kernel in list(self._idle):
+                if not self.launcher.is_alive(kernel) or self._expired(kernel):
+                    with self._lock:
+                        if kernel not in self._idle:
+                            continue
+                        self._idle.remove(kernel)
+                    self._evict(kernel)
+
+            while len(self._idle) < self.size:
+                try:
+                    slot = self._reserve_slot()
+                except RuntimeError:
+                    break  # Every slot is in use, try again on the next claim
+                try:
+                    kernel = self.launcher.spawn(slot)
+                except Exception as e:
+                    self._release_slot(slot)
+                    print(f"Failed to pre-warm a kernel process: {e}", file=sys.stderr)
+                    break
+                try:
+                    kernel.ready.result(timeout=self.launcher.start_timeout)
+                except Exception as e:
+                    self.discard(kernel)
+                    print(f"Failed to pre-warm a kernel process: {e!r}", file=sys.stderr)
+                    break
+                with self._lock:
+                    self._idle.append(kernel)
+                self.refills += 1
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def resize(self, size: int):
+        """ Change the number of idle kernels to keep """
+        self.size = size
+        if self.idle > size:
+            self.evict_idle(self.idle - size)
+        else:
+            self.refill()
+
+    def shutdown(self):
+        """ Stop every idle kernel """
+        self.size = 0
+        self.evict_idle()
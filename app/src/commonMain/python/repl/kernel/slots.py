@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from typing import Callable
+from concurrent.futures import Future
+from collections import deque
+import threading
+import time
+
+
+__all__ = ["SlotLease", "SlotAllocator"]
+
+
+class SlotLease(int):
+    """ A reserved slot number
+    Behaves like the slot number itself, but releasing a lease that was already released is a no-op,
+    so a late release can never free the slot of the next kernel that got the same number.
+    """
+
+    __str__ = int.__repr__  # Keep building service/process names from the plain number
+
+    def __repr__(self):
+        return f"<SlotLease {int(self)}>"
+
+
+class SlotAllocator:
+    """ Thread-safe O(1) allocator for the fixed number of kernel slots (free-list + lease table) """
+
+    def __init__(self, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self._clock = clock
+        self._free: deque[int] = deque(range(capacity))
+        self._leases: list[SlotLease | None] = [None] * capacity
+        self._lock = threading.Lock()
+        self._since = self._last = clock()
+        self._occupancy = 0.0  # Integral of the number of used slots over time
+        self.peak = 0
+        self.acquired = 0
+        self.released = 0
+        self.exhausted = 0
+        self.reclaimed = 0
+
+    @property
+    def in_use(self) -> int:
+        return self.capacity - len(self._free)
+
+    def _account(self):
+        now = self._clock()
+        self._occupancy += self.in_use * (now - self._last)
+        self._last = now
+
+    def acquire(self) -> SlotLease:
+        """ Reserve the least recently released slot
+        :raises RuntimeError: If every slot is in use
+        """
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                raise RuntimeError(f"Maximum number of kernels({self.capacity}) reached."
+                                   + f" Please exit the kernel that is not in use and try again.")
+            self._account()
+            slot = self._free.popleft()
+            lease = self._leases[slot] = SlotLease(slot)
+            self.acquired += 1
+            self.peak = max(self.peak, self.in_use)
+            return lease
+
+    def reserve(self, slot: int) -> SlotLease | None:
+        """ Reserve a specific slot
+        :return: The lease, None if the slot is already in use
+        """
+        with self._lock:
+            if self._leases[slot] is not None:
+                return None
+            self._account()
+            self._free.remove(slot)  # O(capacity), only used for reclamation
+            lease = self._leases[slot] = SlotLease(slot)
+            self.acquired += 1
+            self.peak = max(self.peak, self.in_use)
+            return lease
+
+    def release(self, lease: int) -> bool:
+        """ Give a slot back
+        :param lease: The lease returned by acquire, or a plain slot number to release whatever holds it
+        :return: False if the lease was stale or the slot was already free
+        """
+        with self._lock:
+            current = self._leases[lease]
+            if current is None or (isinstance(lease, SlotLease) and current is not lease):
+                return False
+            self._account()
+            self._leases[lease] = None
+            self._free.append(int(lease))
+            self.released += 1
+            return True
+
+    def release_on(self, lease: SlotLease, event: Future):
+        """ Release the lease as soon as the future resolves (e.g. when the process is seen exiting) """
+        event.add_done_callback(lambda _: self.release(lease))
+
+    def reclaim(self, is_alive: Callable[[int], bool], stop: Callable[[int], Future]) -> list[int]:
+        """ Stop processes that hold a slot without a lease, e.g. kernels left over by a previous server
+        Each reclaimed slot stays reserved until its process exit future resolves.
+        :param is_alive: Whether a process is running in the slot
+        :param stop: Stop the process in the slot and return a future for its exit
+        :return: The reclaimed slots
+        """
+        reclaimed = []
+        for slot in range(self.capacity):
+            if self._leases[slot] is None and is_alive(slot):
+                lease = self.reserve(slot)
+                if lease is None:
+                    continue
+                self.release_on(lease, stop(slot))
+                reclaimed.append(slot)
+        with self._lock:
+            self.reclaimed += len(reclaimed)
+        return reclaimed
+
+    @property
+    def stats(self) -> dict:
+        """ Occupancy statistics, useful to size the number of slots from real usage """
+        with self._lock:
+            self._account()
+            elapsed = self._last - self._since
+            return {
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "peak": self.peak,
+                "mean_in_use": self._occupancy / elapsed if elapsed > 0 else float(self.in_use),
+                "acquired": self.acquired,
+                "released": self.released,
+                "exhausted": self.exhausted,
+                "reclaimed": self.reclaimed
+            }
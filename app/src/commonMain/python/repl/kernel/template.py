@@ -0,0 +1,311 @@
+""" Kernel template process: one warmed interpreter that forks new kernels on request
+
+The template is started from this file as a standalone script (it must not import the repl package, which pulls
+in the Android bridge), preloads the heavy modules once, then forks a kernel for every request it reads on stdin.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable
+from concurrent.futures import Future
+from collections import deque
+import importlib
+import subprocess
+import threading
+import tempfile
+import argparse
+import signal
+import time
+import json
+import sys
+import os
+
+try:
+    from .pool import PooledKernel, KernelLauncher
+    from .monitor import ProcessTable
+except ImportError:  # Running as the template script, the siblings only import the standard library
+    from pool import PooledKernel, KernelLauncher
+    from monitor import ProcessTable
+
+
+__all__ = ["fork_supported", "TemplateProcess", "TemplateKernelLauncher"]
+
+DEFAULT_PRELOAD = ("ipykernel.kernelapp", "ipykernel.ipkernel", "IPython.core.interactiveshell", "zmq")
+DEFAULT_ENTRY = "ipykernel.kernelapp.launch_new_instance"
+
+
+def fork_supported() -> bool:
+    """ Whether kernels can be forked from a template
+    Not on Android: the app processes host a JVM, which does not survive a fork.
+    """
+    return hasattr(os, "fork") and not hasattr(sys, "getandroidapilevel")
+
+
+def serve(entry: str = DEFAULT_ENTRY, preload: Iterable[str] = DEFAULT_PRELOAD):
+    """ Template main loop
+    Reads "<workdir>\\t<filename>" lines on stdin and answers each of them with the pid of the forked kernel.
+    """
+    for name in preload:
+        importlib.import_module(name)
+    module, _, func = entry.rpartition(".")
+    entry_point = getattr(importlib.import_module(module), func)
+
+    signal.signal(signal.SIGCHLD, lambda *_: _reap())
+    print("ready", flush=True)
+
+    for line in sys.stdin:
+        workdir, _, filename = line.rstrip("\n").partition("\t")
+        pid = os.fork()
+        if pid == 0:
+            try:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                os.setsid()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1):  # Keep the kernel away from the template's request/response pipes
+                    os.dup2(devnull, fd)
+                sys.stdin, sys.stdout = open(os.devnull), open(os.devnull, "w")
+                if workdir:
+                    os.chdir(workdir)
+                entry_point(["-f", filename])
+            except BaseException as e:
+                print(f"Kernel exited abnormally: {e!r}", file=sys.stderr)
+                os._exit(1)
+            os._exit(0)
+        print(pid, flush=True)
+
+
+def _reap():
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TemplateProcess:
+    """ A running template process
+    Requests are written to its stdin right away (the template reads them once it is warm), and a reader thread
+    resolves the futures of the requests with the pids the template answers, so nothing waits on its stdout.
+    """
+
+    def __init__(self, entry: str = DEFAULT_ENTRY, preload: Iterable[str] = DEFAULT_PRELOAD,
+                 executable: str = sys.executable):
+        self.process = subprocess.Popen(
+            [executable, os.path.abspath(__file__), "serve", "--entry", entry, "--preload", ",".join(preload)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, start_new_session=True
+        )
+        self.started = Future()  # Resolves once the preload modules are imported
+        self._pending: deque[Future] = deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, name="TemplateProcess-reader", daemon=True).start()
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed and self.process.poll() is None
+
+    def _read(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not self.started.done():
+                if line != "ready":
+                    break
+                self.started.set_result(self.process.pid)
+                continue
+            with self._lock:
+                future = self._pending.popleft()
+            future.set_result(int(line))
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, deque()
+        if not self.started.done():
+            self.started.set_exception(RuntimeError("Kernel template failed to start."))
+        for future in pending:
+            future.set_exception(RuntimeError("Kernel template exited before forking the kernel."))
+
+    def fork(self, workdir: str | None, filename: str) -> Future:
+        """ Request a kernel serving the connection file
+        :return: Future that resolves to the pid of the forked kernel
+        :raises RuntimeError: If the template is not running anymore
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Kernel template is not running.")
+            self._pending.append(future)
+            self.process.stdin.write(f"{workdir or ''}\t{filename}\n")
+            self.process.stdin.flush()
+        return future
+
+    def close(self):
+        """ Stop the template (kernels forked from it keep running) """
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+class TemplateKernelLauncher(KernelLauncher):
+    """ Launcher that forks kernels from a template process, or uses the fallback where fork is not usable
+    Forking is cheap once the template is warm, so only cold starts are forked: pre-warmed kernels, with a pool
+    size above 0, come from the fallback. Call start_template() ahead of the first kernel.
+    Forked kernels are not children of this process, their exits are watched by pid.
+    """
+
+    def __init__(
+            self,
+            fallback: KernelLauncher,
+            preload: Iterable[str] = DEFAULT_PRELOAD,
+            entry: str = DEFAULT_ENTRY,
+            executable: str = sys.executable
+    ):
+        self.fallback = fallback
+        self.preload = list(preload)
+        self.entry = entry
+        self.executable = executable
+        self.enabled = fork_supported()
+        self._template: TemplateProcess | None = None
+        self._lock = threading.Lock()
+        self._forked_pids: set[int] = set()
+        self._forked = ProcessTable(self._forked_processes)
+
+    def _forked_processes(self) -> Dict[str, int]:
+        for pid in [pid for pid in list(self._forked_pids) if not _pid_alive(pid)]:
+            self._forked_pids.discard(pid)
+        return {self.process_key(pid): pid for pid in list(self._forked_pids)}
+
+    @staticmethod
+    def process_key(pid: int) -> str:
+        return f":forked{pid}"
+
+    def _ensure_template(self) -> TemplateProcess:
+        if self._template is None or not self._template.alive:
+            self._template = TemplateProcess(self.entry, self.preload, self.executable)
+        return self._template
+
+    def start_template(self) -> Future | None:
+        """ Start the template ahead of the first kernel, it warms up in the background
+        :return: Future that resolves once the template is warm, None if fork is not usable
+        """
+        if self.enabled:
+            with self._lock:
+                return self._ensure_template().started
+        return None
+
+    def spawn(self, slot: int) -> PooledKernel:
+        return self.fallback.spawn(slot)
+
+    def attach(self, kernel: PooledKernel, workdir: str | None, filename: str):
+        return self.fallback.attach(kernel, workdir, filename)
+
+    def launch(self, slot: int, workdir: str | None, filename: str) -> PooledKernel:
+        if not self.enabled:
+            return self.fallback.launch(slot, workdir, filename)
+        with self._lock:
+            ready = self._ensure_template().fork(workdir, filename)
+        ready.add_done_callback(self._track)
+        return PooledKernel(slot, ready=ready, process="forked")
+
+    def _track(self, ready: Future):
+        if not ready.cancelled() and ready.exception() is None:
+            self._forked_pids.add(ready.result())
+            self._forked.push(self.process_key(ready.result()), ready.result())
+
+    def is_alive(self, kernel: PooledKernel) -> bool:
+        if kernel.process == "forked":
+            return _pid_alive(kernel.pid)
+        return self.fallback.is_alive(kernel)
+
+    def exited(self, kernel: PooledKernel) -> Future:
+        if kernel.process == "forked":
+            return self._forked.exited(self.process_key(kernel.pid))
+        return self.fallback.exited(kernel)
+
+    def send_signal(self, kernel: PooledKernel, signum: int):
+        if kernel.process == "forked":
+            os.kill(kernel.pid, signum)
+        else:
+            self.fallback.send_signal(kernel, signum)
+
+    def stop(self, kernel: PooledKernel):
+        if kernel.process == "forked":
+            try:
+                os.kill(kernel.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        else:
+            self.fallback.stop(kernel)
+
+    def shutdown(self):
+        """ Stop the template (kernels forked from it keep running) """
+        if self._template is not None:
+            self._template.close()
+
+
+def benchmark(runs: int = 5, preload: Iterable[str] = DEFAULT_PRELOAD, timeout: float = 30) -> dict:
+    """ Compare the time until a kernel answers kernel_info for a cold start and a fork from a warm template """
+    from jupyter_client import BlockingKernelClient
+    from jupyter_client.connect import write_connection_file
+
+    def wait_ready(filename: str) -> None:
+        client = BlockingKernelClient(connection_file=filename)
+        client.load_connection_file()
+        client.start_channels()
+        try:
+            client.wait_for_ready(timeout=timeout)
+        finally:
+            client.stop_channels()
+
+    def measure(start) -> list[float]:
+        timings = []
+        for _ in range(runs):
+            fd, filename = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            write_connection_file(filename)
+            begin = time.perf_counter()
+            stop = start(filename)
+            wait_ready(filename)
+            timings.append(time.perf_counter() - begin)
+            stop()
+            os.remove(filename)
+        return timings
+
+    def cold(filename: str):
+        process = subprocess.Popen([sys.executable, "-m", "ipykernel_launcher", "-f", filename])
+        return lambda: (process.terminate(), process.wait())
+
+    template = TemplateProcess(preload=preload)
+    template.started.result(timeout)
+
+    def forked(filename: str):
+        pid = template.fork(None, filename).result(timeout)
+        return lambda: os.kill(pid, signal.SIGTERM)
+
+    try:
+        results = {"cold": measure(cold), "template": measure(forked)}
+    finally:
+        template.close()
+    return {name: {"min": min(t), "mean": sum(t) / len(t), "max": max(t)} for name, t in results.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["serve", "benchmark"])
+    parser.add_argument("--entry", default=DEFAULT_ENTRY)
+    parser.add_argument("--preload", default=",".join(DEFAULT_PRELOAD))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    preload_modules = [name for name in args.preload.split(",") if name]
+
+    if args.mode == "serve":
+        serve(args.entry, preload_modules)
+    else:
+        print(json.dumps(benchmark(args.runs, preload_modules), indent=2))
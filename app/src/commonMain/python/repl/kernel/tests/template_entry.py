@@ -0,0 +1,8 @@
+""" Stand-in kernel for the template tests: slow to import, then idles until it is stopped """
+import time
+
+time.sleep(1)
+
+
+def serve(argv):
+    time.sleep(60)
@@ -0,0 +1,81 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from repl.kernel.pool import KernelLauncher, KernelProcessPool, PooledKernel
+from repl.kernel.slots import SlotAllocator
+
+START_SECONDS = 5.0
+
+
+class AsyncioLauncher(KernelLauncher):
+    """ Kernel processes that show up start_delay seconds after they are started, on the event loop """
+
+    def __init__(self, start_delay: float):
+        self.start_delay = start_delay
+        self.pids = itertools.count(1000)
+        self.stopped = []
+
+    def spawn(self, slot):
+        ready = Future()
+        asyncio.get_running_loop().call_later(self.start_delay, ready.set_result, next(self.pids))
+        return PooledKernel(slot, ready=ready)
+
+    def attach(self, kernel, workdir, filename):
+        pass
+
+    def is_alive(self, kernel):
+        return kernel not in self.stopped
+
+    def stop(self, kernel):
+        self.stopped.append(kernel)
+
+
+async def heartbeat(ticks, interval=0.01):
+    """ Another client of the server, served as long as the loop is free """
+    while True:
+        ticks.append(time.monotonic())
+        await asyncio.sleep(interval)
+
+
+def test_event_loop_keeps_serving_during_a_slow_kernel_start():
+    slots = SlotAllocator(2)
+    pool = KernelProcessPool(AsyncioLauncher(START_SECONDS), 0, slots.acquire, slots.release)
+    ticks = []
+
+    async def main():
+        other = asyncio.create_task(heartbeat(ticks))
+        begin = time.monotonic()
+        kernel = pool.claim(None, "kernel-a.json")
+        pid = await pool.wait_ready(kernel, START_SECONDS + 5)
+        elapsed = time.monotonic() - begin
+        other.cancel()
+        return kernel, pid, elapsed
+
+    kernel, pid, elapsed = asyncio.run(main())
+
+    assert kernel.pid == pid
+    assert elapsed == pytest.approx(START_SECONDS, abs=0.5)
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    assert len(ticks) > START_SECONDS / 0.01 / 2
+    assert max(gaps) < 0.25
+
+
+def test_kernel_start_times_out_and_gives_the_slot_back():
+    slots = SlotAllocator(2)
+    launcher = AsyncioLauncher(START_SECONDS)
+    pool = KernelProcessPool(launcher, 0, slots.acquire, slots.release)
+
+    async def main():
+        kernel = pool.claim(None, "kernel-a.json")
+        with pytest.raises(RuntimeError):
+            await pool.wait_ready(kernel, 0.1)
+        return kernel
+
+    kernel = asyncio.run(main())
+
+    assert launcher.stopped == [kernel]
+    assert slots.in_use == 0
@@ -0,0 +1,68 @@
+import os
+
+from repl.kernel.capture import StreamCapture, CaptureReader
+
+
+def segment_sizes(directory):
+    return {name: os.path.getsize(os.path.join(directory, name)) for name in sorted(os.listdir(directory))}
+
+
+def test_long_write_is_split_at_segment_boundaries(tmp_path):
+    capture = StreamCapture(str(tmp_path), "stdout", segment_size=10, segments=3)
+
+    capture.write("a" * 35)
+    capture.flush()
+
+    assert capture.offset == 35
+    assert list(segment_sizes(tmp_path).values()) == [10, 10, 5]  # The first segment is rotated away
+    assert CaptureReader(str(tmp_path), "stdout").start == 10
+
+
+def test_new_capture_removes_old_segments(tmp_path):
+    StreamCapture(str(tmp_path), "stdout", segment_size=10).write("a" * 25)
+
+    capture = StreamCapture(str(tmp_path), "stdout", segment_size=10)
+    capture.write("b")
+    capture.flush()
+
+    assert CaptureReader(str(tmp_path), "stdout").read() == (b"b", 1)
+
+
+def test_read_across_segments(tmp_path):
+    capture = StreamCapture(str(tmp_path), "stderr", segment_size=4, segments=10)
+    for line in ("one\n", "two\n", "three\n"):
+        capture.write(line)
+    capture.flush()
+    reader = CaptureReader(str(tmp_path), "stderr")
+
+    assert reader.read() == (b"one\ntwo\nthree\n", 14)
+    assert reader.read(2, size=7) == (b"e\ntwo\nt", 9)
+    assert reader.read(14) == (b"", 14)
+
+
+def test_read_skips_rotated_output(tmp_path):
+    capture = StreamCapture(str(tmp_path), "stdout", segment_size=4, segments=2)
+    capture.write("0123456789")
+    capture.flush()
+
+    assert CaptureReader(str(tmp_path), "stdout").read(1) == (b"456789", 10)
+
+
+def test_split_character_is_read_whole(tmp_path):
+    capture = StreamCapture(str(tmp_path), "stdout", segment_size=4, segments=10)
+    capture.write("abcéd")  # The two bytes of the accent fall into two segments
+    capture.flush()
+
+    data, offset = CaptureReader(str(tmp_path), "stdout").read()
+
+    assert data.decode() == "abcéd" and offset == 6
+
+
+def test_follow_yields_new_output(tmp_path):
+    capture = StreamCapture(str(tmp_path), "stdout", segment_size=8, buffer_size=0)
+    stream = CaptureReader(str(tmp_path), "stdout").follow(interval=0.01)
+
+    capture.write("hello ")
+    assert next(stream) == b"hello "
+    capture.write("world, again")
+    assert next(stream) == b"world, again"
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+import pytest
+
+pytest.importorskip("jupyter_server")
+
+from traitlets.config import LoggingConfigurable
+from jupyter_server.services.kernels.websocket import KernelWebsocketHandler
+
+from repl.kernel.coalesce import CoalescingWebsocketConnection
+
+
+class FakeKernelManager(LoggingConfigurable):
+    kernel_id = "kernel-a"
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.closing = False
+        self.sent = []
+
+    def is_closing(self):
+        return self.closing
+
+    def write_message(self, message, binary=False):
+        self.sent.append(message)
+
+
+class FakeHandler(KernelWebsocketHandler):
+    """ The tornado websocket handler, without a request behind it """
+
+    def __init__(self, ws_connection):
+        self.ws_connection = ws_connection
+
+    @property
+    def selected_subprotocol(self):
+        return "v1.kernel.websocket.jupyter.org"
+
+
+class FakeStream:
+    channel = "iopub"
+
+    def closed(self):
+        return False
+
+
+def make_connection(ws_connection, **config):
+    connection = CoalescingWebsocketConnection(
+        parent=FakeKernelManager(), websocket_handler=FakeHandler(ws_connection), **config
+    )
+    connection.log = logging.getLogger("test_coalesce")
+    return connection
+
+
+def stream_msg(connection, text, parent="cell-a"):
+    msg = connection.session.msg("stream", content={"name": "stdout", "text": text})
+    msg["parent_header"] = {"msg_id": parent}
+    return msg
+
+
+def send(connection, texts):
+    """ Feed stream messages to the coalescer and send what it gives out, as the websocket connection does """
+
+    async def main():
+        for text in texts:
+            for out in connection.coalescer.feed(stream_msg(connection, text)):
+                connection._send_iopub(FakeStream(), out)
+        connection._flush(FakeStream())
+
+    asyncio.run(main())
+
+
+def test_merged_output_is_sent():
+    websocket = FakeWebsocket()
+    connection = make_connection(websocket)
+
+    send(connection, ["a", "b", "c"])
+
+    assert len(websocket.sent) == 1
+    assert b"abc" in websocket.sent[0]
+    assert connection.kernel_manager.iopub_stats["saved"] == 2
+
+
+def test_closed_websocket_drops_output():
+    connection = make_connection(None)
+
+    send(connection, ["a", "b"])
+
+    assert connection.coalescer.forwarded == 1
+
+
+def test_closing_websocket_is_logged(caplog):
+    websocket = FakeWebsocket()
+    websocket.closing = True
+    connection = make_connection(websocket)
+
+    with caplog.at_level(logging.WARNING, logger="test_coalesce"):
+        send(connection, ["a", "b"])
+
+    assert websocket.sent == []
+    assert "kernel-a: stream output dropped" in caplog.text
+
+
+def test_merged_output_is_rate_limited():
+    websocket = FakeWebsocket()
+    connection = make_connection(websocket, coalesce_max_bytes=1, iopub_msg_rate_limit=2.0, rate_limit_window=1.0)
+
+    send(connection, ["a", "b", "c", "d", "e"])
+
+    assert connection._iopub_msgs_exceeded
+    sent = [message for message in websocket.sent if b"IOPub message rate exceeded" not in message]
+    assert len(sent) == 2
+    assert len(websocket.sent) == 3
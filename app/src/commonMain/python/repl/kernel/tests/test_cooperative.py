@@ -0,0 +1,65 @@
+import sys
+import time
+
+from repl.kernel.cooperative import BatchedState, CooperativeRunner, benchmark
+
+
+class FakeState:
+    def __init__(self, value=None):
+        self.value = value
+        self.writes = 0
+
+    def getValue(self):
+        return self.value
+
+    def setValue(self, value):
+        self.value = value
+        self.writes += 1
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_cell_is_sliced_and_untraced_afterwards():
+    runner = CooperativeRunner(budget=0.01, gap=0.001)
+    trace = sys.gettrace()
+
+    runner.run(busy, 0.3)
+
+    assert runner.slices >= 5
+    assert sys.gettrace() is trace
+
+
+def test_state_writes_are_batched_per_slice():
+    runner = CooperativeRunner(budget=0.02, gap=0.001)
+    state = FakeState(0)
+    batched = BatchedState(state, runner)
+    seen = []
+
+    def cell():
+        end = time.perf_counter() + 0.3
+        while time.perf_counter() < end:
+            batched.setValue(batched.getValue() + 1)
+            seen.append(batched.getValue())
+
+    runner.run(cell)
+
+    assert state.value == seen[-1] == len(seen)  # Reads see the pending writes, the last one is applied
+    assert 1 <= state.writes <= runner.slices + 1
+    assert runner.flushes == state.writes
+
+
+def test_writes_outside_a_cell_are_applied_at_once():
+    state = FakeState()
+    BatchedState(state, CooperativeRunner()).setValue("x")
+    assert state.value == "x"
+
+
+def test_slicing_shortens_the_frame_stalls():
+    results = benchmark(duration=1.0)
+
+    assert results["cooperative"]["p95_stall_ms"] < results["plain"]["p95_stall_ms"]
+    assert results["cooperative"]["frames"] > results["plain"]["frames"]
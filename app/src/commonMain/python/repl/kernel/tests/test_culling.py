@@ -0,0 +1,79 @@
+import pickle
+import types
+
+from repl.kernel.culling import CullingPolicy, KernelActivity, snapshot_code
+
+MB = 1024 * 1024
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def kernels(*specs):
+    """ Fake kernel processes from (kernel_id, last_activity, rss_mb, busy) """
+    return [KernelActivity(kernel_id, last, rss * MB if rss is not None else None, busy)
+            for kernel_id, last, rss, busy in specs]
+
+
+def test_nothing_is_culled_without_limits():
+    policy = CullingPolicy(evict_on_exhaustion=False, clock=FakeClock())
+    assert policy.select(kernels(("a", 0, 100, False), ("b", 10, 100, False))) == []
+
+
+def test_idle_timeout_culls_the_idle_kernels_oldest_first():
+    clock = FakeClock(1000)
+    policy = CullingPolicy(idle_timeout=300, clock=clock)
+    running = kernels(("recent", 900, None, False), ("old", 100, None, False), ("older", 50, None, False))
+
+    assert policy.select(running) == ["older", "old"]
+    clock.now = 1201
+    assert policy.select(running) == ["older", "old", "recent"]
+
+
+def test_busy_kernels_are_never_culled():
+    policy = CullingPolicy(idle_timeout=10, rss_budget=0, clock=FakeClock(1000))
+    assert policy.select(kernels(("busy", 0, 500, True)), need_slot=True) == []
+
+
+def test_rss_budget_culls_lru_kernels_until_it_fits():
+    policy = CullingPolicy(rss_budget=250 * MB, clock=FakeClock())
+    running = kernels(("a", 30, 100, False), ("b", 10, 100, False), ("c", 20, 100, False), ("busy", 0, 100, True))
+
+    assert policy.select(running) == ["b", "c"]  # 400 MB with the busy kernel, down to 200 MB
+
+
+def test_rss_budget_counts_what_the_idle_timeout_culls_already():
+    policy = CullingPolicy(idle_timeout=500, rss_budget=150 * MB, clock=FakeClock(1000))
+    running = kernels(("idle", 100, 100, False), ("a", 900, 100, False), ("b", 950, 100, False))
+
+    assert policy.select(running) == ["idle", "a"]
+
+
+def test_slot_exhaustion_evicts_one_lru_kernel():
+    policy = CullingPolicy(clock=FakeClock())
+    running = kernels(("a", 30, None, False), ("b", 10, None, True), ("c", 20, None, False))
+
+    assert policy.select(running) == []
+    assert policy.select(running, need_slot=True) == ["c"]
+    assert CullingPolicy(evict_on_exhaustion=False).select(running, need_slot=True) == []
+
+
+def test_snapshot_code_pickles_the_user_namespace(tmp_path):
+    path = tmp_path / "snapshots" / "kernel.pickle"
+    shell = types.SimpleNamespace(
+        user_ns={"x": 42, "data": [1, 2], "_private": 1, "hidden": 2, "os": types, "handle": lambda: None},
+        user_ns_hidden={"hidden": 2}
+    )
+    namespace = {"get_ipython": lambda: shell}
+
+    exec(snapshot_code(str(path)), namespace)
+
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    assert {name: pickle.loads(value) for name, value in state.items()} == {"x": 42, "data": [1, 2]}
+    assert "__repl_snapshot__" not in namespace
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+from repl.kernel.interrupt import CellInterrupter, benchmark
+
+
+def test_interrupt_without_a_running_cell():
+    interrupter = CellInterrupter()
+    assert not interrupter.running
+    assert interrupter.interrupt() is False
+
+
+def test_interrupt_raises_in_the_cell_thread():
+    interrupter = CellInterrupter()
+    started = threading.Event()
+    result = {}
+
+    def cell():
+        interrupter.pre_run_cell()
+        started.set()
+        try:
+            while True:
+                pass
+        except KeyboardInterrupt:
+            result["interrupted"] = time.perf_counter()
+        finally:
+            interrupter.post_run_cell()
+
+    thread = threading.Thread(target=cell, daemon=True)
+    thread.start()
+    started.wait(5)
+    begin = time.perf_counter()
+    assert interrupter.interrupt() is True
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert result["interrupted"] - begin < 0.5
+    assert not interrupter.running
+
+
+def test_interrupt_latency_against_a_local_ipykernel():
+    pytest.importorskip("ipykernel")
+    pytest.importorskip("jupyter_client")
+
+    result = benchmark(runs=3)
+
+    assert result["runs"] == 3
+    assert result["median_ms"] < 1000  # Milliseconds in practice, the bound leaves room for slow hosts
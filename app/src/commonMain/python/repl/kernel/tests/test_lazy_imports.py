@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+HEAVY_MODULES = ("jupyter_server", "jupyter_client", "ipykernel", "tornado", "zmq", "java")
+IMPORT_TIME_LIMIT = 1.0  # Seconds, generous for slow CI hosts; the Jupyter server stack alone takes over 2 s
+
+
+def run_python(code: str) -> str:
+    """ Run code in a fresh interpreter, where nothing is imported yet """
+    env = dict(os.environ, PYTHONPATH=SOURCE_ROOT)
+    env.pop("PYREPL_IMPORT_PROFILE", None)
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def test_importing_the_kernel_package_stays_light():
+    loaded = run_python(
+        "import sys, repl.kernel; "
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    )
+    assert loaded == ""
+
+
+@pytest.mark.parametrize("module", ["repl", "repl.kernel"])
+def test_import_time_is_bounded(module):
+    elapsed = float(run_python(
+        f"import time; begin = time.perf_counter(); import {module}; print(time.perf_counter() - begin)"
+    ))
+    assert elapsed < IMPORT_TIME_LIMIT
+
+
+def test_importing_repl_defers_http_clients():
+    loaded = run_python(
+        "import sys, repl; "
+        f"print(','.join(name for name in {HEAVY_MODULES + ('urllib.request', 'http.client')!r} "
+        "if name in sys.modules))"
+    )
+    assert loaded == ""
+
+
+def test_unknown_names_import_nothing():
+    loaded = run_python(
+        "import sys, repl.kernel; "
+        "assert not hasattr(repl.kernel, 'pytest_plugins'); "
+        "print(','.join(name for name in sys.modules if name.startswith('repl.kernel.') and "
+        "name.rsplit('.', 1)[1] in ('service', 'kernel_android', 'coalesce', 'kernel')))"
+    )
+    assert loaded == ""
+
+
+def test_lazy_names_come_from_their_own_module():
+    pytest.importorskip("jupyter_server")
+    loaded = run_python(
+        "import sys, repl.kernel; "
+        "assert repl.kernel.CoalescingWebsocketConnection.__module__ == 'repl.kernel.coalesce'; "
+        "print(','.join(sorted(name for name in ('repl.kernel.service', 'repl.kernel.kernel_android', 'java') "
+        "if name in sys.modules)))"
+    )
+    assert loaded == ""
+
+
+def test_lazy_names_fall_back_off_android():
+    pytest.importorskip("jupyter_server")
+    module = run_python("import repl.kernel; print(repl.kernel.InAppKernelManager.__module__)")
+    assert module == "repl.kernel.kernel"
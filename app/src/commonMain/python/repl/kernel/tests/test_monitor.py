@@ -0,0 +1,97 @@
+import time
+
+from repl.kernel.monitor import ProcessTable, process_key
+
+
+class FakeSystem:
+    """ Running processes, counting the snapshots taken """
+
+    def __init__(self, **processes):
+        self.processes = processes
+        self.snapshots = 0
+
+    def __call__(self):
+        self.snapshots += 1
+        return dict(self.processes)
+
+
+def test_process_key():
+    assert process_key("io.github.pyrepl:kernel3") == ":kernel3"
+    assert process_key("io.github.pyrepl") == ""
+
+
+def test_is_alive_shares_one_snapshot_per_interval():
+    system = FakeSystem(kernel0=100)
+    table = ProcessTable(system, interval=60)
+
+    assert table.is_alive("kernel0") and not table.is_alive("kernel1")
+    assert table.pid("kernel0") == 100
+    assert system.snapshots == 1
+
+    system.processes = {"kernel1": 101}
+    assert table.is_alive("kernel0")  # Until the table is stale
+    table.refresh()
+    assert not table.is_alive("kernel0") and table.is_alive("kernel1")
+
+
+def test_started_and_exited_resolve_on_refresh():
+    system = FakeSystem(kernel0=100)
+    table = ProcessTable(system, interval=0.01)
+
+    assert table.started("kernel0").result(timeout=0) == 100
+    started = table.started("kernel1")
+    exited = table.exited("kernel0")
+    assert not started.done() and not exited.done()
+
+    system.processes = {"kernel1": 101}
+    assert started.result(timeout=5) == 101
+    assert exited.result(timeout=5) == 0
+
+
+def test_push_resolves_waiters_before_the_refresh():
+    table = ProcessTable(FakeSystem(), interval=60)
+    started = table.started("forked1")
+
+    table.push("forked1", 200)
+    assert started.result(timeout=0) == 200
+
+    exited = table.exited("forked1")
+    table.push("forked1", None)
+    assert exited.result(timeout=0) == 0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_watcher_runs_only_while_there_are_waiters():
+    system = FakeSystem()
+    table = ProcessTable(system, interval=0.01)
+    assert table._watcher is None
+
+    started = table.started("kernel0")
+    watcher = table._watcher
+    assert watcher.is_alive()
+
+    system.processes = {"kernel0": 100}
+    started.result(timeout=5)
+    wait_for(lambda: not watcher.is_alive())
+    assert table._watcher is None
+
+    snapshots = system.snapshots
+    time.sleep(0.05)
+    assert system.snapshots == snapshots  # Nobody waits, nothing polls
+
+
+def test_cancelled_waiter_stops_the_watcher():
+    table = ProcessTable(FakeSystem(), interval=0.01)
+    started = table.started("kernel0")
+    watcher = table._watcher
+
+    started.cancel()
+
+    wait_for(lambda: not watcher.is_alive())
+    assert table._watcher is None
@@ -0,0 +1,90 @@
+import asyncio
+import gc
+import logging
+import types
+
+import pytest
+
+from repl.kernel import phases
+from repl.kernel.phases import LaunchTrace, start_kernel_info_trace
+
+
+class FakeClient:
+    def __init__(self, ready):
+        self.ready = ready
+        self.stopped = False
+
+    def start_channels(self):
+        pass
+
+    async def wait_for_ready(self, timeout=None):
+        await asyncio.sleep(0.01)
+        if isinstance(self.ready, Exception):
+            raise self.ready
+
+    def stop_channels(self):
+        self.stopped = True
+
+
+class FakeManager:
+    def __init__(self, client):
+        self._client = client
+        self.session = types.SimpleNamespace(key=b"key", signature_scheme="hmac-sha256")
+        self.log = logging.getLogger("test_phases")
+
+    def client(self, session):
+        if isinstance(self._client, Exception):
+            raise self._client
+        return self._client
+
+
+@pytest.fixture(autouse=True)
+def jupyter_client_session():
+    pytest.importorskip("jupyter_client")
+
+
+def run_trace(manager):
+    trace = LaunchTrace("kernel-a")
+
+    async def main():
+        task = start_kernel_info_trace(manager, trace)
+        gc.collect()  # Only the trace keeps the task alive
+        assert task in phases._trace_tasks
+        await asyncio.wait([task])
+        return task
+
+    return trace, asyncio.run(main())
+
+
+def test_trace_marks_the_kernel_info_reply():
+    client = FakeClient(ready=True)
+    trace, task = run_trace(FakeManager(client))
+
+    assert "kernel_info_reply" in trace.phases
+    assert client.stopped
+    assert task not in phases._trace_tasks
+
+
+def test_failing_trace_is_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="test_phases"):
+        trace, task = run_trace(FakeManager(RuntimeError("no client")))
+
+    assert "kernel_info_reply" not in trace.phases
+    assert "kernel-a launch trace failed: RuntimeError('no client')" in caplog.text
+    assert task not in phases._trace_tasks
+
+
+def test_failing_subscriber_is_logged(caplog):
+    def subscriber(event):
+        raise ValueError("broken")
+
+    phases.subscribe(subscriber)
+    try:
+        with caplog.at_level(logging.ERROR, logger="repl.kernel.phases"):
+            event = LaunchTrace("kernel-a").mark("intent_sent")
+    finally:
+        phases.unsubscribe(subscriber)
+
+    assert event["phase"] == "intent_sent"
+    assert "kernel-a: launch phase subscriber failed at intent_sent" in caplog.text
+    assert "ValueError: broken" in caplog.text
@@ -0,0 +1,182 @@
+import itertools
+import asyncio
+import time
+
+import pytest
+
+from repl.kernel.pool import KernelLauncher, KernelProcessPool, PooledKernel, SubprocessKernelLauncher
+from repl.kernel.slots import SlotAllocator
+
+
+class FakeLauncher(KernelLauncher):
+    """ Kernel processes that only exist in memory """
+
+    def __init__(self):
+        self.pids = itertools.count(1000)
+        self.alive = set()
+        self.spawned = []
+        self.attached = {}
+        self.stopped = []
+
+    def spawn(self, slot):
+        kernel = PooledKernel(slot, next(self.pids))
+        self.alive.add(kernel.pid)
+        self.spawned.append(kernel)
+        return kernel
+
+    def attach(self, kernel, workdir, filename):
+        self.attached[kernel.pid] = filename
+
+    def is_alive(self, kernel):
+        return kernel.pid in self.alive
+
+    def stop(self, kernel):
+        self.alive.discard(kernel.pid)
+        self.stopped.append(kernel)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def slots():
+    return SlotAllocator(4)
+
+
+def make_pool(slots, size, **kwargs):
+    return KernelProcessPool(FakeLauncher(), size, slots.acquire, slots.release, **kwargs)
+
+
+def test_refill_fills_the_pool(slots):
+    pool = make_pool(slots, 2)
+    pool.refill(wait=True)
+    assert pool.idle == 2
+    assert pool.refills == 2
+    assert slots.in_use == 2
+
+
+def test_claim_hits_an_idle_kernel_and_refills(slots):
+    pool = make_pool(slots, 2)
+    pool.refill(wait=True)
+    warm = list(pool._idle)
+
+    kernel = pool.claim(None, "kernel-a.json")
+
+    assert kernel is warm[0]
+    assert kernel.claimed
+    assert pool.launcher.attached[kernel.pid] == "kernel-a.json"
+    assert (pool.hits, pool.misses) == (1, 0)
+    wait_until(lambda: pool.idle == 2)
+    assert pool.refills == 3
+    assert slots.in_use == 3
+
+
+def test_claim_misses_on_an_empty_pool(slots):
+    pool = make_pool(slots, 0)
+
+    kernel = pool.claim(None, "kernel-a.json")
+
+    assert (pool.hits, pool.misses) == (0, 1)
+    assert pool.launcher.attached[kernel.pid] == "kernel-a.json"
+    assert slots.in_use == 1
+
+
+def test_miss_without_a_free_slot_raises(slots):
+    pool = make_pool(slots, 0)
+    for _ in range(slots.capacity):
+        pool.claim(None, "kernel.json")
+
+    with pytest.raises(RuntimeError):
+        pool.claim(None, "kernel.json")
+    assert pool.misses == slots.capacity + 1
+    assert slots.in_use == slots.capacity
+
+
+def test_dead_idle_kernel_is_evicted_on_claim(slots):
+    pool = make_pool(slots, 2)
+    pool.refill(wait=True)
+    dead, alive = list(pool._idle)
+    pool.launcher.alive.discard(dead.pid)
+    pool.size = 0  # No refill, to look at the slots
+
+    kernel = pool.claim(None, "kernel-a.json")
+
+    assert kernel is alive
+    assert pool.evictions == 1
+    assert dead in pool.launcher.stopped
+    assert slots.in_use == 1
+
+
+def test_expired_idle_kernel_is_evicted_on_claim(slots):
+    pool = make_pool(slots, 2, max_idle_time=60)
+    pool.refill(wait=True)
+    expired, fresh = list(pool._idle)
+    expired.created -= 61
+    pool.size = 0
+
+    kernel = pool.claim(None, "kernel-a.json")
+
+    assert kernel is fresh
+    assert pool.evictions == 1
+    assert expired in pool.launcher.stopped
+    assert slots.in_use == 1
+
+
+def test_refill_replaces_dead_idle_kernels(slots):
+    pool = make_pool(slots, 2)
+    pool.refill(wait=True)
+    dead = pool._idle[0]
+    pool.launcher.alive.discard(dead.pid)
+    pool.size = 3
+
+    pool.refill(wait=True)
+
+    assert pool.evictions == 1
+    assert dead not in pool._idle
+    assert pool.idle == 3
+    assert slots.in_use == 3
+
+
+def test_resize_and_shutdown_give_the_slots_back(slots):
+    pool = make_pool(slots, 3)
+    pool.refill(wait=True)
+
+    pool.resize(1)
+    assert pool.idle == 1
+    assert pool.evictions == 2
+
+    pool.shutdown()
+    assert pool.idle == 0
+    assert slots.in_use == 0
+
+
+def test_subprocess_kernel_is_claimed_and_discarded(slots, tmp_path):
+    pytest.importorskip("ipykernel")
+    from jupyter_client import BlockingKernelClient
+    from jupyter_client.connect import write_connection_file
+
+    filename = str(tmp_path / "kernel-a.json")
+    write_connection_file(filename)
+    pool = KernelProcessPool(SubprocessKernelLauncher(), 1, slots.acquire, slots.release)
+    pool.refill(wait=True)
+    kernel = pool.claim(str(tmp_path), filename)
+    try:
+        assert (pool.hits, pool.misses) == (1, 0)
+        assert asyncio.run(pool.wait_ready(kernel, timeout=10)) == kernel.pid
+
+        client = BlockingKernelClient(connection_file=filename)
+        client.load_connection_file()
+        client.start_channels(hb=False)  # Without a heartbeat yet, a slow start would count as a dead kernel
+        try:
+            client.wait_for_ready(timeout=60)  # The warm process serves the connection file it was handed
+        finally:
+            client.stop_channels()
+    finally:
+        pool.discard(kernel)
+        pool.shutdown()
+    assert kernel.process.poll() is not None
+    assert slots.in_use == 0
@@ -0,0 +1,51 @@
+import os
+import time
+
+import pytest
+
+from repl.kernel.pool import PooledKernel
+from repl.kernel.template import TemplateKernelLauncher, fork_supported
+
+from test_pool import FakeLauncher
+
+pytestmark = pytest.mark.skipif(not fork_supported(), reason="Kernels are not forked on this platform")
+
+
+@pytest.fixture
+def launcher(monkeypatch):
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [tests_dir, os.environ.get("PYTHONPATH")])))
+    launcher = TemplateKernelLauncher(FakeLauncher(), preload=["template_entry"], entry="template_entry.serve")
+    yield launcher
+    launcher.shutdown()
+
+
+def test_launch_does_not_wait_for_the_template(launcher):
+    begin = time.monotonic()
+    launcher.start_template()
+    kernel = launcher.launch(0, None, "kernel-a.json")
+    assert time.monotonic() - begin < 0.5  # The template is still importing its preload modules
+    assert not kernel.ready.done()
+
+    pid = kernel.ready.result(timeout=10)
+    assert kernel.pid == pid != launcher._template.process.pid
+    assert launcher.is_alive(kernel)
+
+
+def test_forked_kernels_are_watched_by_pid(launcher):
+    kernel = launcher.launch(0, None, "kernel-a.json")
+    kernel.ready.result(timeout=10)
+    exited = launcher.exited(kernel)
+    time.sleep(0.6)  # A refresh of the process table, the kernel is not a service it could find
+    assert not exited.done()
+
+    launcher.stop(kernel)
+    assert exited.result(timeout=5) == 0
+    assert not launcher.is_alive(kernel)
+
+
+def test_pre_warmed_kernels_come_from_the_fallback(launcher):
+    kernel = launcher.spawn(3)
+    assert isinstance(kernel, PooledKernel)
+    assert launcher.fallback.spawned == [kernel]
+    assert launcher._template is None
@@ -0,0 +1,112 @@
+""" ZMQ transports of the in-app kernels
+
+Both ends of a kernel connection live on the device, so the five channels can use Unix-domain sockets ("ipc")
+instead of TCP loopback. An ipc connection has a path prefix in place of the ip; the channel sockets are
+"<prefix>-<port>" files, which are removed when the kernel is cleaned up.
+"""
+from __future__ import annotations
+
+import tempfile
+import time
+import json
+import glob
+import sys
+import os
+
+
+__all__ = ["TRANSPORTS", "MAX_SOCKET_PATH", "ipc_supported", "ipc_prefix", "remove_ipc_files"]
+
+TRANSPORTS = ("tcp", "ipc")
+MAX_SOCKET_PATH = 107  # sun_path is 108 bytes on Linux, including the terminating NUL
+
+
+def ipc_supported() -> bool:
+    """ Whether libzmq was built with ipc support """
+    import zmq
+    return zmq.has("ipc")
+
+
+def ipc_prefix(directory: str, kernel_id: str) -> str | None:
+    """ Socket path prefix of a kernel
+    :return: None if the socket paths would not fit into sun_path
+    """
+    prefix = os.path.join(directory, f"k{kernel_id.replace('-', '')[:8]}")
+    if len(os.fsencode(prefix)) + len("-65535") > MAX_SOCKET_PATH:
+        return None
+    return prefix
+
+
+def remove_ipc_files(prefix: str) -> list[str]:
+    """ Remove the channel sockets of a kernel, including the ones left by a crashed kernel
+    :return: The removed paths
+    """
+    removed = []
+    for path in glob.glob(glob.escape(prefix) + "-*"):
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def benchmark(runs: int = 200, payload_size: int = 1024 * 1024, payloads: int = 20, timeout: float = 30) -> dict:
+    """ Compare tcp and ipc against a local ipykernel
+    Measures execute_request -> execute_reply round trips of an empty cell and the throughput of large iopub streams.
+    """
+    from jupyter_client import KernelManager
+
+    def percentile(values: list[float], p: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    results = {}
+    for transport in TRANSPORTS:
+        if transport == "ipc" and not ipc_supported():
+            continue
+        directory = tempfile.mkdtemp()
+        manager = KernelManager(transport=transport)
+        if transport == "ipc":
+            manager.ip = ipc_prefix(directory, "benchmark")
+        manager.start_kernel()
+        client = manager.client()
+        client.start_channels()
+        try:
+            client.wait_for_ready(timeout=timeout)
+            latencies = []
+            for _ in range(runs):
+                begin = time.perf_counter()
+                client.execute_interactive("", store_history=False, timeout=timeout, output_hook=lambda msg: None)
+                latencies.append(time.perf_counter() - begin)
+            latencies.sort()
+
+            received = 0
+
+            def count(msg):
+                nonlocal received
+                if msg["msg_type"] == "stream":
+                    received += len(msg["content"]["text"])
+
+            code = (
+                f"import sys\nfor _ in range({payloads}):\n"
+                f"    sys.stdout.write('x' * {payload_size}); sys.stdout.flush()"
+            )
+            begin = time.perf_counter()
+            client.execute_interactive(code, store_history=False, timeout=timeout, output_hook=count)
+            elapsed = time.perf_counter() - begin
+
+            results[transport] = {
+                "execute_p50_ms": percentile(latencies, 0.5),
+                "execute_p99_ms": percentile(latencies, 0.99),
+                "iopub_mib_per_s": received / elapsed / 2 ** 20
+            }
+        finally:
+            client.stop_channels()
+            manager.shutdown_kernel(now=True)
+            if transport == "ipc":
+                remove_ipc_files(manager.ip)
+            os.rmdir(directory)
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200), indent=2))
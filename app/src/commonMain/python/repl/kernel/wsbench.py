@@ -0,0 +1,238 @@
+""" Throughput benchmark of the kernel websocket for remote lab clients
+
+Records the frames a kernel websocket carries for a typical workload (streamed prints, rich displays, comm traffic)
+and replays them through a local websocket server to a local client, across a byte-counting TCP relay that may
+throttle to the bandwidth of a remote link:
+
+    python wsbench.py --record trace.jsonl
+    python wsbench.py --trace trace.jsonl [--runs N] [--bandwidth MBIT]
+
+Compares the wire bytes and the throughput of plain frames, permessage-deflate and TCP_CORK batching.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import base64
+import time
+import json
+
+from tornado.web import Application
+from tornado.websocket import WebSocketHandler, websocket_connect
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+try:
+    from .coalesce import FrameBatcher
+except ImportError:  # Running as a script, without the Android bridge of the repl package
+    from coalesce import FrameBatcher
+
+
+WORKLOAD = [
+    "for i in range(2000): print(f'step {i}: loss={1 / (i + 1):.6f}', flush=True)",
+    "from IPython.display import HTML, display\n"
+    "rows = ''.join(f'<tr><td>{i}</td><td>{i * i}</td><td>{i ** 0.5:.4f}</td></tr>' for i in range(500))\n"
+    "display(HTML(f'<table>{rows}</table>'))",
+    "from IPython.display import JSON, SVG, display\n"
+    "for n in range(20): display(JSON({'series': [{'x': x, 'y': (x * n) % 97} for x in range(200)]}))\n"
+    "points = ' '.join(f'{x},{(x * x) % 300}' for x in range(400))\n"
+    "display(SVG(f'<svg xmlns=\"http://www.w3.org/2000/svg\"><polyline points=\"{points}\"/></svg>'))",
+    "import sys\nfor i in range(500): sys.stderr.write(f'warning {i}\\n')",
+    "from ipykernel.comm import Comm\n"
+    "comm = Comm(target_name='bench')\n"
+    "for i in range(300): comm.send({'value': i, 'label': f'slider-{i}'})\n"
+    "comm.close()",
+]
+
+
+def record_trace(path: str, workload: List[str] = WORKLOAD, timeout: float = 60.0) -> int:
+    """ Run the workload on a kernel and save the v1 websocket frames it sends to the browser
+    :return: The number of frames recorded
+    """
+    from jupyter_client.manager import start_new_kernel
+    from jupyter_server.services.kernels.connection.base import serialize_msg_to_ws_v1
+
+    manager, client = start_new_kernel(kernel_name="python3")
+    frames = []
+    begin = time.monotonic()
+    try:
+        for code in workload:
+            msg_id = client.execute(code)
+            while True:
+                msg = client.get_iopub_msg(timeout=timeout)
+                frames.append((time.monotonic() - begin, serialize_msg_to_ws_v1(msg, "iopub", client.session.pack)))
+                if msg["parent_header"].get("msg_id") == msg_id and msg["msg_type"] == "status" \
+                        and msg["content"]["execution_state"] == "idle":
+                    break
+            reply = client.get_shell_msg(timeout=timeout)
+            frames.append((time.monotonic() - begin, serialize_msg_to_ws_v1(reply, "shell", client.session.pack)))
+    finally:
+        client.stop_channels()
+        manager.shutdown_kernel(now=True)
+
+    with open(path, "w") as f:
+        for stamp, frame in frames:
+            f.write(json.dumps({"t": round(stamp, 6), "frame": base64.b64encode(frame).decode()}) + "\n")
+    return len(frames)
+
+
+def load_trace(path: str) -> List[bytes]:
+    with open(path) as f:
+        return [base64.b64decode(json.loads(line)["frame"]) for line in f if line.strip()]
+
+
+class _ReplayHandler(WebSocketHandler):
+    """ Sends the trace as fast as the kernel websocket connection would forward it """
+
+    def get_compression_options(self):
+        return self.settings.get("websocket_compression_options")
+
+    def open(self):
+        batcher = self.settings["batcher"]
+        for frame in self.settings["frames"]:
+            if batcher is not None:
+                batcher.hold(self.ws_connection.stream)
+            self.write_message(frame, binary=True)  # Not awaited, as in ZMQChannelsWebsocketConnection
+
+    def on_message(self, message):
+        pass
+
+
+class _CountingRelay:
+    """ TCP relay that counts the bytes from the server to the client, optionally throttled """
+
+    def __init__(self, target_port: int, bandwidth: float = 0.0):
+        """ :param bandwidth: Megabits per second, 0 for no limit """
+        self.target_port = target_port
+        self.rate = bandwidth * 1e6 / 8
+        self.downstream = 0
+        self.reads = 0
+        self._writers = []
+
+    async def _pipe(self, reader, writer, count: bool):
+        try:
+            while data := await reader.read(65536):
+                if count:
+                    self.downstream += len(data)
+                    self.reads += 1
+                    if self.rate:
+                        await asyncio.sleep(len(data) / self.rate)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        self._writers += [client_writer, server_writer]
+        try:
+            await asyncio.gather(
+                self._pipe(client_reader, server_writer, False), self._pipe(server_reader, client_writer, True)
+            )
+        except asyncio.CancelledError:  # Still open when the benchmark ends
+            pass
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for writer in self._writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def replay(frames: List[bytes], compression_level: int | None, batch_window: float, bandwidth: float):
+    """ Replay the frames once
+    :param compression_level: zlib level of permessage-deflate, None for plain frames
+    """
+    settings: Dict[str, Any] = {
+        "frames": frames, "batcher": FrameBatcher(batch_window) if batch_window > 0 else None,
+        "websocket_compression_options": None if compression_level is None else {
+            "compression_level": compression_level, "mem_level": 8
+        }
+    }
+    sockets = bind_sockets(0, "127.0.0.1")
+    server = HTTPServer(Application([(r"/ws", _ReplayHandler)], **settings))
+    server.add_sockets(sockets)
+    relay = _CountingRelay(sockets[0].getsockname()[1], bandwidth)
+    port = await relay.start()
+
+    begin = time.perf_counter()
+    connection = await websocket_connect(
+        f"ws://127.0.0.1:{port}/ws", compression_options=None if compression_level is None else {}
+    )
+    payload = 0
+    for _ in frames:
+        message = await connection.read_message()
+        payload += len(message)
+    elapsed = time.perf_counter() - begin
+    connection.close()
+    server.stop()
+    await relay.close()
+    return {
+        "seconds": elapsed,
+        "wire_bytes": relay.downstream,
+        "payload_bytes": payload,
+        "relay_reads": relay.reads,
+        "messages_per_s": len(frames) / elapsed,
+        "payload_mb_per_s": payload / elapsed / 1e6
+    }
+
+
+MODES = {
+    "plain": (None, 0.0),
+    "deflate-1": (1, 0.0),
+    "deflate-6": (6, 0.0),
+    "batched": (None, 0.005),
+    "deflate-6+batched": (6, 0.005),
+}
+
+
+async def benchmark(frames: List[bytes], runs: int = 3, bandwidth: float = 0.0) -> Dict[str, Dict[str, float]]:
+    """ Best run of every mode """
+    results = {}
+    for mode, (level, window) in MODES.items():
+        best = None
+        for _ in range(runs):
+            result = await replay(frames, level, window, bandwidth)
+            if best is None or result["seconds"] < best["seconds"]:
+                best = result
+        results[mode] = best
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", metavar="FILE", help="Record a trace of the workload to FILE and exit")
+    parser.add_argument("--trace", metavar="FILE", help="Trace to replay, recorded to a temporary file if omitted")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="Megabits per second of the link, 0 for none")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"Recorded {record_trace(args.record)} frames to {args.record}")
+        return
+    path = args.trace
+    if path is None:
+        import tempfile
+        path = tempfile.mkstemp(suffix=".jsonl")[1]
+        record_trace(path)
+    frames = load_trace(path)
+    print(f"{len(frames)} frames, {sum(map(len, frames))} bytes")
+    results = asyncio.run(benchmark(frames, args.runs, args.bandwidth))
+    plain = results["plain"]["wire_bytes"]
+    for mode, result in results.items():
+        print(
+            f"{mode:>18}: {result['wire_bytes']:>9} wire bytes ({result['wire_bytes'] / plain:6.1%}), "
+            f"{result['messages_per_s']:>9.0f} msg/s, {result['payload_mb_per_s']:7.1f} MB/s, "
+            f"{result['relay_reads']:>5} reads, {result['seconds'] * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
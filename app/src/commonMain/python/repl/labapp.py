@@ -0,0 +1,54 @@
+import ast
+
+from jupyterlab.labapp import LabApp
+from traitlets import Bool, Float, Integer, Unicode
+
+from .telemetry import KernelSampler, telemetry_handlers, lab_and_kernel_pids
+from .kernel.phases import register_launch_events
+from .readiness import publish_ready, clear_ready
+from .assets import PrecompressedAssets, PrecompressedFileHandler
+
+
+class REPLLabApp(LabApp):
+    """ JupyterLab with the PyREPL server extensions (telemetry, launch events, readiness, precompressed assets) """
+    telemetry_interval = Float(2.0, config=True, help="Seconds between two kernel telemetry samples")
+    telemetry_history = Integer(300, config=True, help="Number of telemetry samples kept per kernel")
+    ready_file = Unicode("", config=True, help="File published once the server listens, empty to disable")
+    precompress_assets = Bool(True, config=True, help="Serve the static files from precompressed gzip/brotli variants")
+    assets_cache_dir = Unicode("", config=True, help="Directory of the precompressed variants and their manifest")
+
+    def initialize_settings(self):
+        super().initialize_settings()
+        options = self.serverapp.websocket_compression_options
+        if isinstance(options, str):  # An Any trait keeps a command line value as the text of the dict
+            self.serverapp.websocket_compression_options = ast.literal_eval(options)
+            self.settings["websocket_compression_options"] = self.serverapp.websocket_compression_options
+
+    def initialize_handlers(self):
+        super().initialize_handlers()
+        self.sampler = KernelSampler(lab_and_kernel_pids, self.telemetry_interval, self.telemetry_history)
+        self.sampler.start()
+        self.handlers.extend(telemetry_handlers(self.sampler))
+        register_launch_events(self.serverapp.event_logger)
+        if self.precompress_assets and self.static_dir and self.assets_cache_dir:
+            self.assets = PrecompressedAssets(self.static_dir, self.assets_cache_dir)
+            self.assets.ensure()  # Plain files are served until the variants are built
+            self.handlers.insert(0, (  # Matched before the default static handler of the extension
+                rf"/static/{self.name}/(.*)", PrecompressedFileHandler,
+                {"path": self.static_paths, "assets": self.assets}
+            ))
+
+    async def _start_jupyter_server_extension(self, serverapp):
+        await super()._start_jupyter_server_extension(serverapp)
+        if hasattr(serverapp.contents_manager, "compact_all"):  # Notebook journals left by an earlier run
+            await serverapp.contents_manager.compact_all()
+        if self.ready_file:  # Called once the HTTP socket is bound and the event loop runs
+            publish_ready(self.ready_file, url=serverapp.connection_url, port=serverapp.port)
+            self.log.info(f"Lab server ready, published {self.ready_file}")
+
+    async def stop_extension(self):
+        if self.ready_file:
+            clear_ready(self.ready_file)
+        if hasattr(self.serverapp.contents_manager, "compact_all"):
+            await self.serverapp.contents_manager.compact_all()
+        await super().stop_extension()
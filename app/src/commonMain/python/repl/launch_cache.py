@@ -0,0 +1,127 @@
+""" Persisted launch configuration of the lab server
+
+The argv built by REPLConfig needs the lab password hashed with argon2. The whole resolved argv, with the hashed
+password and the paths in it, is stored under an HMAC-SHA256 of the config fields and the password. The HMAC key is a
+secret generated once per install, so a restart with an unchanged configuration costs one HMAC instead of argon2, and
+the stored digest tells nothing about the password without the secret. The file also holds the token of the lab
+server, generated once, so that the lab URL stays the same across restarts. It lives in the app-private home and is
+written with 0600 permissions.
+
+    python launch_cache.py  # Cold vs cached launch preparation time
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, List
+import secrets
+import hashlib
+import hmac
+import json
+import time
+import os
+
+
+__all__ = ["LaunchConfigCache"]
+
+CACHE_VERSION = 3
+PASSWORD_PLACEHOLDER = "{hashed_password}"
+
+
+class LaunchConfigCache:
+    """ Single-entry cache of the resolved lab server argv, and the lab token """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entry: Dict | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict:
+        if self._entry is None:
+            try:
+                with open(self.path) as f:
+                    entry = json.load(f)
+                if entry.get("version") != CACHE_VERSION or not entry.get("secret"):
+                    raise ValueError("Outdated launch cache")
+            except (OSError, ValueError):
+                entry = {"version": CACHE_VERSION, "secret": secrets.token_hex(32)}
+            self._entry = entry
+        return self._entry
+
+    def token(self) -> str:
+        """ The token of the lab server, generated on first use """
+        entry = self._load()
+        if not entry.get("token"):
+            entry["token"] = secrets.token_hex(24)
+            self._save(entry)
+        return entry["token"]
+
+    def key(self, fields: Dict, password: str) -> str:
+        """ HMAC of the config fields and the password, keyed with the secret of this install """
+        message = json.dumps([fields, password], sort_keys=True, default=str).encode()
+        return hmac.new(bytes.fromhex(self._load()["secret"]), message, hashlib.sha256).hexdigest()
+
+    def get(
+            self,
+            fields: Dict,
+            password: str,
+            template: Callable[[], List[str]],
+            hash_password: Callable[[str], str]
+    ) -> List[str]:
+        """ The resolved argv of a configuration, built and stored if the configuration changed
+        :param fields: Everything the argv depends on apart from the password, JSON serializable
+        :param template: Builds the argv with PASSWORD_PLACEHOLDER where the hashed password goes
+        :param hash_password: Hashes the password, only called if the configuration changed
+        """
+        entry = self._load()
+        key = self.key(fields, password)
+        if entry.get("argv") and hmac.compare_digest(entry.get("key", ""), key):
+            self.hits += 1
+            return list(entry["argv"])
+        self.misses += 1
+        hashed_password = hash_password(password)
+        argv = [arg.replace(PASSWORD_PLACEHOLDER, hashed_password) for arg in template()]
+        entry.update(key=key, argv=argv, time=time.time())
+        self._save(entry)
+        return list(argv)
+
+    def _save(self, entry: Dict):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not persist the launch configuration: {e}")  # Still cached in memory
+
+    def clear(self):
+        self._entry = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def benchmark(runs: int = 5) -> Dict[str, float]:
+    """ Milliseconds to prepare the launch argv without the cache (cold), from the persisted cache, and saved """
+    import tempfile
+    from repl import REPLConfig
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "launch.json")
+        cold, cached = [], []
+        for _ in range(runs):
+            LaunchConfigCache(path).clear()
+            begin = time.perf_counter()
+            argv = REPLConfig(ip="127.0.0.1", launch_cache=path).list
+            cold.append(time.perf_counter() - begin)
+
+            begin = time.perf_counter()
+            config = REPLConfig(ip="127.0.0.1", launch_cache=path)  # As after a restart
+            assert config.list == argv and config._launch_cache.hits == 1, "Launch cache missed"
+            cached.append(time.perf_counter() - begin)
+    return {"cold_ms": min(cold) * 1000, "cached_ms": min(cached) * 1000, "saved_ms": (min(cold) - min(cached)) * 1000}
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Import repl as a package
+    print(benchmark())
@@ -0,0 +1,154 @@
+""" Startup profile mode: per-module import cost
+
+Set PYREPL_IMPORT_PROFILE=1 to profile every import made after the repl package starts loading, and print the
+report with repl.profiling.report() (it is also printed at exit). On a host, the import cost of modules can be
+checked against a budget:
+
+    python profiling.py --budget 0.5 repl repl.kernel
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import importlib.abc
+import importlib
+import argparse
+import atexit
+import time
+import sys
+import os
+
+
+__all__ = ["ImportProfiler", "enable", "report"]
+
+ENV_FLAG = "PYREPL_IMPORT_PROFILE"
+
+
+class _TimedLoader:
+    """ Wraps the loader of a module to time its execution """
+
+    def __init__(self, loader: Any, profiler: "ImportProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._name)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """ Records the self and cumulative time of every module executed while it is installed
+    Like python -X importtime, but usable in-process (e.g. in the app, where there is no interpreter binary).
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._stack: List[list] = []  # [name, start, children time]
+        self._finding = False
+        self.records: Dict[str, tuple[float, float, int]] = {}  # name -> (self, cumulative, depth)
+
+    def find_spec(self, fullname, path, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self, fullname)
+        return spec
+
+    def _enter(self, name: str):
+        self._stack.append([name, self._clock(), 0.0])
+
+    def _exit(self, name: str):
+        _, start, children = self._stack.pop()
+        cumulative = self._clock() - start
+        self.records[name] = (cumulative - children, cumulative, len(self._stack))
+        if self._stack:
+            self._stack[-1][2] += cumulative
+
+    def start(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def total(self, name: str | None = None) -> float:
+        """ Cumulative seconds of a module, or of all top-level imports """
+        if name is not None:
+            return self.records[name][1] if name in self.records else 0.0
+        return sum(cumulative for _, cumulative, depth in self.records.values() if depth == 0)
+
+    def report(self, limit: int = 30) -> str:
+        """ The most expensive modules by self time """
+        rows = sorted(self.records.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        lines = [f"{'self [ms]':>10} {'cumulative [ms]':>16}  module"]
+        for name, (self_time, cumulative, depth) in rows:
+            lines.append(f"{self_time * 1000:10.1f} {cumulative * 1000:16.1f}  {'  ' * depth}{name}")
+        lines.append(f"{len(self.records)} modules, {self.total() * 1000:.1f} ms in total")
+        return "\n".join(lines)
+
+
+_profiler: ImportProfiler | None = None
+
+
+def enable() -> ImportProfiler:
+    """ Profile the imports from now on (once per process) """
+    global _profiler
+    if _profiler is None:
+        _profiler = ImportProfiler()
+        _profiler.start()
+        atexit.register(lambda: print(report(), file=sys.stderr))
+    return _profiler
+
+
+def report(limit: int = 30) -> str:
+    if _profiler is None:
+        return f"Import profiling is off, set {ENV_FLAG}=1"
+    return _profiler.report(limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="+")
+    parser.add_argument("--budget", type=float, help="Fail if importing the modules takes longer (seconds)")
+    parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args()
+
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Import repl as a package
+    with ImportProfiler() as profiler:
+        begin = time.perf_counter()
+        for module_name in args.modules:
+            importlib.import_module(module_name)
+        elapsed = time.perf_counter() - begin
+    print(profiler.report(args.limit))
+    if args.budget is not None and elapsed > args.budget:
+        print(f"Importing {', '.join(args.modules)} took {elapsed:.3f}s, over the budget of {args.budget:.3f}s")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+""" Readiness signal of the lab server
+
+The lab server publishes a ready file once its HTTP socket is listening and its event loop runs, and removes it when
+it stops. Launchers wait for that file (and a connectable port) instead of sleeping for a fixed time.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+import socket
+import json
+import time
+import os
+
+
+__all__ = ["publish_ready", "clear_ready", "read_ready", "accepts_connections", "wait_for_ready", "probe_health"]
+
+
+def publish_ready(path: str, **info: Any) -> Dict[str, Any]:
+    """ Write the ready file atomically
+    :param info: Server details stored in the file (url, port, ...)
+    :return: The published content
+    """
+    content = {"pid": os.getpid(), "time": time.time(), **info}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(content, f)
+    os.replace(temp_path, path)  # Readers never see a partial file
+    return content
+
+
+def clear_ready(path: str):
+    """ Remove the ready file if this process published it """
+    info = read_ready(path, check_pid=False)
+    if info is not None and info.get("pid") == os.getpid():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Alive, owned by someone else
+        return True
+    return True
+
+
+def read_ready(path: str, check_pid: bool = True) -> Dict[str, Any] | None:
+    """ Content of the ready file
+    :param check_pid: Treat the file as stale if the process that published it is gone
+    :return: None if the server has not published readiness
+    """
+    try:
+        with open(path) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if check_pid and not _pid_alive(info.get("pid", 0)):
+        return None
+    return info
+
+
+def accepts_connections(host: str, port: int, timeout: float = 0.5) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def wait_for_ready(
+        path: str, host: str, port: int, timeout: float = 30.0, interval: float = 0.02, max_interval: float = 0.25
+) -> Dict[str, Any] | None:
+    """ Block until the server published readiness and accepts connections
+    The ready file is checked with a backoff from interval to max_interval, which costs a stat() per check.
+    :return: The content of the ready file, None on timeout
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        info = read_ready(path)
+        if info is not None and accepts_connections(host, port, min(0.5, max(deadline - time.monotonic(), 0.01))):
+            return info
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+def probe_health(url: str, timeout: float = 2.0) -> Dict[str, Any] | None:
+    """ GET the unauthenticated version endpoint (/api) of the server
+    :return: The response with the measured latency, None if the server does not answer
+    """
+    import urllib.request  # Pulls in http.client and email, only needed once the server is probed
+
+    begin = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/api", timeout=timeout) as response:
+            body = json.load(response)
+    except (OSError, ValueError):
+        return None
+    return {**body, "latency": time.perf_counter() - begin}
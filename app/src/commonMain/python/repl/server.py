@@ -1,23 +1,35 @@
-from jupyterlab.labapp import LabApp
 from .config import REPLConfig
 
-from android.content import Intent
-from repl import InAppLabServerService
-
 
 def run_lab_server(
         ip: str | None = None, port: int | None = None, password: str | None = None, manager: str | None = None,
-        config: REPLConfig | None = None
+        kernel_pool_size: int | None = None, cull_idle_timeout: float | None = None, cull_rss_budget: int | None = None,
+        cull_snapshot: bool | None = None, transport: str | None = None, coalesce_window: float | None = None,
+        cell_output_limit: int | None = None, notebook_journal: bool | None = None,
+        websocket_compression: bool | None = None, batch_window: float | None = None, config: REPLConfig | None = None
 ):
     if config is None:
-        kwargs = { k: v for k, v in dict(ip=ip, port=port, password=password).items() if v is not None }
+        kwargs = {
+            k: v for k, v in dict(
+                ip=ip, port=port, password=password, kernel_pool_size=kernel_pool_size,
+                cull_idle_timeout=cull_idle_timeout, cull_rss_budget=cull_rss_budget, cull_snapshot=cull_snapshot,
+                transport=transport, coalesce_window=coalesce_window, cell_output_limit=cell_output_limit,
+                notebook_journal=notebook_journal, websocket_compression=websocket_compression,
+                batch_window=batch_window
+            ).items() if v is not None
+        }
         config = REPLConfig(**kwargs)
         if manager is not None:
             config.manager = manager
-    LabApp.launch_instance(config.list)
+    from .labapp import REPLLabApp  # The whole Jupyter server stack, only needed in the lab server process
+
+    REPLLabApp.launch_instance(config.list)
 
 
 def send_server_launch_intent(context, config: REPLConfig):
+    from android.content import Intent
+    from repl import InAppLabServerService
+
     intent = Intent(context, InAppLabServerService.getClass())
     for key, value in config.dict.items():
         intent.putExtra(key, value)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from typing import Callable, Dict
+from collections import deque
+import threading
+import codecs
+import time
+import os
+
+import psutil
+from tornado import web
+from jupyter_server.base.handlers import APIHandler
+
+from .kernel.phases import recent_launches
+from .kernel.capture import CaptureReader, capture_dir
+
+
+class KernelSampler:
+    """ Samples RSS, CPU%, thread count and open FDs of the kernel processes into fixed-size rings """
+    fields = ("time", "pid", "rss", "cpu_percent", "threads", "fds")
+
+    def __init__(self, targets: Callable[[], Dict[str, int]], interval: float = 2.0, history: int = 300):
+        """
+        :param targets: Returns the processes to sample as {name: pid}
+        :param interval: Seconds between two samples
+        :param history: Number of samples kept per process
+        """
+        self._targets = targets
+        self.interval = interval
+        self.history = history
+        self._rings: Dict[str, deque] = {}
+        self._processes: Dict[int, psutil.Process] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _process(self, pid: int) -> psutil.Process:
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+            process.cpu_percent()  # The first call only sets the reference point
+        return process
+
+    def sample(self):
+        """ Take one sample of every target """
+        now = time.time()
+        targets = self._targets()
+        samples = {}
+        for name, pid in targets.items():
+            try:
+                process = self._process(pid)
+                with process.oneshot():
+                    samples[name] = (
+                        now, pid, process.memory_info().rss, process.cpu_percent(),
+                        process.num_threads(), process.num_fds() if hasattr(process, "num_fds") else None
+                    )
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._processes.pop(pid, None)
+
+        live = set(targets.values())
+        for pid in [pid for pid in self._processes if pid not in live]:
+            del self._processes[pid]
+        with self._lock:
+            for name in [name for name in self._rings if name not in targets]:
+                del self._rings[name]  # The kernel is gone, so is its history
+            for name, values in samples.items():
+                self._rings.setdefault(name, deque(maxlen=self.history)).append(values)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Kernel telemetry sampling failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="KernelSampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def snapshot(self, history: bool = False) -> Dict[str, list | dict]:
+        """ Latest sample (or the whole ring) per process """
+        with self._lock:
+            rings = {name: list(ring) if history else [ring[-1]] for name, ring in self._rings.items() if ring}
+        return {
+            name: [dict(zip(self.fields, values)) for values in ring] if history else dict(zip(self.fields, ring[0]))
+            for name, ring in rings.items()
+        }
+
+    def prometheus(self) -> str:
+        """ Latest samples in the Prometheus text exposition format """
+        metrics = (
+            ("rss", "repl_kernel_rss_bytes", "Resident set size of the kernel process"),
+            ("cpu_percent", "repl_kernel_cpu_percent", "CPU usage of the kernel process since the previous sample"),
+            ("threads", "repl_kernel_threads", "Number of threads of the kernel process"),
+            ("fds", "repl_kernel_open_fds", "Number of open file descriptors of the kernel process"),
+        )
+        latest = self.snapshot()
+        lines = []
+        for field, metric, description in metrics:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, sample in latest.items():
+                if sample[field] is not None:
+                    lines.append(f'{metric}{{kernel="{name}",pid="{sample["pid"]}"}} {sample[field]}')
+        return "\n".join(lines) + "\n"
+
+
+class KernelTelemetryHandler(APIHandler):
+    """ GET /repl/api/telemetry[?history=1] -> JSON samples per kernel """
+
+    def initialize(self, sampler: KernelSampler):
+        self.sampler = sampler
+
+    @web.authenticated
+    def get(self):
+        history = self.get_argument("history", "0") not in ("0", "false", "")
+        self.finish(self.sampler.snapshot(history))
+
+
+class KernelMetricsHandler(APIHandler):
+    """ GET /repl/api/telemetry/metrics -> Prometheus text """
+
+    def initialize(self, sampler: KernelSampler):
+        self.sampler = sampler
+
+    @web.authenticated
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(self.sampler.prometheus())
+
+
+class KernelLaunchesHandler(APIHandler):
+    """ GET /repl/api/telemetry/launches -> JSON phase events of the latest kernel launches """
+
+    @web.authenticated
+    def get(self):
+        self.finish({"launches": recent_launches()})
+
+
+class KernelIOPubHandler(APIHandler):
+    """ GET /repl/api/telemetry/iopub -> JSON stream coalescing counts per kernel """
+
+    @web.authenticated
+    def get(self):
+        self.finish({
+            kernel_id: getattr(self.kernel_manager.get_kernel(kernel_id), "iopub_stats", None)
+            for kernel_id in self.kernel_manager.list_kernel_ids()
+        })
+
+
+class KernelLogHandler(APIHandler):
+    """ GET /repl/api/telemetry/logs/kernelN/(stdout|stderr)[?offset=0] -> JSON captured output of a kernel slot
+    A live view polls with the returned offset, the output rotated away in between is skipped.
+    """
+    max_size = 65536
+
+    @web.authenticated
+    def get(self, slot: str, name: str):
+        try:
+            offset = int(self.get_argument("offset", "0"))
+        except ValueError:
+            raise web.HTTPError(400, "offset must be an integer")
+        reader = CaptureReader(capture_dir(slot), name)
+        data, offset = reader.read(offset, self.max_size)
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        text = decoder.decode(data)
+        offset -= len(decoder.getstate()[0])  # A character cut at the end is read again by the next poll
+        self.finish({"text": text, "offset": offset, "start": reader.start})
+
+
+def telemetry_handlers(sampler: KernelSampler) -> list[tuple]:
+    return [
+        (r"/repl/api/telemetry", KernelTelemetryHandler, {"sampler": sampler}),
+        (r"/repl/api/telemetry/metrics", KernelMetricsHandler, {"sampler": sampler}),
+        (r"/repl/api/telemetry/launches", KernelLaunchesHandler),
+        (r"/repl/api/telemetry/iopub", KernelIOPubHandler),
+        (r"/repl/api/telemetry/logs/kernel(\d+)/(stdout|stderr)", KernelLogHandler),
+    ]
+
+
+def lab_and_kernel_pids() -> Dict[str, int]:
+    """ Default sampling targets: the lab server itself and the running in-app kernels """
+    from .kernel import InAppLocalPrivateProvisioner
+    return {"lab": os.getpid(), **InAppLocalPrivateProvisioner.Process.running()}